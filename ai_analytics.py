@@ -2,8 +2,9 @@
 # ai_analytics.py
 # End-to-end analytics + AI for Water Station platform.
 # - Reads Firestore sales + stations
-# - Cleans & aggregates
+# - Cleans & aggregates (dense, zero-filled station × day matrices for time-series stages)
 # - KMeans market segmentation -> new station location recs (per waterType + district, inside polygon)
+# - Station catchments (nearest-station demand, delivery distance, overlap)
 # - Optional: Prophet forecasting (auto-skip if not installed)
 # - Optional: XGBoost churn (auto-skip if not installed)
 # Outputs CSVs to ./out and (optionally) writes recs to Firestore.
@@ -15,6 +16,11 @@ import sys
 import math
 import json
 import random
+import time
+import hashlib
+import heapq
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass
 from typing import Dict, List, Any, Optional, Tuple
 from collections import defaultdict
@@ -23,11 +29,12 @@ from datetime import datetime, timezone, timedelta
 import numpy as np
 import pandas as pd
 from sklearn.cluster import KMeans
-from sklearn.neighbors import KDTree
+from sklearn.neighbors import KDTree, BallTree
+from scipy.signal import fftconvolve
 
 # Geo libraries
 import geopandas as gpd
-from shapely.geometry import Point
+import shapely
 
 # Optional deps
 try:
@@ -42,9 +49,20 @@ try:
 except Exception:
     _HAS_XGB = False
 
+try:
+    import pyarrow  # noqa: F401  (pip install pyarrow) — Parquet output
+    _HAS_PARQUET = True
+except Exception:
+    _HAS_PARQUET = False
+
 import pytz
 import logging
 
+import warehouse
+import stage_cache
+import station_matrix
+import fake_firestore
+
 # ----------------------------
 # CONFIG
 # ----------------------------
@@ -52,6 +70,25 @@ ASIA_MANILA = pytz.timezone("Asia/Manila")
 OUT_DIR = os.path.join(os.getcwd(), "out")
 os.makedirs(OUT_DIR, exist_ok=True)
 
+# Output tables: "parquet" = partitioned + incremental, "csv" = full rewrite per run
+OUTPUT_FORMAT = "parquet"
+# Dated tables are partitioned by month of this column; None = snapshot partitioned by run date
+OUTPUT_PARTITION_COL = {
+    "timeseries_daily_per_station": "date",
+    "forecast_totalSales_per_station": "date",
+    "rfm_by_customer": None,
+    "recommendations_new_stations": None,
+    "station_catchments": None,
+    "churn_scores": None,
+}
+
+# Churn model persistence / retraining knobs
+CHURN_FEATURES = ["recency_days", "frequency", "avgSpend"]
+CHURN_MODEL_DIR = os.path.join(OUT_DIR, "models", "churn")
+CHURN_DRIFT_PSI = 0.2           # retrain when any feature's PSI vs training data exceeds this
+CHURN_MAX_MODEL_AGE_DAYS = 30   # ...or when the saved model is older than this
+CHURN_SCORE_CHUNK = 50000
+
 ORDERS_COLLECTION = "orders"
 STATIONS_COLLECTION = "station_owners"
 
@@ -64,6 +101,15 @@ MIN_CLUSTER_SALES = 800.0
 RECOMMEND_TOP_K = 5
 MIN_DISTANCE_TO_EXISTING_M = 400
 KMEANS_K_PER_WATERTYPE = 6
+KMEANS_WORKERS = min(4, os.cpu_count() or 1)  # process pool size for per-group KMeans; <=1 runs serially
+
+# Coverage site selection knobs ("coverage" recommender)
+RECOMMENDER = "kmeans"             # "kmeans" = cluster centroids, "coverage" = greedy max-coverage sites
+SITE_GRID_SPACING_M = 50           # candidate site lattice spacing
+SITE_SERVICE_RADIUS_M = 800        # a station serves customers within this radius
+SITE_RASTER_M = 10                 # raster cell for the coverage upper bounds
+SITE_EVAL_BATCH = 512              # exact coverage evaluations per batched radius query
+EARTH_RADIUS_M = 6371000.0
 
 # ----------------------------
 # Utilities
@@ -81,6 +127,27 @@ def to_dt(ts) -> datetime:
     except Exception:
         return None
 
+NAT_MS = np.iinfo(np.int64).min  # missing / unparseable timestamp in epoch-ms buffers (NaT)
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_ONE_MS = timedelta(milliseconds=1)
+
+def to_epoch_ms(ts) -> int:
+    """to_dt(ts) as UTC epoch milliseconds (same naive-value rules), NAT_MS when it is None."""
+    dt = to_dt(ts)
+    return NAT_MS if dt is None else (dt - _EPOCH) // _ONE_MS
+
+def from_epoch_ms(ms) -> pd.Series:
+    """int64 epoch-ms values (NAT_MS = NaT) as tz-aware Asia/Manila timestamps, without copying them."""
+    stamps = np.asarray(ms, dtype=np.int64).view("datetime64[ms]")
+    return pd.Series(stamps, copy=False).dt.tz_localize("UTC").dt.tz_convert(ASIA_MANILA)
+
+def yyyymm(df: pd.DataFrame) -> pd.Series:
+    """Manila-local year*100+month of createdAt; reuses the ingested yyyymm column when present."""
+    if "yyyymm" in df.columns:
+        return df["yyyymm"]
+    local = df["createdAt"].dt.tz_convert(ASIA_MANILA)
+    return (local.dt.year * 100 + local.dt.month).astype(np.int32)
+
 def to_num(x, default=0.0) -> float:
     if x is None:
         return float(default)
@@ -100,6 +167,15 @@ def haversine_m(lat1, lon1, lat2, lon2) -> float:
     a = math.sin(dphi/2)**2 + math.cos(p1)*math.cos(p2)*math.sin(dlmb/2)**2
     return 2 * R * math.asin(math.sqrt(a))
 
+def haversine_m_matrix(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Pairwise great-circle distances (meters) between points set 1 (rows) and set 2 (cols)."""
+    R = 6371000.0
+    p1 = np.radians(np.asarray(lat1, dtype=float))[:, None]
+    p2 = np.radians(np.asarray(lat2, dtype=float))[None, :]
+    dlmb = np.radians(np.asarray(lon2, dtype=float))[None, :] - np.radians(np.asarray(lon1, dtype=float))[:, None]
+    a = np.sin((p2 - p1) / 2) ** 2 + np.cos(p1) * np.cos(p2) * np.sin(dlmb / 2) ** 2
+    return 2 * R * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
 # ----------------------------
 # Firestore setup
 # ----------------------------
@@ -111,15 +187,26 @@ def connect_firestore():
 
 
 def fetch_data(db):
-    """Fetch stations and sales as DataFrames."""
+    """
+    Fetch stations and sales as DataFrames. The two reads are independent, so
+    they run concurrently and the call takes about as long as the slower one.
+    """
     logging.info("Fetching stations & sales…")
-    stations_df = fetch_stations(db)
-    sales_df = fetch_sales(db)
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        stations_fut = pool.submit(fetch_stations, db)
+        sales_fut = pool.submit(fetch_sales, db)
+        stations_df, sales_df = stations_fut.result(), sales_fut.result()
+    logging.info(f"Fetched stations & sales in {time.perf_counter() - t0:.2f}s")
     return stations_df, sales_df
 KEY_PATH = os.path.join(os.path.dirname(__file__), "serviceAccountKey.json")
-creds = service_account.Credentials.from_service_account_file(KEY_PATH)
 
 def get_db() -> firestore.Client:
+    """Firestore client; the in-memory fake when $FIRESTORE_FIXTURES is set (see fake_firestore.py)."""
+    fake = fake_firestore.client_from_env()
+    if fake is not None:
+        return fake
+    creds = service_account.Credentials.from_service_account_file(KEY_PATH)
     return firestore.Client(credentials=creds, project=creds.project_id)
 
 # ----------------------------
@@ -137,18 +224,85 @@ except Exception as e:
 # ----------------------------
 # Fetch data
 # ----------------------------
+class _CategoryColumn:
+    """Append-only categorical buffer: values are interned, only int32 codes are stored per row."""
+    def __init__(self):
+        self.codes = array("i")
+        self.index: Dict[Any, int] = {}
+
+    def append(self, value):
+        if value is None:
+            self.codes.append(-1)
+            return
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.index)
+        self.codes.append(code)
+
+    def to_categorical(self) -> pd.Categorical:
+        codes = np.frombuffer(self.codes, dtype=np.int32) if len(self.codes) else np.empty(0, dtype=np.int32)
+        return pd.Categorical.from_codes(codes, categories=pd.Index(list(self.index), dtype=object))
+
+def _float_or_nan(x) -> float:
+    return np.nan if x is None else to_num(x, np.nan)
+
+class SalesColumnBuilder:
+    """
+    Streams exploded sales rows straight into typed column buffers:
+    IDs/status as categorical codes, coordinates and prices as float64,
+    createdAt as int64 epoch milliseconds (to_epoch_ms) converted on append.
+    to_frame() wraps the buffers without copying them.
+    """
+    CATEGORY_COLS = ["saleId", "status", "stationOwnerId", "customerId"]
+    FLOAT_COLS = ["customer_lat", "customer_lng", "delivery_distance_m", "totalPrice"]
+
+    def __init__(self):
+        self.cats = {c: _CategoryColumn() for c in self.CATEGORY_COLS}
+        self.floats = {c: array("d") for c in self.FLOAT_COLS}
+        self.created_ms = array("q")
+
+    def __len__(self):
+        return len(self.created_ms)
+
+    def append(self, saleId, createdAt, status, stationOwnerId, customerId,
+               customer_lat: float, customer_lng: float, delivery_distance_m: float, totalPrice: float):
+        self.created_ms.append(to_epoch_ms(createdAt))
+        self.cats["saleId"].append(saleId)
+        self.cats["status"].append(status)
+        self.cats["stationOwnerId"].append(stationOwnerId)
+        self.cats["customerId"].append(customerId)
+        self.floats["customer_lat"].append(customer_lat)
+        self.floats["customer_lng"].append(customer_lng)
+        self.floats["delivery_distance_m"].append(delivery_distance_m)
+        self.floats["totalPrice"].append(totalPrice)
+
+    def to_frame(self) -> pd.DataFrame:
+        if not len(self):
+            return pd.DataFrame()
+        cols = {
+            "saleId": self.cats["saleId"].to_categorical(),
+            "createdAt": from_epoch_ms(np.frombuffer(self.created_ms, dtype=np.int64)),
+            "status": self.cats["status"].to_categorical(),
+            "stationOwnerId": self.cats["stationOwnerId"].to_categorical(),
+            "customerId": self.cats["customerId"].to_categorical(),
+        }
+        for c in self.FLOAT_COLS:
+            cols[c] = np.frombuffer(self.floats[c], dtype=np.float64)
+        return pd.DataFrame(cols, copy=False)
+
 def fetch_sales(db) -> pd.DataFrame:
-    rows = []
+    builder = SalesColumnBuilder()
     query = db.collection("orders").where(field_path="status", op_string="in", value=["Completed", "Delivered"])
     for doc in query.stream():
         s = doc.to_dict() or {}
-        created = to_dt(s.get("createdAt") or s.get("timestamp"))
+        created = s.get("createdAt") or s.get("timestamp")
         total_price = to_num(s.get("totalPrice", s.get("total_amount")), 0)
         cust = s.get("customer_coords") or {}
         clat, clng = cust.get("lat"), cust.get("lng")
         if clat is None or clng is None:
             ship = s.get("shippingAddress") or {}
             clat, clng = ship.get("latitude"), ship.get("longitude")
+        clat, clng = _float_or_nan(clat), _float_or_nan(clng)
 
         station_ids = []
         if s.get("stationOwnerId"):
@@ -161,20 +315,23 @@ def fetch_sales(db) -> pd.DataFrame:
             delivery_distance_m = None
             if sid and isinstance(per_meta.get(sid), dict):
                 delivery_distance_m = per_meta[sid].get("delivery_distance_m")
-            rows.append({
-                "saleId": doc.id,
-                "createdAt": created,
-                "status": s.get("status"),
-                "stationOwnerId": sid,
-                "customerId": s.get("customerId"),
-                "customer_lat": to_num(clat, None),
-                "customer_lng": to_num(clng, None),
-                "delivery_distance_m": to_num(delivery_distance_m, None),
-                "totalPrice": total_price,
-            })
-    df = pd.DataFrame(rows)
+            builder.append(
+                saleId=doc.id,
+                createdAt=created,
+                status=s.get("status"),
+                stationOwnerId=sid,
+                customerId=s.get("customerId"),
+                customer_lat=clat,
+                customer_lng=clng,
+                delivery_distance_m=_float_or_nan(delivery_distance_m),
+                totalPrice=total_price,
+            )
+    df = builder.to_frame()
     if not df.empty:
         df = df.dropna(subset=["createdAt"])
+        for c in SalesColumnBuilder.CATEGORY_COLS:
+            df[c] = df[c].cat.remove_unused_categories()
+        df["yyyymm"] = yyyymm(df)
     return df
 
 def fetch_stations(db) -> pd.DataFrame:
@@ -220,9 +377,9 @@ def build_station_joined_sales(sales_df: pd.DataFrame, stations_df: pd.DataFrame
 def timeseries_by_station(df: pd.DataFrame) -> pd.DataFrame:
     if df.empty:
         return df
-    t = df.copy()
-    t["date"] = t["createdAt"].dt.tz_convert(ASIA_MANILA).dt.date
-    agg = (t.groupby(["stationOwnerId", "waterType", "date"])
+    # createdAt is already Manila-local (SalesColumnBuilder / from_epoch_ms)
+    t = df.assign(date=df["createdAt"].dt.date)
+    agg = (t.groupby(["stationOwnerId", "waterType", "date"], observed=True)
              .agg(orders=("saleId", "nunique"),
                   totalSales=("totalPrice", "sum"))
              .reset_index())
@@ -233,9 +390,9 @@ def rfm_by_customer(df: pd.DataFrame, as_of: Optional[datetime] = None) -> pd.Da
         return df
     as_of = as_of or datetime.now(tz=ASIA_MANILA)
     t = df.dropna(subset=["customerId"]).copy()
-    last = t.groupby("customerId")["createdAt"].max().reset_index().rename(columns={"createdAt": "last_order"})
-    freq = t.groupby("customerId")["saleId"].nunique().reset_index().rename(columns={"saleId": "frequency"})
-    mon = t.groupby("customerId")["totalPrice"].mean().reset_index().rename(columns={"totalPrice": "avgSpend"})
+    last = t.groupby("customerId", observed=True)["createdAt"].max().reset_index().rename(columns={"createdAt": "last_order"})
+    freq = t.groupby("customerId", observed=True)["saleId"].nunique().reset_index().rename(columns={"saleId": "frequency"})
+    mon = t.groupby("customerId", observed=True)["totalPrice"].mean().reset_index().rename(columns={"totalPrice": "avgSpend"})
     rfm = last.merge(freq, on="customerId").merge(mon, on="customerId")
     rfm["recency_days"] = (as_of - rfm["last_order"]).dt.days
     return rfm
@@ -256,9 +413,126 @@ class Recommendation:
     cluster_sales: float
     district: Optional[str] = None
 
+@dataclass
+class ScoringConfig:
+    """Weights, thresholds and penalties used to rank candidate clusters."""
+    w_orders: float = 0.4
+    w_sales: float = 0.3
+    sales_scale: float = 100.0
+    w_distance: float = 0.1
+    distance_scale_m: float = 100.0
+    w_growth: float = 0.2
+    min_orders: int = MIN_ORDERS_PER_CLUSTER
+    min_sales: float = MIN_CLUSTER_SALES
+    min_near_dist_m: float = MIN_DISTANCE_TO_EXISTING_M
+    penalty_low_orders: float = 2.0
+    penalty_low_sales: float = 2.0
+    penalty_near_station: float = 1.0
+    top_k: int = RECOMMEND_TOP_K
+
+def score_clusters(clusters: pd.DataFrame, cfg: ScoringConfig) -> np.ndarray:
+    """
+    Score every cluster at once. `clusters` needs est_orders, est_sales, weight,
+    cluster_orders, cluster_sales, nearest_station_distance_m and growth columns,
+    so the same table can be re-scored cheaply under different configs.
+    """
+    weight = clusters["weight"].to_numpy(dtype=float)
+    dist_m = clusters["nearest_station_distance_m"].to_numpy(dtype=float)
+    score = (
+        cfg.w_orders * clusters["est_orders"].to_numpy(dtype=float) * weight +
+        cfg.w_sales * clusters["est_sales"].to_numpy(dtype=float) * weight / cfg.sales_scale +
+        cfg.w_distance * dist_m / cfg.distance_scale_m +
+        cfg.w_growth * clusters["growth"].to_numpy(dtype=float)
+    )
+    # Soft penalties
+    score -= cfg.penalty_low_orders * (clusters["cluster_orders"].to_numpy() < cfg.min_orders)
+    score -= cfg.penalty_low_sales * (clusters["cluster_sales"].to_numpy() < cfg.min_sales)
+    score -= cfg.penalty_near_station * (dist_m < cfg.min_near_dist_m)
+    return score
+
+def _group_growth(forecast_df: Optional[pd.DataFrame], stations_df: pd.DataFrame,
+                  group_cols: List[str]) -> Dict[tuple, float]:
+    """Forecast growth rate (last vs first yhat) of each group's stations, computed once per group."""
+    if forecast_df is None or forecast_df.empty:
+        return {}
+    owners = stations_df[["stationOwnerId"] + group_cols].drop_duplicates("stationOwnerId")
+    fc = forecast_df[["stationOwnerId", "yhat"]].merge(owners, on="stationOwnerId", how="inner")
+    if fc.empty:
+        return {}
+    g = fc.groupby(group_cols, sort=False)["yhat"]
+    first, last = g.first(), g.last()
+    growth = (last - first) / np.maximum(1, first)
+    return {_group_key(k): float(v) for k, v in growth.items()}
+
+def _district_polygons() -> Dict[str, Any]:
+    if DISTRICTS_GDF is None:
+        return {}
+    polys = {}
+    for name, geom in zip(DISTRICTS_GDF["districtName"], DISTRICTS_GDF["geometry"]):
+        polys.setdefault(name, geom)
+    return polys
+
+def _inside_polygon_mask(poly, lat: np.ndarray, lng: np.ndarray) -> np.ndarray:
+    if poly is None:
+        return np.ones(len(lat), dtype=bool)
+    return gpd.GeoSeries(gpd.points_from_xy(lng, lat)).within(poly).to_numpy()
+
 from sklearn.preprocessing import StandardScaler
 from sklearn.cluster import MiniBatchKMeans
 
+@dataclass
+class CustomerDemandIndex:
+    """Customer demand aggregated once and partitioned by the recommendation group keys."""
+    group_cols: List[str]
+    pts: pd.DataFrame            # orders/sales per (group, customer location), sorted by group
+    months: Dict[tuple, int]     # distinct active months per group
+    slices: Dict[tuple, slice]   # group key -> contiguous row range in `pts`
+
+    def group(self, key: tuple) -> Tuple[pd.DataFrame, int]:
+        sl = self.slices.get(key)
+        if sl is None:
+            return self.pts.iloc[0:0], 0
+        return self.pts.iloc[sl], self.months.get(key, 0)
+
+def _group_key(vals) -> tuple:
+    return vals if isinstance(vals, tuple) else (vals,)
+
+def build_customer_demand_index(df_joined: pd.DataFrame, group_cols: List[str]) -> CustomerDemandIndex:
+    """
+    Aggregate customer demand per (group, location, month) and per (group, location)
+    in one pass over `df_joined`, then index each group's rows so the per-group
+    loop in recommend_new_locations never rescans the sales table.
+    """
+    empty = pd.DataFrame(columns=group_cols + ["customer_lat", "customer_lng", "orders", "sales"])
+    if df_joined.empty:
+        return CustomerDemandIndex(group_cols, empty, {}, {})
+
+    cust = df_joined.dropna(subset=["customer_lat", "customer_lng"])
+    if cust.empty:
+        return CustomerDemandIndex(group_cols, empty, {}, {})
+
+    cust = cust[group_cols + ["customer_lat", "customer_lng", "saleId", "totalPrice"]].assign(yyyymm=yyyymm(cust))
+
+    # Aggregate orders & sales per customer per month (all groups at once)
+    agg = (
+        cust.groupby(group_cols + ["customer_lat", "customer_lng", "yyyymm"], observed=True)
+        .agg(orders=("saleId", "nunique"), sales=("totalPrice", "sum"))
+        .reset_index()
+    )
+    months = {_group_key(k): int(v) for k, v in agg.groupby(group_cols, observed=True)["yyyymm"].nunique().items()}
+
+    # Aggregate per customer location across time; groupby sorts, so groups are contiguous
+    pts = (
+        agg.groupby(group_cols + ["customer_lat", "customer_lng"], observed=True)
+        .agg(orders=("orders", "sum"), sales=("sales", "sum"))
+        .reset_index()
+    )
+    slices = {}
+    for k, idx in pts.groupby(group_cols, sort=False, observed=True).indices.items():
+        slices[_group_key(k)] = slice(int(idx[0]), int(idx[-1]) + 1)
+
+    return CustomerDemandIndex(group_cols, pts, months, slices)
+
 def recommend_new_locations(
     df_joined: pd.DataFrame,
     stations_df: pd.DataFrame,
@@ -268,49 +542,44 @@ def recommend_new_locations(
     min_near_dist_m: float = MIN_DISTANCE_TO_EXISTING_M,
     top_k: int = RECOMMEND_TOP_K,
     rfm_df: Optional[pd.DataFrame] = None,      # RFM table (optional)
-    forecast_df: Optional[pd.DataFrame] = None  # Prophet forecast table (optional)
+    forecast_df: Optional[pd.DataFrame] = None, # Prophet forecast table (optional)
+    scoring: Optional[ScoringConfig] = None,    # overrides the threshold args above
+    workers: Optional[int] = None               # KMeans pool size (default KMEANS_WORKERS, 1 = serial)
 ) -> List[Recommendation]:
     """
     Recommend new water station locations using MiniBatchKMeans clustering,
     demand features, polygon filtering, and scoring with soft penalties.
     """
+    cfg = scoring or ScoringConfig(
+        min_orders=min_orders,
+        min_sales=min_sales,
+        min_near_dist_m=min_near_dist_m,
+        top_k=top_k,
+    )
 
     recs: List[Recommendation] = []
 
     # Group by waterType + district if available
     group_cols = ["waterType", "district"] if "district" in stations_df.columns else ["waterType"]
 
+    # Partition customer demand once; each group below is a slice lookup
+    demand_index = build_customer_demand_index(df_joined, group_cols)
+    growth_by_group = _group_growth(forecast_df, stations_df, group_cols)
+    polygons = _district_polygons()
+
+    # Collect per-group clustering jobs (cheap, main process)
+    jobs = []
     for group_vals, sdf in stations_df.groupby(group_cols):
-        if isinstance(group_vals, tuple):
-            wtype, district = group_vals
+        key = _group_key(group_vals)
+        if len(key) == 2:
+            wtype, district = key
         else:
-            wtype, district = group_vals, None
-
-        # Filter joined sales by waterType (and district if present)
-        cust = df_joined[
-            (df_joined["waterType"] == wtype) &
-            ((df_joined["district"] == district) if district else True)
-        ].dropna(subset=["customer_lat", "customer_lng"]).copy()
+            wtype, district = key[0], None
 
-        if cust.empty:
+        pts, months = demand_index.group(key)
+        if pts.empty:
             continue
-
-        # Add monthly bucket
-        cust["yyyymm"] = cust["createdAt"].dt.tz_convert(ASIA_MANILA).dt.to_period("M")
-
-        # Aggregate orders & sales per customer per month
-        agg = (
-            cust.groupby(["customer_lat", "customer_lng", "yyyymm"])
-            .agg(orders=("saleId", "nunique"), sales=("totalPrice", "sum"))
-            .reset_index()
-        )
-
-        # Aggregate per customer location across time
-        pts = (
-            agg.groupby(["customer_lat", "customer_lng"])
-            .agg(orders=("orders", "sum"), sales=("sales", "sum"))
-            .reset_index()
-        )
+        pts = pts[["customer_lat", "customer_lng", "orders", "sales"]].reset_index(drop=True)
 
         # Optional: merge RFM features (frequency, spend)
         if rfm_df is not None and not rfm_df.empty:
@@ -324,124 +593,431 @@ def recommend_new_locations(
         else:
             pts["rfm_weight"] = 1.0
 
-        # Features for clustering (lat, lng, orders, sales)
-        X = pts[["customer_lat", "customer_lng", "orders", "sales"]].values
-        X = StandardScaler().fit_transform(X)
-
-        # Choose K adaptively
-        max_k = min(k_per_type, len(pts))
-        k = max(1, min(max_k, len(pts) // 3))
+        jobs.append((key, wtype, district, sdf, months,
+                     pts[["customer_lat", "customer_lng", "orders", "sales", "rfm_weight"]]))
+
+    # Groups are independent: cluster them in parallel, results come back in job order
+    t0 = time.perf_counter()
+    clustered = _run_cluster_jobs([job[5] for job in jobs], k_per_type, workers)
+    if jobs:
+        n_workers = max(1, min(KMEANS_WORKERS if workers is None else workers, len(jobs)))
+        slowest = max(range(len(jobs)), key=lambda i: clustered[i][1])
+        print(f"KMeans: {len(jobs)} group(s) clustered in {time.perf_counter() - t0:.2f}s on {n_workers} "
+              f"worker(s) (group total {sum(e for _, e in clustered):.2f}s, slowest "
+              f"{jobs[slowest][1]}/{jobs[slowest][2]} {clustered[slowest][1]:.2f}s)")
+
+    for (key, wtype, district, sdf, months, _), (clusters, elapsed) in zip(jobs, clustered):
+        logging.info(f"KMeans {wtype}/{district}: {len(clusters)} clusters in {elapsed:.2f}s")
+
+        months = max(1, months)
+
+        # Per-cluster features as arrays
+        near_ids, dist_m = _nearest_stations(clusters["lat"].to_numpy(), clusters["lng"].to_numpy(), sdf)
+        clusters["est_orders"] = (clusters["cluster_orders"].to_numpy() // months).astype(int)
+        clusters["est_sales"] = clusters["cluster_sales"].to_numpy(dtype=float) / months
+        clusters["nearest_station_id"] = near_ids
+        clusters["nearest_station_distance_m"] = dist_m
+        clusters["growth"] = growth_by_group.get(key, 0.0)
+        score = score_clusters(clusters, cfg)
+
+        # Polygon check
+        inside = np.ones(len(clusters), dtype=bool)
+        if district:
+            inside = _inside_polygon_mask(polygons.get(district), clusters["lat"].to_numpy(), clusters["lng"].to_numpy())
+            if not inside.all():
+                logging.debug(
+                    f"⚠️ Skipped {int((~inside).sum())} clusters (outside district polygon) → District={district}"
+                )
 
-        km = MiniBatchKMeans(
-            n_clusters=k,
-            batch_size=100,
-            random_state=42,
-            max_iter=100,
-            n_init="auto"
-        )
-        pts["cluster"] = km.fit_predict(X)
-
-        # Cluster-level aggregation
-        clusters = (
-            pts.groupby("cluster")
-            .agg(
-                cluster_orders=("orders", "sum"),
-                cluster_sales=("sales", "sum"),
-                lat=("customer_lat", "mean"),
-                lng=("customer_lng", "mean"),
-                weight=("rfm_weight", "mean")
+        # Pick top-k clusters by score (stable, so ties keep cluster order)
+        order = [i for i in np.argsort(-score, kind="stable") if inside[i]][:cfg.top_k]
+        for row in clusters.iloc[order].itertuples(index=False):
+            recs.append(
+                Recommendation(
+                    waterType=wtype,
+                    lat=float(row.lat),
+                    lng=float(row.lng),
+                    est_orders_per_month=max(int(row.est_orders), 1),
+                    est_monthly_sales=max(float(row.est_sales), 0.0),
+                    nearest_station_id=row.nearest_station_id,
+                    nearest_station_distance_m=float(row.nearest_station_distance_m),
+                    cluster_orders=int(row.cluster_orders),
+                    cluster_sales=float(row.cluster_sales),
+                    district=district,
+                )
             )
-            .reset_index()
+
+    return recs
+
+def _cluster_group(pts: pd.DataFrame, k_per_type: int) -> Tuple[pd.DataFrame, float]:
+    """Scale + MiniBatchKMeans one group's customer points; returns cluster table and elapsed seconds."""
+    t0 = time.perf_counter()
+    pts = pts.copy()
+
+    # Features for clustering (lat, lng, orders, sales)
+    X = pts[["customer_lat", "customer_lng", "orders", "sales"]].values
+    X = StandardScaler().fit_transform(X)
+
+    # Choose K adaptively
+    max_k = min(k_per_type, len(pts))
+    k = max(1, min(max_k, len(pts) // 3))
+
+    km = MiniBatchKMeans(
+        n_clusters=k,
+        batch_size=100,
+        random_state=42,
+        max_iter=100,
+        n_init="auto"
+    )
+    pts["cluster"] = km.fit_predict(X)
+
+    # Cluster-level aggregation
+    clusters = (
+        pts.groupby("cluster")
+        .agg(
+            cluster_orders=("orders", "sum"),
+            cluster_sales=("sales", "sum"),
+            lat=("customer_lat", "mean"),
+            lng=("customer_lng", "mean"),
+            weight=("rfm_weight", "mean")
         )
+        .reset_index()
+    )
+    return clusters, time.perf_counter() - t0
+
+def _run_cluster_jobs(pts_list: List[pd.DataFrame], k_per_type: int,
+                      workers: Optional[int] = None) -> List[Tuple[pd.DataFrame, float]]:
+    """Run _cluster_group over all groups, serially or in a process pool, preserving input order."""
+    workers = KMEANS_WORKERS if workers is None else workers
+    workers = min(workers, len(pts_list))
+    if workers <= 1:
+        return [_cluster_group(pts, k_per_type) for pts in pts_list]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_cluster_group, pts_list, [k_per_type] * len(pts_list)))
+
+def _nearest_stations(lat: np.ndarray, lng: np.ndarray, sdf: pd.DataFrame) -> Tuple[List[Optional[str]], np.ndarray]:
+    """Nearest existing station (id, meters) for each query point."""
+    if sdf.empty:
+        return [None] * len(lat), np.full(len(lat), np.inf)
+    d = haversine_m_matrix(lat, lng, sdf["station_lat"].to_numpy(), sdf["station_lng"].to_numpy())
+    j = d.argmin(axis=1)
+    ids = sdf["stationOwnerId"].to_numpy()[j]
+    return list(ids), d[np.arange(len(lat)), j]
 
-        months = max(1, len(agg["yyyymm"].unique()))
-        scored_clusters = []
+# ----------------------------
+# Coverage site selection (greedy lazy max-coverage)
+# ----------------------------
+def candidate_site_grid(lat: np.ndarray, lng: np.ndarray, spacing_m: float = SITE_GRID_SPACING_M,
+                        polygon=None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Regular lattice of candidate sites (spacing_m apart) over the bounding box of
+    the given points, kept only inside `polygon` when one is given.
+    """
+    lat0, lat1 = float(np.min(lat)), float(np.max(lat))
+    lng0, lng1 = float(np.min(lng)), float(np.max(lng))
+    if polygon is not None:
+        b_lng0, b_lat0, b_lng1, b_lat1 = polygon.bounds
+        lat0, lat1, lng0, lng1 = b_lat0, b_lat1, b_lng0, b_lng1
+    dlat = spacing_m / 111320.0
+    dlng = spacing_m / (111320.0 * math.cos(math.radians((lat0 + lat1) / 2)))
+    glat, glng = np.meshgrid(np.arange(lat0, lat1 + dlat, dlat), np.arange(lng0, lng1 + dlng, dlng), indexing="ij")
+    glat, glng = glat.ravel(), glng.ravel()
+    if polygon is not None:
+        keep = shapely.contains_xy(polygon, glng, glat)
+        glat, glng = glat[keep], glng[keep]
+    return glat, glng
+
+def demand_upper_bounds(site_lat: np.ndarray, site_lng: np.ndarray, cust_lat: np.ndarray, cust_lng: np.ndarray,
+                        weights: np.ndarray, radius_m: float, cell_m: float = SITE_RASTER_M) -> np.ndarray:
+    """
+    Upper bound on the customer weight within radius_m of every site, for all
+    sites at once: sites and customers are snapped to a cell_m raster and the
+    customer raster is convolved (FFT) with a disk widened by the snapping error.
+    """
+    lat0 = min(site_lat.min(), cust_lat.min())
+    lng0 = min(site_lng.min(), cust_lng.min())
+    dlat = cell_m / 111320.0
+    dlng = cell_m / (111320.0 * math.cos(math.radians(float(np.mean(site_lat)))))
+    ci = np.rint((cust_lat - lat0) / dlat).astype(np.int64)
+    cj = np.rint((cust_lng - lng0) / dlng).astype(np.int64)
+    si = np.rint((site_lat - lat0) / dlat).astype(np.int64)
+    sj = np.rint((site_lng - lng0) / dlng).astype(np.int64)
+    raster = np.zeros((max(ci.max(), si.max()) + 1, max(cj.max(), sj.max()) + 1))
+    np.add.at(raster, (ci, cj), weights)
+
+    # Customer and site each move <= half a cell diagonal when snapped; 0.2% more
+    # covers the planar vs haversine difference at city scale
+    reach = (radius_m + cell_m * math.sqrt(2)) * 1.002 / cell_m
+    r = int(math.ceil(reach))
+    di, dj = np.mgrid[-r:r + 1, -r:r + 1]
+    disk = (di ** 2 + dj ** 2 <= reach ** 2).astype(float)
+    bounds = fftconvolve(raster, disk, mode="full")[si + r, sj + r]
+    return bounds + 1e-6 * float(np.sum(weights)) + 1e-9
+
+def greedy_max_coverage(upper_bounds: np.ndarray, covered_by, weights: np.ndarray, k: int,
+                        batch: int = SITE_EVAL_BATCH) -> List[Tuple[int, np.ndarray, float]]:
+    """
+    Pick up to k sites maximizing the total weight of covered customers.
+
+    Lazy greedy (CELF): every site starts at an upper bound of its gain and a
+    site's gain only shrinks as customers get covered, so exact gains are only
+    evaluated for sites reaching the top of the heap, up to `batch` at a time
+    (covered_by(site indices) -> list of customer index arrays).
+    Returns [(site index, newly covered customers, gain)].
+    """
+    weights = np.asarray(weights, dtype=float)
+    heap = [(-float(g), int(i), -1) for i, g in enumerate(upper_bounds) if g > 0]
+    heapq.heapify(heap)
+    covered = np.zeros(len(weights), dtype=bool)
+    chosen: List[Tuple[int, np.ndarray, float]] = []
+    fresh: Dict[int, np.ndarray] = {}  # customers of sites evaluated since the last pick
+    while heap and len(chosen) < k:
+        if heap[0][2] == len(chosen):
+            neg_gain, i, _ = heapq.heappop(heap)
+            new = fresh[i][~covered[fresh[i]]]
+            chosen.append((i, new, -neg_gain))
+            covered[new] = True
+            fresh.clear()
+            continue
+        stale = []
+        while heap and len(stale) < batch and heap[0][2] != len(chosen):
+            stale.append(heapq.heappop(heap)[1])
+        for i, cust in zip(stale, covered_by(np.asarray(stale))):
+            cust = cust[~covered[cust]]
+            gain = float(weights[cust].sum())
+            if gain > 0:
+                fresh[i] = cust
+                heapq.heappush(heap, (-gain, i, len(chosen)))
+    return chosen
+
+def recommend_coverage_sites(
+    df_joined: pd.DataFrame,
+    stations_df: pd.DataFrame,
+    top_k: int = RECOMMEND_TOP_K,
+    service_radius_m: float = SITE_SERVICE_RADIUS_M,
+    grid_spacing_m: float = SITE_GRID_SPACING_M,
+    min_near_dist_m: float = MIN_DISTANCE_TO_EXISTING_M,
+) -> List[Recommendation]:
+    """
+    Recommend new station sites by maximizing coverage of unserved demand.
+
+    Per waterType (+ district) group: customer demand already within
+    service_radius_m of an existing station of that waterType counts as served.
+    Every site of a grid_spacing_m lattice over the district polygon (or the
+    customers' bounding box) not closer than min_near_dist_m to an existing
+    station is a candidate. Greedy lazy max-coverage picks top_k sites by newly
+    covered orders; exact coverage comes from BallTree radius queries and is only
+    evaluated for sites whose rasterized upper bound reaches the top.
+    """
+    recs: List[Recommendation] = []
+    group_cols = ["waterType", "district"] if "district" in stations_df.columns else ["waterType"]
+    demand_index = build_customer_demand_index(df_joined, group_cols)
+    polygons = _district_polygons()
+    radius_rad = service_radius_m / EARTH_RADIUS_M
 
-        for _, row in clusters.iterrows():
-            est_orders = int(row["cluster_orders"] // months)
-            est_sales = float(row["cluster_sales"] / months)
-            lat, lng = float(row["lat"]), float(row["lng"])
+    for group_vals, sdf in stations_df.groupby(group_cols):
+        key = _group_key(group_vals)
+        wtype, district = (key[0], key[1]) if len(key) == 2 else (key[0], None)
+        pts, months = demand_index.group(key)
+        if pts.empty:
+            continue
+        t0 = time.perf_counter()
+        months = max(1, months)
+        cust = np.radians(pts[["customer_lat", "customer_lng"]].to_numpy(dtype=float))
+        orders = pts["orders"].to_numpy(dtype=float)
+        sales = pts["sales"].to_numpy(dtype=float)
+
+        # Demand already served by existing stations of this waterType
+        same_type = stations_df[stations_df["waterType"] == wtype]
+        unserved = np.ones(len(pts), dtype=bool)
+        station_tree = None
+        if not same_type.empty:
+            station_tree = BallTree(np.radians(same_type[["station_lat", "station_lng"]].to_numpy(dtype=float)),
+                                    metric="haversine")
+            unserved = station_tree.query_radius(cust, r=radius_rad, count_only=True) == 0
+        if not unserved.any():
+            continue
 
-            near_id, dist_m = _nearest_station(lat, lng, sdf)
+        # Candidate lattice, away from existing stations
+        site_lat, site_lng = candidate_site_grid(pts["customer_lat"].to_numpy(), pts["customer_lng"].to_numpy(),
+                                                 grid_spacing_m, polygons.get(district) if district else None)
+        sites = np.radians(np.column_stack([site_lat, site_lng]))
+        if station_tree is not None and len(sites):
+            far = station_tree.query_radius(sites, r=min_near_dist_m / EARTH_RADIUS_M, count_only=True) == 0
+            site_lat, site_lng, sites = site_lat[far], site_lng[far], sites[far]
+        if len(sites) == 0:
+            continue
 
-            # Base score (orders, sales, distance, weighted)
-            score = (
-                0.4 * est_orders * row["weight"] +
-                0.3 * (est_sales * row["weight"]) / 100 +
-                0.1 * (dist_m / 100)
-            )
+        # Exact coverage from radius queries on the unserved customers; all
+        # candidates start from a rasterized upper bound (lazy greedy)
+        cust_idx = np.flatnonzero(unserved)
+        cust_tree = BallTree(cust[cust_idx], metric="haversine")
+
+        def covered_by(site_ids: np.ndarray) -> List[np.ndarray]:
+            return [cust_idx[found] for found in cust_tree.query_radius(sites[site_ids], r=radius_rad)]
+
+        bounds = demand_upper_bounds(site_lat, site_lng, pts["customer_lat"].to_numpy()[cust_idx],
+                                     pts["customer_lng"].to_numpy()[cust_idx], orders[cust_idx],
+                                     service_radius_m)
+        chosen = greedy_max_coverage(bounds, covered_by, orders, top_k)
+        logging.info(f"Coverage {wtype}/{district}: {len(sites)} candidate sites, {len(cust_idx)} unserved "
+                     f"locations, {len(chosen)} sites in {time.perf_counter() - t0:.2f}s")
+        if not chosen:
+            continue
 
-            # Optional: demand growth adjustment
-            if forecast_df is not None and not forecast_df.empty:
-                fc = forecast_df[forecast_df["stationOwnerId"].isin(sdf["stationOwnerId"])]
-                if not fc.empty:
-                    growth_rate = (fc["yhat"].iloc[-1] - fc["yhat"].iloc[0]) / max(1, fc["yhat"].iloc[0])
-                    score += 0.2 * growth_rate
-
-            # Soft penalties
-            if row["cluster_orders"] < min_orders:
-                score -= 2
-            if row["cluster_sales"] < min_sales:
-                score -= 2
-            if dist_m < min_near_dist_m:
-                score -= 1
-
-            # Polygon check
-            if district and DISTRICTS_GDF is not None:
-                poly = DISTRICTS_GDF.loc[DISTRICTS_GDF["districtName"] == district, "geometry"]
-                if not poly.empty and not poly.squeeze().contains(Point(lng, lat)):
-                    logging.debug(
-                        f"⚠️ Skipped (outside district polygon) → "
-                        f"Lat={lat:.5f}, Lng={lng:.5f} District={district}"
-                    )
-                    continue
-
-            scored_clusters.append((score, row, est_orders, est_sales, near_id, dist_m))
-
-        # Pick top-k clusters by score
-        scored_clusters.sort(key=lambda x: x[0], reverse=True)
-        for score, row, est_orders, est_sales, near_id, dist_m in scored_clusters[:top_k]:
+        chosen_idx = np.array([i for i, _, _ in chosen])
+        near_ids, dist_m = _nearest_stations(site_lat[chosen_idx], site_lng[chosen_idx], same_type)
+        for (i, new, _), near_id, near_d in zip(chosen, near_ids, dist_m):
+            site_orders, site_sales = float(orders[new].sum()), float(sales[new].sum())
             recs.append(
                 Recommendation(
                     waterType=wtype,
-                    lat=float(row["lat"]),
-                    lng=float(row["lng"]),
-                    est_orders_per_month=max(est_orders, 1),
-                    est_monthly_sales=max(est_sales, 0.0),
+                    lat=float(site_lat[i]),
+                    lng=float(site_lng[i]),
+                    est_orders_per_month=max(int(site_orders // months), 1),
+                    est_monthly_sales=max(site_sales / months, 0.0),
                     nearest_station_id=near_id,
-                    nearest_station_distance_m=dist_m,
-                    cluster_orders=int(row["cluster_orders"]),
-                    cluster_sales=float(row["cluster_sales"]),
+                    nearest_station_distance_m=float(near_d),
+                    cluster_orders=int(site_orders),
+                    cluster_sales=site_sales,
                     district=district,
                 )
             )
 
     return recs
-def _nearest_station(lat: float, lng: float, sdf: pd.DataFrame) -> Tuple[Optional[str], float]:
-    coords = sdf[["station_lat", "station_lng"]].values
-    if coords.shape[0] == 0:
-        return None, float("inf")
-    min_d = float("inf")
-    min_id = None
-    for _, r in sdf.iterrows():
-        d = haversine_m(lat, lng, r["station_lat"], r["station_lng"])
-        if d < min_d:
-            min_d = d
-            min_id = r["stationOwnerId"]
-    return min_id, float(min_d)
+
+# ----------------------------
+# Station catchments
+# ----------------------------
+def station_catchments(df_joined: pd.DataFrame, stations_df: pd.DataFrame,
+                       service_radius_m: float = SITE_SERVICE_RADIUS_M) -> pd.DataFrame:
+    """
+    Assign every customer location to its nearest station of the same waterType
+    (one BallTree k=2 query per waterType) and summarize per station:
+    - catchment demand: locations, orders and sales of the customers it is nearest to
+    - captured_orders / capture_rate: catchment orders actually placed with the station
+    - catchment distance (median, p90) and median delivery_distance_m of its own orders
+    - overlap: catchment orders also within service_radius_m of the second-nearest
+      station, and the station most of them overlap with
+    """
+    cols = ["stationOwnerId", "waterType", "district", "station_lat", "station_lng",
+            "catchment_locations", "catchment_orders", "catchment_sales", "captured_orders", "capture_rate",
+            "catchment_median_distance_m", "catchment_p90_distance_m", "median_delivery_distance_m",
+            "overlap_orders", "overlap_share", "overlap_station_id"]
+    if df_joined.empty or stations_df.empty:
+        return pd.DataFrame(columns=cols)
+
+    stations = stations_df.drop_duplicates("stationOwnerId").reset_index(drop=True)
+    if "district" not in stations.columns:
+        stations = stations.assign(district=None)
+    cust = df_joined.dropna(subset=["customer_lat", "customer_lng", "waterType"])
+    keys = ["waterType", "customer_lat", "customer_lng"]
+    demand = (cust.groupby(keys, observed=True)
+                  .agg(orders=("saleId", "nunique"), sales=("totalPrice", "sum"))
+                  .reset_index())
+    served = (cust.groupby(keys + ["stationOwnerId"], observed=True)["saleId"].nunique()
+                  .rename("served").reset_index())
+
+    parts = []
+    for wtype, sdf in stations.groupby("waterType", sort=False):
+        pts = demand[demand["waterType"] == wtype]
+        if pts.empty:
+            continue
+        tree = BallTree(np.radians(sdf[["station_lat", "station_lng"]].to_numpy(dtype=float)), metric="haversine")
+        k = min(2, len(sdf))
+        dist, idx = tree.query(np.radians(pts[["customer_lat", "customer_lng"]].to_numpy(dtype=float)), k=k)
+        dist = dist * EARTH_RADIUS_M
+        ids = sdf["stationOwnerId"].to_numpy()
+        second_d = dist[:, 1] if k == 2 else np.full(len(pts), np.inf)
+        parts.append(pts.assign(
+            nearest=ids[idx[:, 0]],
+            distance_m=dist[:, 0],
+            second=ids[idx[:, -1]] if k == 2 else None,
+            overlap=second_d <= service_radius_m,
+        ))
+    if not parts:
+        return stations.reindex(columns=cols)
+    assigned = pd.concat(parts, ignore_index=True)
+
+    # Orders each catchment location placed with its own nearest station
+    captured = assigned[keys + ["nearest"]].merge(
+        served, left_on=keys + ["nearest"], right_on=keys + ["stationOwnerId"], how="left")["served"]
+    assigned["captured"] = captured.fillna(0).to_numpy()
+    assigned["overlap_orders"] = assigned["orders"].where(assigned["overlap"], 0)
+
+    g = assigned.groupby("nearest")
+    summary = g.agg(
+        catchment_locations=("orders", "size"),
+        catchment_orders=("orders", "sum"),
+        catchment_sales=("sales", "sum"),
+        captured_orders=("captured", "sum"),
+        catchment_median_distance_m=("distance_m", "median"),
+        catchment_p90_distance_m=("distance_m", lambda d: d.quantile(0.9)),
+        overlap_orders=("overlap_orders", "sum"),
+    )
+    over = assigned[assigned["overlap"]]
+    if not over.empty:
+        pair = over.groupby(["nearest", "second"])["orders"].sum().reset_index()
+        pair = pair.sort_values("orders", ascending=False, kind="stable").drop_duplicates("nearest")
+        summary["overlap_station_id"] = pair.set_index("nearest")["second"]
+    else:
+        summary["overlap_station_id"] = None
+    summary["median_delivery_distance_m"] = (
+        df_joined.dropna(subset=["delivery_distance_m"])
+                 .groupby("stationOwnerId", observed=True)["delivery_distance_m"].median())
+
+    out = stations[["stationOwnerId", "waterType", "district", "station_lat", "station_lng"]].merge(
+        summary, left_on="stationOwnerId", right_index=True, how="left")
+    for c in ["catchment_locations", "catchment_orders", "catchment_sales", "captured_orders", "overlap_orders"]:
+        out[c] = out[c].fillna(0)
+    out = out.astype({"catchment_locations": int, "catchment_orders": int,
+                      "captured_orders": int, "overlap_orders": int})
+    orders = out["catchment_orders"].to_numpy(dtype=float)
+    out["capture_rate"] = np.where(orders > 0, out["captured_orders"] / np.maximum(orders, 1), np.nan)
+    out["overlap_share"] = np.where(orders > 0, out["overlap_orders"] / np.maximum(orders, 1), np.nan)
+    return out[cols]
+
+def write_catchment_geojson(catchments: pd.DataFrame,
+                            path: str = os.path.join(OUT_DIR, "station_catchments.geojson")) -> str:
+    """Station points with their catchment stats, for the admin map."""
+    features = []
+    for row in catchments.to_dict("records"):
+        props = {k: (None if isinstance(v, float) and math.isnan(v) else v)
+                 for k, v in row.items() if k not in ("station_lat", "station_lng")}
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [float(row["station_lng"]), float(row["station_lat"])]},
+            "properties": props,
+        })
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f, ensure_ascii=False, default=str)
+    return path
+
+def attach_catchment_stats(recs_out: pd.DataFrame, catchments: pd.DataFrame) -> pd.DataFrame:
+    """Add the nearest existing station's catchment load / overlap to each recommendation row."""
+    if recs_out.empty or catchments.empty:
+        return recs_out
+    stats = catchments.set_index("stationOwnerId")[["catchment_orders", "capture_rate", "overlap_share"]]
+    stats = stats.add_prefix("nearest_station_")
+    return recs_out.merge(stats, left_on="nearest_station_id", right_index=True, how="left")
 
 # ----------------------------
 # Forecasting & Churn (unchanged)
 # ----------------------------
-def prophet_forecast(daily_df: pd.DataFrame, horizon_days: int = 30) -> pd.DataFrame:
-    if not _HAS_PROPHET or daily_df.empty:
+def prophet_forecast(matrix: station_matrix.StationDayMatrix, horizon_days: int = 30) -> pd.DataFrame:
+    """
+    Per-station daily totalSales forecast from the dense station × day matrix:
+    each station's series runs from its first day with orders to the end of the
+    shared date axis, with days without orders as 0.
+    """
+    if not _HAS_PROPHET or len(matrix) == 0:
         return pd.DataFrame()
     results = []
-    for sid, g in daily_df.groupby("stationOwnerId"):
-        dfm = g.sort_values("date")[["date", "totalSales"]].rename(columns={"date": "ds", "totalSales": "y"})
-        dfm["ds"] = pd.to_datetime(dfm["ds"])
-        if len(dfm) < 7:
+    for sid, _, sales, orders in matrix.rows():
+        active = np.flatnonzero(orders)
+        if len(active) < 7:
             continue
+        dfm = pd.DataFrame({"ds": pd.DatetimeIndex(matrix.dates[active[0]:]), "y": sales[active[0]:]})
         m = Prophet(daily_seasonality=True, weekly_seasonality=True)
         m.fit(dfm)
         future = m.make_future_dataframe(periods=horizon_days, freq="D")
@@ -478,7 +1054,188 @@ def train_churn_model(ds: pd.DataFrame):
         colsample_bytree=0.9, random_state=42, n_jobs=2, reg_lambda=1.0
     )
     model.fit(X, y)
-    return model, ["recency_days", "frequency", "avgSpend"]
+    return model, list(CHURN_FEATURES)
+
+def data_fingerprint(X: np.ndarray) -> str:
+    """Content hash of a feature matrix (shape + float64 bytes)."""
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    h = hashlib.sha256(str(X.shape).encode())
+    h.update(X.tobytes())
+    return h.hexdigest()
+
+def _reference_bins(X: np.ndarray, n_bins: int = 10) -> List[Dict[str, List[float]]]:
+    """Per-feature quantile bin edges and training proportions, for PSI drift checks."""
+    ref = []
+    for j in range(X.shape[1]):
+        edges = np.unique(np.quantile(X[:, j], np.linspace(0, 1, n_bins + 1)[1:-1]))
+        counts = np.bincount(np.searchsorted(edges, X[:, j], side="right"), minlength=len(edges) + 1)
+        ref.append({"edges": edges.tolist(), "props": (counts / max(1, len(X))).tolist()})
+    return ref
+
+def population_stability(X: np.ndarray, ref: List[Dict[str, List[float]]]) -> np.ndarray:
+    """PSI of each feature column of X against the saved training bins."""
+    eps = 1e-6
+    psi = np.zeros(len(ref))
+    for j, r in enumerate(ref):
+        edges, expected = np.asarray(r["edges"]), np.asarray(r["props"]) + eps
+        counts = np.bincount(np.searchsorted(edges, X[:, j], side="right"), minlength=len(edges) + 1)
+        actual = counts / max(1, len(X)) + eps
+        psi[j] = float(np.sum((actual - expected) * np.log(actual / expected)))
+    return psi
+
+def save_churn_model(model, feat: List[str], X: np.ndarray, model_dir: str = CHURN_MODEL_DIR):
+    """Persist model + metadata (feature schema, fingerprint, drift reference, trained_at)."""
+    os.makedirs(model_dir, exist_ok=True)
+    model.save_model(os.path.join(model_dir, "model.json"))
+    meta = {
+        "features": feat,
+        "fingerprint": data_fingerprint(X),
+        "n_rows": int(len(X)),
+        "reference": _reference_bins(X),
+        "trained_at": datetime.now(tz=timezone.utc).isoformat(),
+    }
+    with open(os.path.join(model_dir, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+def load_churn_model(model_dir: str = CHURN_MODEL_DIR):
+    """Return (model, meta) from disk, or (None, None) if missing/unreadable."""
+    if not _HAS_XGB:
+        return None, None
+    try:
+        with open(os.path.join(model_dir, "meta.json")) as f:
+            meta = json.load(f)
+        model = XGBClassifier()
+        model.load_model(os.path.join(model_dir, "model.json"))
+        return model, meta
+    except Exception:
+        return None, None
+
+def churn_retrain_reason(ds: pd.DataFrame, meta: Optional[dict],
+                         max_psi: float = CHURN_DRIFT_PSI,
+                         max_age_days: int = CHURN_MAX_MODEL_AGE_DAYS) -> Optional[str]:
+    """Why the saved model should be retrained, or None if it is still valid for `ds`."""
+    if meta is None:
+        return "no saved model"
+    if meta.get("features") != CHURN_FEATURES:
+        return "feature schema changed"
+    age = datetime.now(tz=timezone.utc) - datetime.fromisoformat(meta["trained_at"])
+    if age > timedelta(days=max_age_days):
+        return f"model age {age.days}d > {max_age_days}d"
+    X = ds[CHURN_FEATURES].to_numpy(dtype=float)
+    if data_fingerprint(X) == meta.get("fingerprint"):
+        return None
+    psi = population_stability(X, meta["reference"])
+    if psi.max() > max_psi:
+        worst = CHURN_FEATURES[int(psi.argmax())]
+        return f"drift on {worst} (PSI {psi.max():.3f} > {max_psi})"
+    return None
+
+def ensure_churn_model(ds: pd.DataFrame, model_dir: str = CHURN_MODEL_DIR):
+    """
+    Load the saved churn model and retrain only on drift, age or schema change.
+    Returns (model, features, status message).
+    """
+    saved, meta = load_churn_model(model_dir)
+    reason = churn_retrain_reason(ds, meta) if not ds.empty else None
+    if saved is not None and reason is None:
+        return saved, meta["features"], f"reused saved model (trained {meta['trained_at']})"
+    model, feat = train_churn_model(ds)
+    if model is None:
+        if saved is not None:
+            return saved, meta["features"], "retrain skipped (insufficient data); kept saved model"
+        return None, None, "training skipped (insufficient class balance or data)"
+    save_churn_model(model, feat, ds[feat].to_numpy(dtype=float), model_dir)
+    return model, feat, f"retrained ({reason})"
+
+def score_churn(model, feat: List[str], ds: pd.DataFrame, chunk_size: int = CHURN_SCORE_CHUNK) -> pd.DataFrame:
+    """Churn probability for every customer in `ds`, predicted in fixed-size chunks."""
+    X = ds[feat].to_numpy(dtype=float)
+    probs = np.empty(len(X))
+    for start in range(0, len(X), chunk_size):
+        probs[start:start + chunk_size] = model.predict_proba(X[start:start + chunk_size])[:, 1]
+    return pd.DataFrame({"customerId": ds["customerId"].to_numpy(), "churn_prob": probs})
+
+# ----------------------------
+# Output tables (./out)
+# ----------------------------
+def _partition_keys(df: pd.DataFrame, name: str, run_date: str) -> Tuple[str, pd.Series]:
+    col = OUTPUT_PARTITION_COL.get(name)
+    if col is None:
+        return "run_date", pd.Series(run_date, index=df.index)
+    return "month", pd.to_datetime(df[col]).dt.strftime("%Y-%m")
+
+def write_output(df: pd.DataFrame, name: str, fmt: str = OUTPUT_FORMAT,
+                 run_date: Optional[str] = None, cache: Optional[stage_cache.StageCache] = None) -> str:
+    """
+    Write an output table to OUT_DIR.
+    - csv:     OUT_DIR/<name>.csv, rewritten in full (skipped when `cache` saw
+               the same table produce the file that is on disk).
+    - parquet: OUT_DIR/<name>/<key>=<value>/part-0.parquet (hive style). Dated tables
+               are partitioned by month, and a month is rewritten only when its rows
+               changed (stage-cache fingerprint of the month's slice), so late or
+               corrected orders reach closed months too; snapshots go to run_date=<today>.
+    Returns the path written.
+    """
+    if fmt == "parquet" and not _HAS_PARQUET:
+        print("pyarrow not installed — writing CSV instead. (pip install pyarrow)")
+        fmt = "csv"
+    cache = cache or stage_cache.StageCache(enabled=False)
+    if fmt == "csv":
+        path = os.path.join(OUT_DIR, f"{name}.csv")
+        cache.file(f"output_{name}", df, path, lambda: df.to_csv(path, index=False))
+        return path
+
+    run_date = run_date or datetime.now(tz=ASIA_MANILA).strftime("%Y-%m-%d")
+    table_dir = os.path.join(OUT_DIR, name)
+    os.makedirs(table_dir, exist_ok=True)
+    key, parts = _partition_keys(df, name, run_date)
+    # A snapshot is written even when empty, so it still replaces the previous one for read_output
+    groups = [(run_date, df)] if key == "run_date" else df.groupby(parts, sort=True)
+
+    written = unchanged = 0
+    for value, part in groups:
+        part_dir = os.path.join(table_dir, f"{key}={value}")
+        path = os.path.join(part_dir, "part-0.parquet")
+
+        def build(part=part, part_dir=part_dir, path=path):
+            os.makedirs(part_dir, exist_ok=True)
+            tmp = path + ".tmp"
+            part.to_parquet(tmp, index=False)
+            os.replace(tmp, path)
+
+        if cache.file(f"output_{name}", (key, value, part), path, build):
+            written += 1
+        else:
+            unchanged += 1
+    print(f"{name}: wrote {written} partition(s), {unchanged} unchanged -> {table_dir}")
+    return table_dir
+
+def read_output(name: str, partitions: Optional[List[str]] = None,
+                columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Read a partitioned output table, optionally only some partition values
+    (e.g. ["2025-08"]) and columns. Snapshot tables (run_date=...) default to
+    the newest run only; pass partitions to read older runs. Falls back to the
+    CSV export when present.
+    """
+    table_dir = os.path.join(OUT_DIR, name)
+    if not os.path.isdir(table_dir):
+        csv_path = os.path.join(OUT_DIR, f"{name}.csv")
+        return pd.read_csv(csv_path, usecols=columns) if os.path.exists(csv_path) else pd.DataFrame()
+    dirs = sorted(d for d in os.listdir(table_dir)
+                  if "=" in d and os.path.exists(os.path.join(table_dir, d, "part-0.parquet")))
+    if partitions is None:
+        runs = [d for d in dirs if d.startswith("run_date=")]
+        if runs:
+            dirs = [d for d in dirs if not d.startswith("run_date=")] + runs[-1:]
+    frames = []
+    for d in dirs:
+        key, value = d.split("=", 1)
+        if partitions is not None and value not in partitions:
+            continue
+        path = os.path.join(table_dir, d, "part-0.parquet")
+        frames.append(pd.read_parquet(path, columns=columns).assign(**{key: value}))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
 
 # ----------------------------
 # Firestore write-back
@@ -514,16 +1271,25 @@ def write_recommendations(db, recs: List[Recommendation]):
 # ----------------------------
 # MAIN
 # ----------------------------
-def main():
+def main(output_format: str = OUTPUT_FORMAT, source: str = "firestore",
+         warehouse_path: str = warehouse.WAREHOUSE_PATH, recommender: str = RECOMMENDER,
+         use_cache: bool = True):
     print("Connecting to Firestore…")
+    cache = stage_cache.StageCache(enabled=use_cache)
     db = get_db()
 
-    print("Fetching stations…")
-    stations_df = fetch_stations(db)
-    print(f"Stations: {len(stations_df)} with coords & waterType")
+    wh = None
+    if source == "warehouse":
+        print(f"Syncing local warehouse ({warehouse_path})…")
+        wh = warehouse.connect(warehouse_path)
+        warehouse.sync_from_firestore(wh, db)
 
-    print("Fetching sales…")
-    sales_df = fetch_sales(db)
+    print("Fetching stations & sales…")
+    if wh:
+        stations_df, sales_df = warehouse.load_stations(wh), warehouse.load_sales(wh)
+    else:
+        stations_df, sales_df = fetch_data(db)
+    print(f"Stations: {len(stations_df)} with coords & waterType")
     print(f"Sales rows (exploded per-station): {len(sales_df)}")
 
     if sales_df.empty or stations_df.empty:
@@ -537,30 +1303,44 @@ def main():
 
     # ---------------- Build feature tables ----------------
     print("Building daily station time series…")
-    ts_daily = timeseries_by_station(joined)
-    ts_daily.to_csv(os.path.join(OUT_DIR, "timeseries_daily_per_station.csv"), index=False)
+    ts_daily = warehouse.daily_sales_per_station(wh) if wh else timeseries_by_station(joined)
+    write_output(ts_daily, "timeseries_daily_per_station", fmt=output_format, cache=cache)
+    station_days = station_matrix.load_or_build(ts_daily)
+    print(f"Station × day matrix: {station_days}")
 
     print("Building RFM (customer) table…")
-    rfm = rfm_by_customer(joined)
-    rfm.to_csv(os.path.join(OUT_DIR, "rfm_by_customer.csv"), index=False)
-
-    # ---------------- Recommendations (KMeans) ------------
-    print("Running KMeans location recommendations…")
-    recs = recommend_new_locations(joined, stations_df)
-    recs_out = pd.DataFrame([r.__dict__ for r in recs])
-    recs_csv = os.path.join(OUT_DIR, "recommendations_new_stations.csv")
+    rfm = warehouse.rfm_aggregates(wh) if wh else rfm_by_customer(joined)
+    write_output(rfm, "rfm_by_customer", fmt=output_format, cache=cache)
+
+    print("Computing station catchments…")
+    catchments = cache.run("station_catchments", (joined, stations_df),
+                           lambda: station_catchments(joined, stations_df))
+    write_output(catchments, "station_catchments", fmt=output_format, cache=cache)
+    write_catchment_geojson(catchments)
+
+    # ---------------- Recommendations ---------------------
+    if recommender == "coverage":
+        print("Running max-coverage site selection…")
+        recs = cache.run("coverage_recommendations", (joined, stations_df),
+                         lambda: recommend_coverage_sites(joined, stations_df))
+    else:
+        print("Running KMeans location recommendations…")
+        recs = cache.run("kmeans_recommendations", (joined, stations_df),
+                         lambda: recommend_new_locations(joined, stations_df))
+    recs_out = attach_catchment_stats(pd.DataFrame([r.__dict__ for r in recs]), catchments)
     if not recs_out.empty:
-        recs_out.to_csv(recs_csv, index=False)
-        print(f"Saved recommendations -> {recs_csv}")
+        recs_path = write_output(recs_out, "recommendations_new_stations", fmt=output_format, cache=cache)
+        print(f"Saved recommendations -> {recs_path}")
     else:
         print("No eligible recommendations found with current thresholds.")
 
     # Optional: Forecasting
     if _HAS_PROPHET:
         print("Prophet detected: forecasting 30 days per station…")
-        fc = prophet_forecast(ts_daily, horizon_days=30)
+        fc = cache.run("prophet_forecast", (ts_daily, 30), lambda: prophet_forecast(station_days, horizon_days=30),
+                       version="2")
         if not fc.empty:
-            fc.to_csv(os.path.join(OUT_DIR, "forecast_totalSales_per_station.csv"), index=False)
+            write_output(fc, "forecast_totalSales_per_station", fmt=output_format, cache=cache)
             print("Saved Prophet forecasts.")
         else:
             print("Forecast skipped (not enough data per station).")
@@ -570,12 +1350,12 @@ def main():
     # Optional: Churn
     ds = build_churn_dataset(joined, cutoff_days=30)
     if _HAS_XGB:
-        model, feat = train_churn_model(ds)
-        if model is not None:
-            print(f"Churn model trained with features: {feat}")
-            # You can serialize with joblib if desired.
-        else:
-            print("Churn training skipped (insufficient class balance or data).")
+        model, feat, status = ensure_churn_model(ds)
+        print(f"Churn model: {status}")
+        if model is not None and not ds.empty:
+            scores = score_churn(model, feat, ds)
+            write_output(scores, "churn_scores", fmt=output_format, cache=cache)
+            print(f"Scored churn for {len(scores)} customers.")
     else:
         print("XGBoost not installed — skipping churn model. (pip install xgboost)")
 
@@ -588,14 +1368,18 @@ def main():
         if WRITE_RECS_TO_FIRESTORE:
             print("No recs to write.")
 
+    print(cache.summary())
+    if isinstance(db, fake_firestore.FakeFirestore):
+        print(f"Fake Firestore I/O: {db.stats}")
+
     # Helpful topline summaries
     try:
         print("\n=== Topline ===")
-        by_type = joined.groupby("waterType")["totalPrice"].sum().sort_values(ascending=False)
+        by_type = joined.groupby("waterType", observed=True)["totalPrice"].sum().sort_values(ascending=False)
         print("Sales by waterType (PHP):")
         print(by_type.round(2))
 
-        by_station = joined.groupby(["stationOwnerId", "waterType"])["totalPrice"].sum() \
+        by_station = joined.groupby(["stationOwnerId", "waterType"], observed=True)["totalPrice"].sum() \
                            .sort_values(ascending=False).head(10)
         print("\nTop 10 stations by sales:")
         print(by_station.round(2))
@@ -603,4 +1387,14 @@ def main():
         pass
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--format", choices=["parquet", "csv"], default=OUTPUT_FORMAT)
+    parser.add_argument("--source", choices=["firestore", "warehouse"], default="firestore")
+    parser.add_argument("--warehouse_path", type=str, default=warehouse.WAREHOUSE_PATH)
+    parser.add_argument("--recommender", choices=["kmeans", "coverage"], default=RECOMMENDER)
+    parser.add_argument("--no_cache", action="store_true",
+                        help="Recompute every stage instead of reusing out/stage_cache results")
+    args = parser.parse_args()
+    main(output_format=args.format, source=args.source, warehouse_path=args.warehouse_path,
+         recommender=args.recommender, use_cache=not args.no_cache)
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# anomaly.py
+# Online demand anomaly detection over daily refill liters.
+# - Constant-memory baselines per station and per district: EWMA mean /
+#   variance of refill liters per local day
+# - Fed from the per-station daily liters the demand scan already builds
+#   (service.py stream_refill_liters, or the warehouse's synced rows); district
+#   days are the sum of their stations, as in the demand rollups
+# - Days are folded in date order as soon as they are older than
+#   ANOMALY_SETTLE_DAYS (Pending orders on newer days may still complete);
+#   closed_through marks the last folded day, so re-read history is skipped.
+#   Days without orders count as 0 liters, so collapses are seen too
+# - A folded day whose z-score passes ANOMALY_Z raises an alert (once per
+#   spike / drop episode), written to Firestore demand_anomalies
+# - The baselines are checkpointed as a plain versioned JSON dict; a
+#   checkpoint of another version starts a fresh detector
+# Used by service.py.
+
+import json
+import math
+import os
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Mapping, Optional, Tuple
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+ANOMALY_COLLECTION = "demand_anomalies"
+ANOMALY_STATE_PATH = os.path.join("out", "checkpoints", "demand_anomaly.json")
+ANOMALY_STATE_VERSION = 2
+ANOMALY_SETTLE_DAYS = 2   # newest days left unfolded (re-read next run) while Pending orders complete
+EWMA_ALPHA = 0.1          # weight of the newest day (~1 week half-life)
+ANOMALY_Z = 3.0           # |liters - mean| / std that counts as anomalous
+MIN_HISTORY_DAYS = 14     # days folded into a baseline before it can alert
+MIN_STD_LITERS = 25.0     # std floor (one refill), keeps quiet series from alerting on noise
+MIN_DELTA_LITERS = 250.0  # ...and alerts also need |liters - mean| of at least 10 refills
+
+Key = Tuple[str, str]  # (level, entity): ("station", stationOwnerId) / ("district", districtName)
+DailyLiters = Mapping[str, Mapping[date, float]]  # stationOwnerId -> local date -> liters
+
+_STATE_KEYS = {"version", "closed_through", "baselines"}
+_BASELINE_KEYS = {"level", "entity", "mean", "var", "days", "episode"}
+
+
+@dataclass
+class DailyEwma:
+    mean: float = 0.0
+    var: float = 0.0
+    days: int = 0                    # days folded into mean/var
+    episode: Optional[str] = None    # "spike" / "drop" while the current anomaly lasts
+
+
+class DemandAnomalyDetector:
+    """
+    Per-key daily EWMA baselines, folded through closed_through (a local
+    date). Alerts collect in pending_alerts until take_alerts().
+    """
+
+    def __init__(self, alpha: float = EWMA_ALPHA, z: float = ANOMALY_Z,
+                 min_days: int = MIN_HISTORY_DAYS, min_std: float = MIN_STD_LITERS,
+                 min_delta: float = MIN_DELTA_LITERS):
+        self.alpha = alpha
+        self.z = z
+        self.min_days = min_days
+        self.min_std = min_std
+        self.min_delta = min_delta
+        self.stats: Dict[Key, DailyEwma] = {}
+        self.closed_through: Optional[date] = None
+        self.pending_alerts: List[dict] = []
+
+    # ----------------------------
+    # Folding days
+    # ----------------------------
+    def advance(self, station_daily_liters: DailyLiters,
+                station_districts: Mapping[str, Optional[str]], through: date) -> int:
+        """
+        Score and fold every day after closed_through up to `through`, in date
+        order, into the station and district baselines. New keys start at
+        their first day with liters. Returns the number of key-days folded.
+        """
+        after = self.closed_through
+        if after is not None and through <= after:
+            return 0
+        members: Dict[Key, List[str]] = defaultdict(list)
+        for sid in set(station_daily_liters) | set(station_districts):
+            members[("station", sid)].append(sid)
+            if station_districts.get(sid):
+                members[("district", station_districts[sid])].append(sid)
+        first: Dict[Key, date] = {}
+        for key, sids in members.items():
+            days = [d for s in sids for d in station_daily_liters.get(s, ())
+                    if (after is None or d > after) and d <= through]
+            if days:
+                first[key] = min(days)
+
+        keys = list(self.stats) + [k for k in first if k not in self.stats]
+        if not keys:
+            return 0
+        day = after + timedelta(days=1) if after is not None else min(first.values())
+        folded = 0
+        while day <= through:
+            for key in keys:
+                st = self.stats.get(key)
+                if st is None:
+                    if first[key] > day:
+                        continue
+                    st = self.stats[key] = DailyEwma()
+                sids = members.get(key) or ([key[1]] if key[0] == "station" else [])
+                liters = sum(float(station_daily_liters.get(s, {}).get(day, 0.0)) for s in sids)
+                self._fold(key, st, day, liters)
+                folded += 1
+            day += timedelta(days=1)
+        self.closed_through = through
+        return folded
+
+    def _fold(self, key: Key, st: DailyEwma, day: date, liters: float) -> None:
+        if st.days == 0:
+            st.mean, st.var, st.days = liters, 0.0, 1
+            return
+        if st.days >= self.min_days:
+            std = max(math.sqrt(st.var), self.min_std)
+            z = (liters - st.mean) / std
+            kind = None
+            if abs(liters - st.mean) >= self.min_delta:
+                kind = "spike" if z >= self.z else "drop" if z <= -self.z else None
+            if kind and kind != st.episode:
+                level, entity = key
+                self.pending_alerts.append({
+                    "level": level,
+                    "entity": entity,
+                    "day": day.isoformat(),
+                    "kind": kind,
+                    "liters": float(liters),
+                    "expected_liters": float(st.mean),
+                    "std_liters": float(std),
+                    "z": float(z),
+                })
+            st.episode = kind
+            if kind:  # fold anomalous days in clipped, so one spike doesn't inflate the variance for weeks
+                liters = st.mean + math.copysign(self.z * std, z)
+        # Incremental EWMA mean / variance
+        diff = liters - st.mean
+        incr = self.alpha * diff
+        st.mean += incr
+        st.var = (1.0 - self.alpha) * (st.var + diff * incr)
+        st.days += 1
+
+    def take_alerts(self) -> List[dict]:
+        alerts, self.pending_alerts = self.pending_alerts, []
+        return alerts
+
+    def baseline(self, level: str, entity: str) -> Optional[Dict[str, float]]:
+        st = self.stats.get((level, entity))
+        if st is None:
+            return None
+        return {"mean_liters": st.mean, "std_liters": math.sqrt(st.var), "days": st.days}
+
+    # ----------------------------
+    # Plain state (checkpoint)
+    # ----------------------------
+    def to_state(self) -> dict:
+        return {
+            "version": ANOMALY_STATE_VERSION,
+            "closed_through": self.closed_through.isoformat() if self.closed_through else None,
+            "baselines": [dict(level=level, entity=entity, **asdict(st))
+                          for (level, entity), st in self.stats.items()],
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> "DemandAnomalyDetector":
+        """Inverse of to_state(); ValueError on another version or unexpected keys."""
+        if not isinstance(state, dict) or set(state) != _STATE_KEYS:
+            raise ValueError("not a demand anomaly checkpoint")
+        if state["version"] != ANOMALY_STATE_VERSION:
+            raise ValueError(f"checkpoint version {state['version']!r}, expected {ANOMALY_STATE_VERSION}")
+        detector = cls()
+        if state["closed_through"]:
+            detector.closed_through = date.fromisoformat(state["closed_through"])
+        for row in state["baselines"]:
+            if set(row) != _BASELINE_KEYS:
+                raise ValueError(f"unexpected baseline fields {sorted(row)}")
+            detector.stats[(row["level"], row["entity"])] = DailyEwma(
+                float(row["mean"]), float(row["var"]), int(row["days"]), row["episode"])
+        return detector
+
+
+# ----------------------------
+# Checkpoint
+# ----------------------------
+def load_detector(path: str = ANOMALY_STATE_PATH) -> DemandAnomalyDetector:
+    """The checkpointed detector, or a fresh one (no checkpoint / unreadable / other version)."""
+    if path and os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return DemandAnomalyDetector.from_state(json.load(f))
+        except Exception as e:
+            print(f"Warning: ignoring anomaly checkpoint {path}, starting fresh baselines: {e}")
+    return DemandAnomalyDetector()
+
+
+def save_detector(detector: DemandAnomalyDetector, path: str = ANOMALY_STATE_PATH) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(detector.to_state(), f)
+    os.replace(tmp, path)
+
+
+# ----------------------------
+# Alerts
+# ----------------------------
+def save_alerts(db, alerts: List[dict], col=None, batch_size: int = 400) -> int:
+    """One doc per alert, id <level>_<entity>_<day> (rewriting an alert is idempotent)."""
+    if not alerts:
+        return 0
+    col = col or db.collection(ANOMALY_COLLECTION)
+    created_at = datetime.utcnow()
+    batch, pending = db.batch(), 0
+    for alert in alerts:
+        doc_id = f"{alert['level']}_{alert['entity']}_{alert['day']}".replace(" ", "_").replace("/", "_")
+        batch.set(col.document(doc_id), dict(alert, createdAt=created_at))
+        pending += 1
+        if pending >= batch_size:
+            batch.commit()
+            batch, pending = db.batch(), 0
+    if pending:
+        batch.commit()
+    return len(alerts)
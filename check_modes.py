@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# check_modes.py
+# Parity check: service.py's Firestore streaming path vs its warehouse path.
+# - Loads one NDJSON fixture (fake_firestore.FakeFirestore.dump_ndjson format)
+#   into the in-memory Firestore
+# - Runs fetch_data_firestore streaming from it, then again from a fresh
+#   warehouse synced from the same fixture
+# - Compares stations_df, every liters series and the demand rollup docs
+# Exits non-zero on any difference.
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import fake_firestore
+import service
+import warehouse
+
+OUTPUT_NAMES = ("stations_df", "overall_monthly_liters", "district_monthly_actual_liters",
+                "district_monthly_forecast_liters", "overall_monthly_forecast_current_year_liters",
+                "current_year", "station_daily_liters")
+
+
+def _plain(value):
+    """Nested defaultdicts → dicts, for comparison."""
+    if isinstance(value, dict):
+        return {k: _plain(v) for k, v in value.items()}
+    return value
+
+
+def _diff(name, a, b, rtol=1e-9):
+    """Human-readable differences between two outputs (empty list = equal)."""
+    if isinstance(a, pd.DataFrame):
+        a = a.sort_values(list(a.columns[:1])).reset_index(drop=True)
+        b = b.sort_values(list(b.columns[:1])).reset_index(drop=True)
+        if list(a.columns) != list(b.columns) or len(a) != len(b):
+            return [f"{name}: columns/rows differ: {list(a.columns)} × {len(a)} vs {list(b.columns)} × {len(b)}"]
+        out = []
+        for col in a.columns:
+            x, y = a[col], b[col]
+            if pd.api.types.is_numeric_dtype(x) and pd.api.types.is_numeric_dtype(y):
+                same = np.isclose(x.to_numpy(float), y.to_numpy(float), rtol=rtol, equal_nan=True)
+            else:
+                same = ((x.isna() & y.isna()) | (x.astype(object) == y.astype(object))).to_numpy()
+            if not same.all():
+                i = int(np.flatnonzero(~same)[0])
+                out.append(f"{name}.{col}: {int((~same).sum())} rows differ, e.g. {x.iat[i]!r} vs {y.iat[i]!r}")
+        return out
+    if isinstance(a, dict) and isinstance(b, dict):
+        out = []
+        for key in sorted(set(a) | set(b), key=repr):
+            if key not in a or key not in b:
+                out.append(f"{name}[{key!r}] only in {'warehouse' if key in b else 'firestore'} mode")
+            else:
+                out += _diff(f"{name}[{key!r}]", a[key], b[key], rtol)
+        return out
+    if isinstance(a, (float, int, np.floating)) and isinstance(b, (float, int, np.floating)):
+        return [] if np.isclose(a, b, rtol=rtol) else [f"{name}: {a!r} vs {b!r}"]
+    return [] if a == b else [f"{name}: {a!r} vs {b!r}"]
+
+
+def _rollup_summary(outputs):
+    docs = service.build_demand_rollups(outputs["station_daily_liters"], outputs["stations_df"])
+    return {doc_id: doc["total_m3"] for doc_id, doc in docs.items()}
+
+
+def compare_modes(fixtures_path: str) -> list:
+    """Differences between the two fetch_data_firestore paths on one fixture."""
+    db = fake_firestore.FakeFirestore()
+    db.load_ndjson(fixtures_path)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        streamed = dict(zip(OUTPUT_NAMES, service.fetch_data_firestore(db)))
+        conn = warehouse.connect(os.path.join(tmp, "warehouse.sqlite"))
+        warehouse.sync_from_firestore(conn, db)
+        from_warehouse = dict(zip(OUTPUT_NAMES, service.fetch_data_firestore(db, warehouse_conn=conn)))
+        conn.close()
+
+    diffs = []
+    for name in OUTPUT_NAMES:
+        diffs += _diff(name, _plain(streamed[name]), _plain(from_warehouse[name]))
+    diffs += _diff("demand_rollups", _rollup_summary(streamed), _rollup_summary(from_warehouse))
+    return diffs
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Compare Firestore and warehouse modes on one fixture")
+    parser.add_argument("fixtures", help="NDJSON fixture (see fake_firestore.py)")
+    args = parser.parse_args()
+
+    diffs = compare_modes(args.fixtures)
+    for line in diffs:
+        print(line)
+    if diffs:
+        sys.exit(f"{len(diffs)} difference(s) between firestore and warehouse modes.")
+    print("firestore and warehouse modes match.")
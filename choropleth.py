@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# choropleth.py
+# Compact district demand choropleth payloads for the admin UI.
+# - District polygons are split into shared arcs (TopoJSON style), so every
+#   boundary between two districts is simplified exactly once and neighbours
+#   stay gap/overlap free at every zoom tolerance
+# - Latest district demand / forecast / trend are attached as properties
+# - Written as quantized, delta-encoded TopoJSON and as rounded GeoJSON
+# Used by service.py.
+
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from shapely.geometry import LineString
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+DISTRICTS_GEOJSON = "iloilo_city_7_districts.geojson"
+CHOROPLETH_DIR = os.path.join("out", "choropleth")
+CHOROPLETH_COLLECTION = "district_choropleth"
+# Douglas-Peucker tolerance per zoom level, in degrees (1e-4° ≈ 11 m at Iloilo)
+ZOOM_TOLERANCES_DEG = {
+    "z11": 8e-4,
+    "z13": 2e-4,
+    "z15": 5e-5,
+}
+TOPOJSON_QUANTIZATION = 10000  # grid cells per axis
+GEOJSON_DECIMALS = 5  # ~1 m
+
+# Recommendation fields copied onto each district feature
+DEMAND_PROPERTIES = (
+    "district_total_m3",
+    "district_forecast_next_month_m3",
+    "district_forecast_12m_m3",
+    "district_trend",
+    "district_rank_by_next_month_demand",
+)
+
+Point = Tuple[float, float]
+Ring = List[Point]
+
+
+# ----------------------------
+# Load
+# ----------------------------
+def load_district_rings(path: str = DISTRICTS_GEOJSON) -> List[Tuple[str, List[List[Ring]]]]:
+    """[(district name, polygons)], each polygon a list of open rings (exterior first)."""
+    with open(path, "r", encoding="utf-8") as f:
+        gj = json.load(f)
+
+    districts = []
+    for feat in gj.get("features", []):
+        geom = feat.get("geometry") or {}
+        if geom.get("type") == "Polygon":
+            polys = [geom["coordinates"]]
+        elif geom.get("type") == "MultiPolygon":
+            polys = geom["coordinates"]
+        else:
+            continue
+        rings = [[[tuple(map(float, c[:2])) for c in ring] for ring in poly] for poly in polys]
+        # Drop the closing vertex; rings are implicitly closed below
+        rings = [[r[:-1] if len(r) > 1 and r[0] == r[-1] else r for r in poly] for poly in rings]
+        districts.append((feat.get("properties", {}).get("name"), rings))
+    return districts
+
+
+# ----------------------------
+# Topology: shared arcs
+# ----------------------------
+def _junctions(rings: Iterable[Ring]) -> set:
+    """Vertices where boundaries meet or diverge (seen with different neighbours)."""
+    neighbours: Dict[Point, set] = {}
+    junctions = set()
+    for ring in rings:
+        n = len(ring)
+        for i, p in enumerate(ring):
+            pair = frozenset((ring[i - 1], ring[(i + 1) % n]))
+            seen = neighbours.setdefault(p, pair)
+            if seen != pair:
+                junctions.add(p)
+    return junctions
+
+
+def build_topology(districts: Sequence[Tuple[str, List[List[Ring]]]]):
+    """
+    Split every ring into arcs between junctions and de-duplicate shared arcs.
+
+    Returns (arcs, geometries): arcs is a list of point lists; geometries holds,
+    per district, polygons → rings → arc refs, where ~i means arc i reversed
+    (TopoJSON convention).
+    """
+    all_rings = [ring for _, polys in districts for poly in polys for ring in poly]
+    junctions = _junctions(all_rings)
+
+    arcs: List[List[Point]] = []
+    arc_index: Dict[Tuple[Point, ...], int] = {}
+
+    def arc_ref(points: List[Point]) -> int:
+        key = tuple(points)
+        if key in arc_index:
+            return arc_index[key]
+        rkey = key[::-1]
+        if rkey in arc_index:
+            return ~arc_index[rkey]
+        arc_index[key] = len(arcs)
+        arcs.append(points)
+        return arc_index[key]
+
+    geometries = []
+    for _, polys in districts:
+        geom_polys = []
+        for poly in polys:
+            geom_rings = []
+            for ring in poly:
+                cuts = [i for i, p in enumerate(ring) if p in junctions]
+                if not cuts:
+                    # Canonical rotation so identical junction-free rings share one arc
+                    start = min(range(len(ring)), key=lambda i: ring[i])
+                    rotated = ring[start:] + ring[:start]
+                    geom_rings.append([arc_ref(rotated + [rotated[0]])])
+                    continue
+                rotated = ring[cuts[0]:] + ring[:cuts[0]]
+                offsets = [c - cuts[0] for c in cuts] + [len(ring)]
+                closed = rotated + [rotated[0]]
+                geom_rings.append([
+                    arc_ref(closed[a:b + 1]) for a, b in zip(offsets[:-1], offsets[1:])
+                ])
+            geom_polys.append(geom_rings)
+        geometries.append(geom_polys)
+    return arcs, geometries
+
+
+def simplify_arcs(arcs: List[List[Point]], tolerance: float) -> List[List[Point]]:
+    """Douglas-Peucker each arc once; endpoints (junctions) never move."""
+    simplified = []
+    for arc in arcs:
+        if tolerance <= 0 or len(arc) <= 2:
+            simplified.append(list(arc))
+            continue
+        line = LineString(arc).simplify(tolerance, preserve_topology=True)
+        simplified.append([tuple(c) for c in line.coords])
+    return simplified
+
+
+def _ring_points(ring_refs: List[int], arcs: List[List[Point]]) -> List[Point]:
+    points: List[Point] = []
+    for ref in ring_refs:
+        arc = arcs[ref] if ref >= 0 else arcs[~ref][::-1]
+        points.extend(arc if not points else arc[1:])
+    return points
+
+
+def _repair_collapsed(geometries, arcs, simplified):
+    """Restore the original arcs of any ring that simplified below a triangle."""
+    for geom_polys in geometries:
+        for geom_rings in geom_polys:
+            for ring_refs in geom_rings:
+                if len(set(_ring_points(ring_refs, simplified))) < 3:
+                    for ref in ring_refs:
+                        i = ref if ref >= 0 else ~ref
+                        simplified[i] = list(arcs[i])
+    return simplified
+
+
+# ----------------------------
+# Properties
+# ----------------------------
+def _round_value(v: Any) -> Any:
+    return round(float(v), 2) if isinstance(v, float) else v
+
+
+def district_properties(name: str, recommendations: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """Demand properties for one district (matched case-insensitively by name)."""
+    by_name = {str(r.get("district", "")).strip().lower(): r for r in recommendations}
+    rec = by_name.get(str(name).strip().lower())
+    props: Dict[str, Any] = {"name": name}
+    for key in DEMAND_PROPERTIES:
+        props[key] = _round_value(rec.get(key)) if rec else None
+    return props
+
+
+# ----------------------------
+# Encoders
+# ----------------------------
+def to_topojson(names, properties, geometries, arcs, quantization=TOPOJSON_QUANTIZATION) -> Dict[str, Any]:
+    """Quantized, delta-encoded TopoJSON topology with one 'districts' object."""
+    xs = [p[0] for arc in arcs for p in arc]
+    ys = [p[1] for arc in arcs for p in arc]
+    x0, y0 = min(xs), min(ys)
+    kx = (max(xs) - x0) / (quantization - 1) or 1.0
+    ky = (max(ys) - y0) / (quantization - 1) or 1.0
+
+    encoded_arcs = []
+    for arc in arcs:
+        q = [(int(round((x - x0) / kx)), int(round((y - y0) / ky))) for x, y in arc]
+        # Drop points that collapse onto the same grid cell (keep both endpoints)
+        kept = [q[0]] + [p for prev, p in zip(q[:-1], q[1:-1]) if p != prev] + [q[-1]] if len(q) > 1 else q
+        delta, px, py = [], 0, 0
+        for x, y in kept:
+            delta.append([x - px, y - py])
+            px, py = x, y
+        encoded_arcs.append(delta)
+
+    objects = []
+    for name, props, geom_polys in zip(names, properties, geometries):
+        if len(geom_polys) == 1:
+            objects.append({"type": "Polygon", "arcs": geom_polys[0], "properties": props})
+        else:
+            objects.append({"type": "MultiPolygon", "arcs": geom_polys, "properties": props})
+
+    return {
+        "type": "Topology",
+        "transform": {"scale": [kx, ky], "translate": [x0, y0]},
+        "objects": {"districts": {"type": "GeometryCollection", "geometries": objects}},
+        "arcs": encoded_arcs,
+    }
+
+
+def to_geojson(names, properties, geometries, arcs, decimals=GEOJSON_DECIMALS) -> Dict[str, Any]:
+    """GeoJSON FeatureCollection rebuilt from the (simplified) shared arcs."""
+    features = []
+    for name, props, geom_polys in zip(names, properties, geometries):
+        polys = []
+        for geom_rings in geom_polys:
+            rings = []
+            for ring_refs in geom_rings:
+                pts = [[round(x, decimals), round(y, decimals)] for x, y in _ring_points(ring_refs, arcs)]
+                rings.append([p for i, p in enumerate(pts) if i == 0 or p != pts[i - 1]])
+            polys.append(rings)
+        geometry = ({"type": "Polygon", "coordinates": polys[0]} if len(polys) == 1
+                    else {"type": "MultiPolygon", "coordinates": polys})
+        features.append({"type": "Feature", "properties": props, "geometry": geometry})
+    return {"type": "FeatureCollection", "features": features}
+
+
+def _dumps(obj: Dict[str, Any]) -> str:
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+# ----------------------------
+# Export stage
+# ----------------------------
+def build_choropleth_payloads(
+    recommendations: Sequence[Dict[str, Any]],
+    geojson_path: str = DISTRICTS_GEOJSON,
+    tolerances: Optional[Dict[str, float]] = None,
+) -> Dict[str, Dict[str, str]]:
+    """{zoom level: {"topojson": str, "geojson": str}} with demand properties attached."""
+    tolerances = tolerances or ZOOM_TOLERANCES_DEG
+    districts = load_district_rings(geojson_path)
+    names = [name for name, _ in districts]
+    properties = [district_properties(name, recommendations) for name in names]
+    arcs, geometries = build_topology(districts)
+
+    payloads = {}
+    for level, tol in tolerances.items():
+        simplified = _repair_collapsed(geometries, arcs, simplify_arcs(arcs, tol))
+        payloads[level] = {
+            "topojson": _dumps(to_topojson(names, properties, geometries, simplified)),
+            "geojson": _dumps(to_geojson(names, properties, geometries, simplified)),
+        }
+    return payloads
+
+
+def write_choropleth_payloads(payloads: Dict[str, Dict[str, str]], out_dir: str = CHOROPLETH_DIR) -> List[str]:
+    """Write districts_<level>.topojson / .geojson files; returns the written paths."""
+    os.makedirs(out_dir, exist_ok=True)
+    written = []
+    for level, formats in payloads.items():
+        for fmt, text in formats.items():
+            path = os.path.join(out_dir, f"districts_{level}.{fmt}")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+            written.append(path)
+    return written
+
+
+def save_choropleth_payloads(db, payloads: Dict[str, Dict[str, str]], col=None) -> None:
+    """One Firestore doc per zoom level holding the TopoJSON string (a few KB)."""
+    batch = db.batch()
+    col = col or db.collection(CHOROPLETH_COLLECTION)
+    for level, formats in payloads.items():
+        batch.set(col.document(level), {
+            "level": level,
+            "tolerance_deg": ZOOM_TOLERANCES_DEG.get(level),
+            "topojson": formats["topojson"],
+            "bytes": len(formats["topojson"].encode("utf-8")),
+            "updatedAt": datetime.utcnow(),
+        })
+    batch.commit()
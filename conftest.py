@@ -0,0 +1,67 @@
+# conftest.py
+# Shared pytest fixtures: small in-memory Firestore datasets (fake_firestore.py)
+# shaped like the app's station_owners / orders documents.
+
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+import fake_firestore
+
+DISTRICTS = ("City Proper", "Jaro", "La Paz", "Mandurriao")
+WATER_TYPES = ("Alkaline", "Mineral")
+
+
+def order_doc(created, station_id, refills=1, status="Completed", lat=10.72, lng=122.56,
+              customer_id="c0", price=110.0, updated=None):
+    """One orders doc; created/updated are datetimes (or ISO strings, like legacy docs)."""
+    doc = {
+        "createdAt": created,
+        "status": status,
+        "stationOwnerId": station_id,
+        "customerId": customer_id,
+        "totalPrice": price,
+        "customer_coords": {"lat": lat, "lng": lng},
+        "perStationMeta": {station_id: {"delivery_distance_m": 500.0}},
+        "items": [{"name": "Alkaline - Refill Water", "quantity": refills, "price": 25.0},
+                  {"name": "Delivery Fee", "quantity": 1, "price": 10.0}],
+    }
+    if updated is not None:
+        doc["updatedAt"] = updated
+    return doc
+
+
+def station_doc(i):
+    return {
+        "districtID": f"d{i % len(DISTRICTS)}",
+        "districtName": DISTRICTS[i % len(DISTRICTS)],
+        "waterType": WATER_TYPES[i % len(WATER_TYPES)],
+        "location": {"latitude": 10.70 + 0.01 * (i % 7), "longitude": 122.55 + 0.01 * (i % 5)},
+    }
+
+
+def populate(db, n_stations=8, n_orders=600, days=120, seed=0,
+             start=datetime(2025, 1, 1, tzinfo=timezone.utc)):
+    """Add stations s0.. and orders o0.. spread over `days` days; every 5th createdAt is an ISO string."""
+    rng = np.random.default_rng(seed)
+    for i in range(n_stations):
+        db.collection("station_owners").document(f"s{i}").set(station_doc(i))
+    for i in range(n_orders):
+        created = start + timedelta(seconds=int(rng.integers(0, days * 86400)))
+        sid = f"s{int(rng.integers(0, n_stations))}"
+        doc = order_doc(created.isoformat() if i % 5 == 0 else created, sid,
+                        refills=int(rng.integers(1, 4)),
+                        lat=10.70 + float(rng.uniform(0, 0.06)), lng=122.52 + float(rng.uniform(0, 0.08)),
+                        customer_id=f"c{int(rng.integers(0, 50))}")
+        if i % 9 == 0:
+            doc["stationOwnerIds"] = [sid, f"s{(int(sid[1:]) + 1) % n_stations}"]
+            doc.pop("stationOwnerId")
+        db.collection("orders").document(f"o{i}").set(doc)
+    return db
+
+
+@pytest.fixture
+def fake_db():
+    """A FakeFirestore with populate()'s default dataset."""
+    return populate(fake_firestore.FakeFirestore())
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# demand_grid.py
+# Gridded customer demand surface over Iloilo City.
+# - Refill liters and order counts binned by customer location (customer_coords /
+#   shippingAddress, via the warehouse) into a fixed ~100 m lattice, one layer per month
+# - 3-D summed-area tables over (month, row, col): demand in any rectangle and
+#   month range is an 8-term lookup, a radius query one lookup per grid row
+# - Rebuilt incrementally: only the months warehouse syncs marked dirty (any
+#   upserted order, whichever sync leg read it) are re-binned
+# Used by service.py.
+
+import json
+import math
+import os
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+import warehouse
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+# (lat_min, lng_min, lat_max, lng_max): the 7 district polygons plus ~1 km margin
+GRID_BOUNDS = (10.670, 122.485, 10.790, 122.627)
+GRID_CELL_M = 100.0
+DEMAND_GRID_PATH = os.path.join("out", "demand_grid.npz")
+DEMAND_GRID_FORMAT = 2  # saved grids of another format are rebuilt from every month
+METERS_PER_DEG_LAT = 111320.0
+
+MonthSpec = Union[None, int, Tuple[int, int], Sequence[int]]
+
+
+class DemandGrid:
+    """
+    Dense (month, row, col) liters / order-count layers with lazily built
+    summed-area tables. Rows run south→north, cols west→east; months are
+    yyyymm ints kept sorted.
+    """
+
+    def __init__(self, bounds: Tuple[float, float, float, float] = GRID_BOUNDS, cell_m: float = GRID_CELL_M):
+        self.bounds = tuple(float(b) for b in bounds)
+        self.cell_m = float(cell_m)
+        lat_min, lng_min, lat_max, lng_max = self.bounds
+        mid_lat = math.radians((lat_min + lat_max) / 2)
+        self.dlat = self.cell_m / METERS_PER_DEG_LAT
+        self.dlng = self.cell_m / (METERS_PER_DEG_LAT * math.cos(mid_lat))
+        self.n_rows = int(math.ceil((lat_max - lat_min) / self.dlat))
+        self.n_cols = int(math.ceil((lng_max - lng_min) / self.dlng))
+
+        self.months = []
+        self.liters = np.zeros((0, self.n_rows, self.n_cols))
+        self.orders = np.zeros((0, self.n_rows, self.n_cols))
+        self._tables = None
+
+    # ----------------------------
+    # Binning
+    # ----------------------------
+    def cell_index(self, lat, lng) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(rows, cols, inside) for arrays of coordinates; rows/cols are clipped."""
+        lat = np.asarray(lat, dtype=float)
+        lng = np.asarray(lng, dtype=float)
+        rows = np.floor((lat - self.bounds[0]) / self.dlat).astype(np.int64, copy=False)
+        cols = np.floor((lng - self.bounds[1]) / self.dlng).astype(np.int64, copy=False)
+        inside = (rows >= 0) & (rows < self.n_rows) & (cols >= 0) & (cols < self.n_cols)
+        return np.clip(rows, 0, self.n_rows - 1), np.clip(cols, 0, self.n_cols - 1), inside
+
+    def _ensure_months(self, months: Iterable[int]) -> None:
+        new = sorted(set(int(m) for m in months) - set(self.months))
+        if not new:
+            return
+        merged = sorted(self.months + new)
+        pos = [merged.index(m) for m in self.months]
+        liters = np.zeros((len(merged), self.n_rows, self.n_cols))
+        orders = np.zeros_like(liters)
+        liters[pos], orders[pos] = self.liters, self.orders
+        self.months, self.liters, self.orders = merged, liters, orders
+
+    def set_months(self, months: Iterable[int], points: pd.DataFrame) -> int:
+        """
+        Replace the given month layers with the binned points
+        (customer_lat, customer_lng, yyyymm, liters). Returns points binned.
+        """
+        months = sorted(set(int(m) for m in months) | set(points["yyyymm"].astype(int)))
+        self._ensure_months(months)
+        idx = [bisect_left(self.months, m) for m in months]
+        self.liters[idx] = 0.0
+        self.orders[idx] = 0.0
+
+        rows, cols, inside = self.cell_index(points["customer_lat"].to_numpy(), points["customer_lng"].to_numpy())
+        layer = np.searchsorted(self.months, points["yyyymm"].to_numpy(dtype=np.int64))
+        np.add.at(self.liters, (layer[inside], rows[inside], cols[inside]),
+                  points["liters"].to_numpy(dtype=float)[inside])
+        np.add.at(self.orders, (layer[inside], rows[inside], cols[inside]), 1.0)
+        self._tables = None
+        return int(inside.sum())
+
+    def layer(self, yyyymm: int, metric: str = "liters") -> np.ndarray:
+        """One month's (rows, cols) surface (a view, not a copy)."""
+        return getattr(self, metric)[self.months.index(int(yyyymm))]
+
+    # ----------------------------
+    # Summed-area lookups
+    # ----------------------------
+    def _summed(self) -> Dict[str, np.ndarray]:
+        if self._tables is None:
+            tables = {}
+            for metric in ("liters", "orders"):
+                t = np.zeros((len(self.months) + 1, self.n_rows + 1, self.n_cols + 1))
+                t[1:, 1:, 1:] = getattr(self, metric).cumsum(0).cumsum(1).cumsum(2)
+                tables[metric] = t
+            self._tables = tables
+        return self._tables
+
+    def _month_span(self, months: MonthSpec) -> Tuple[int, int]:
+        """Half-open layer range for None (all), yyyymm, or an inclusive (start, end) pair."""
+        if months is None:
+            return 0, len(self.months)
+        if isinstance(months, (int, np.integer)):
+            months = (months, months)
+        start, end = int(months[0]), int(months[-1])
+        return bisect_left(self.months, start), bisect_right(self.months, end)
+
+    @staticmethod
+    def _box(t: np.ndarray, m0, m1, r0, r1, c0, c1):
+        """Sum over [m0, m1) × [r0, r1) × [c0, c1); works elementwise on index arrays."""
+        return (t[m1, r1, c1] - t[m0, r1, c1] - t[m1, r0, c1] - t[m1, r1, c0]
+                + t[m0, r0, c1] + t[m0, r1, c0] + t[m1, r0, c0] - t[m0, r0, c0])
+
+    def rect_sum(self, lat_min: float, lng_min: float, lat_max: float, lng_max: float,
+                 months: MonthSpec = None) -> Dict[str, float]:
+        """Liters and orders in all cells whose center lies in the rectangle (O(1))."""
+        m0, m1 = self._month_span(months)
+        r0 = int(np.clip(math.ceil((lat_min - self.bounds[0]) / self.dlat - 0.5), 0, self.n_rows))
+        r1 = int(np.clip(math.floor((lat_max - self.bounds[0]) / self.dlat - 0.5) + 1, r0, self.n_rows))
+        c0 = int(np.clip(math.ceil((lng_min - self.bounds[1]) / self.dlng - 0.5), 0, self.n_cols))
+        c1 = int(np.clip(math.floor((lng_max - self.bounds[1]) / self.dlng - 0.5) + 1, c0, self.n_cols))
+        return {metric: float(self._box(t, m0, m1, r0, r1, c0, c1)) for metric, t in self._summed().items()}
+
+    def radius_sum(self, lat: float, lng: float, radius_m: float, months: MonthSpec = None) -> Dict[str, float]:
+        """
+        Liters and orders in all cells whose center lies within radius_m: one
+        summed-area lookup per grid row the circle spans (no per-order work).
+        """
+        m0, m1 = self._month_span(months)
+        r_center = (lat - self.bounds[0]) / self.dlat - 0.5
+        c_center = (lng - self.bounds[1]) / self.dlng - 0.5
+        r_cells = radius_m / self.cell_m
+        rows = np.arange(max(int(math.ceil(r_center - r_cells)), 0),
+                         min(int(math.floor(r_center + r_cells)), self.n_rows - 1) + 1)
+        if len(rows) == 0:
+            return {"liters": 0.0, "orders": 0.0}
+        half = np.sqrt(np.maximum(r_cells ** 2 - (rows - r_center) ** 2, 0.0))
+        c0 = np.clip(np.ceil(c_center - half), 0, self.n_cols).astype(np.int64)
+        c1 = np.clip(np.floor(c_center + half) + 1, 0, self.n_cols).astype(np.int64)
+        c1 = np.maximum(c1, c0)
+        return {
+            metric: float(self._box(t, m0, m1, rows, rows + 1, c0, c1).sum())
+            for metric, t in self._summed().items()
+        }
+
+    # ----------------------------
+    # Persistence
+    # ----------------------------
+    def save(self, path: str = DEMAND_GRID_PATH) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        meta = {"format": DEMAND_GRID_FORMAT, "bounds": self.bounds, "cell_m": self.cell_m, "months": self.months}
+        tmp = path + ".tmp.npz"
+        np.savez_compressed(tmp, liters=self.liters, orders=self.orders, meta=np.array(json.dumps(meta)))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str = DEMAND_GRID_PATH) -> "DemandGrid":
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta.get("format") != DEMAND_GRID_FORMAT:
+                raise ValueError(f"grid format {meta.get('format')!r}, expected {DEMAND_GRID_FORMAT}")
+            grid = cls(tuple(meta["bounds"]), meta["cell_m"])
+            grid.months = [int(m) for m in meta["months"]]
+            grid.liters, grid.orders = data["liters"], data["orders"]
+        return grid
+
+
+# ----------------------------
+# Build / incremental update
+# ----------------------------
+def update_from_warehouse(conn, path: Optional[str] = DEMAND_GRID_PATH,
+                          bounds=GRID_BOUNDS, cell_m: float = GRID_CELL_M) -> DemandGrid:
+    """
+    Load the saved grid (if it matches bounds/cell size), re-bin only the
+    warehouse's dirty months, save it back and clear them. A new grid bins
+    every month; with path=None the dirty months are left for the saved grid.
+    """
+    grid = None
+    if path and os.path.exists(path):
+        try:
+            grid = DemandGrid.load(path)
+            if grid.bounds != tuple(float(b) for b in bounds) or grid.cell_m != float(cell_m):
+                grid = None
+        except Exception as e:
+            print(f"Warning: could not load demand grid {path}: {e}")
+            grid = None
+    dirty = warehouse.dirty_months(conn)
+    months = dirty
+    if grid is None:
+        grid = DemandGrid(bounds, cell_m)
+        months = warehouse.order_months(conn)
+    if months:
+        points = warehouse.customer_demand_points(conn, months=months)
+        grid.set_months(months, points)
+    if path:
+        if months:
+            grid.save(path)
+        warehouse.clear_dirty_months(conn, dirty)
+    return grid
@@ -0,0 +1,556 @@
+#!/usr/bin/env python3
+# fake_firestore.py
+# In-memory stand-in for the Firestore client, for offline runs and I/O benchmarks.
+# - Implements the subset the scripts use: collection / document / subcollections,
+#   collection_group, where (==, !=, <, <=, >, >=, in, not-in, array-contains[-any]),
+#   order_by, limit, start_after, stream / get, set / update / delete, batch + commit
+# - Loaded from NDJSON fixtures: one {"path": "col/doc[/sub/doc...]", "data": {...}}
+#   per line; {"$timestamp": "<ISO 8601>"} values become tz-aware datetimes
+# - Configurable per-RPC latency and read/write throughput limits, with per-client
+#   RPC / document counters, to benchmark streaming, N+1 reads and write batching
+# - Selected with FIRESTORE_FIXTURES=<file.ndjson> (see client_from_env) by
+#   service.py, ai_analytics.py, insert.py and test_model.py.
+
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+FIXTURES_ENV = "FIRESTORE_FIXTURES"
+LATENCY_MS_ENV = "FIRESTORE_FAKE_LATENCY_MS"
+READ_DOCS_PER_S_ENV = "FIRESTORE_FAKE_READ_DOCS_PER_S"
+WRITE_DOCS_PER_S_ENV = "FIRESTORE_FAKE_WRITE_DOCS_PER_S"
+MAX_BATCH_WRITES = 500  # Firestore rejects larger batches
+STREAM_PAGE_SIZE = 300  # docs per simulated stream response (one round trip each)
+
+ASCENDING = "ASCENDING"
+DESCENDING = "DESCENDING"
+_MISSING = object()
+
+
+@dataclass
+class LatencyModel:
+    """Simulated network cost: a fixed round trip per RPC plus throughput caps."""
+    rpc_latency_s: float = 0.0
+    jitter_s: float = 0.0
+    read_docs_per_s: Optional[float] = None
+    write_docs_per_s: Optional[float] = None
+
+    def round_trip(self) -> None:
+        delay = self.rpc_latency_s + (random.uniform(0, self.jitter_s) if self.jitter_s else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def transfer(self, n_docs: int, write: bool = False) -> None:
+        rate = self.write_docs_per_s if write else self.read_docs_per_s
+        if rate and n_docs:
+            time.sleep(n_docs / rate)
+
+
+# ----------------------------
+# Values
+# ----------------------------
+def _decode(value: Any) -> Any:
+    if isinstance(value, dict):
+        if len(value) == 1 and "$timestamp" in value:
+            ts = datetime.fromisoformat(str(value["$timestamp"]).replace("Z", "+00:00"))
+            return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+        return {k: _decode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    return value
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, datetime):
+        ts = value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+        return {"$timestamp": ts.isoformat()}
+    if isinstance(value, dict):
+        return {k: _encode(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    return value
+
+
+def _copy(value: Any) -> Any:
+    """Deep copy of plain document data (dicts / lists / scalars)."""
+    if isinstance(value, dict):
+        return {k: _copy(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy(v) for v in value]
+    return value
+
+
+def _lookup(data: Dict[str, Any], field_path: str) -> Any:
+    cur: Any = data
+    for part in field_path.split("."):
+        if not isinstance(cur, dict) or part not in cur:
+            return _MISSING
+        cur = cur[part]
+    return cur
+
+
+def _compare(a: Any, op: str, b: Any) -> bool:
+    try:
+        if op == "==":
+            return a == b
+        if op == "!=":
+            return a != b and a is not None
+        if op == "<":
+            return a < b
+        if op == "<=":
+            return a <= b
+        if op == ">":
+            return a > b
+        if op == ">=":
+            return a >= b
+        if op == "in":
+            return a in b
+        if op == "not-in":
+            return a not in b and a is not None
+        if op == "array_contains" or op == "array-contains":
+            return isinstance(a, list) and b in a
+        if op == "array_contains_any" or op == "array-contains-any":
+            return isinstance(a, list) and any(v in a for v in b)
+    except TypeError:  # mixed types never match, as in Firestore
+        return False
+    raise ValueError(f"Unsupported operator {op!r}")
+
+
+# ----------------------------
+# Snapshots / references
+# ----------------------------
+class DocumentSnapshot:
+    def __init__(self, reference: "DocumentReference", data: Optional[Dict[str, Any]]):
+        self.reference = reference
+        self._data = data
+
+    @property
+    def id(self) -> str:
+        return self.reference.id
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return _copy(self._data) if self._data is not None else None
+
+    def get(self, field_path: str) -> Any:
+        value = _lookup(self._data or {}, field_path)
+        if value is _MISSING:
+            raise KeyError(field_path)
+        return _copy(value)
+
+
+class DocumentReference:
+    def __init__(self, client: "FakeFirestore", path: str):
+        self._client = client
+        self.path = path
+
+    @property
+    def id(self) -> str:
+        return self.path.rsplit("/", 1)[-1]
+
+    @property
+    def parent(self) -> "CollectionReference":
+        return CollectionReference(self._client, self.path.rsplit("/", 1)[0])
+
+    def collection(self, collection_id: str) -> "CollectionReference":
+        return CollectionReference(self._client, f"{self.path}/{collection_id}")
+
+    def collections(self) -> List["CollectionReference"]:
+        return [CollectionReference(self._client, p) for p in self._client._subcollections(self.path)]
+
+    def get(self) -> DocumentSnapshot:
+        self._client._rpc("get")
+        snap = DocumentSnapshot(self, self._client._read(self.path))
+        self._client._transfer(1 if snap.exists else 0)
+        return snap
+
+    def set(self, data: Dict[str, Any], merge: bool = False) -> None:
+        self._client._rpc("set")
+        self._client._apply([("set", self.path, data, merge)])
+
+    def update(self, data: Dict[str, Any]) -> None:
+        self._client._rpc("update")
+        self._client._apply([("update", self.path, data, False)])
+
+    def delete(self) -> None:
+        self._client._rpc("delete")
+        self._client._apply([("delete", self.path, None, False)])
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, DocumentReference) and other.path == self.path
+
+    def __hash__(self) -> int:
+        return hash(self.path)
+
+
+class Query:
+    def __init__(self, client: "FakeFirestore", collection_path: Optional[str] = None,
+                 group_id: Optional[str] = None, filters: Tuple = (), orders: Tuple = (),
+                 limit_n: Optional[int] = None, cursor: Optional[Tuple] = None):
+        self._client = client
+        self._collection_path = collection_path
+        self._group_id = group_id
+        self._filters = filters
+        self._orders = orders
+        self._limit = limit_n
+        self._cursor = cursor
+
+    def _with(self, **changes) -> "Query":
+        args = dict(collection_path=self._collection_path, group_id=self._group_id, filters=self._filters,
+                    orders=self._orders, limit_n=self._limit, cursor=self._cursor)
+        args.update(changes)
+        return Query(self._client, **args)
+
+    def where(self, field_path: Optional[str] = None, op_string: Optional[str] = None, value: Any = None,
+              filter=None) -> "Query":
+        if filter is not None:  # google.cloud.firestore FieldFilter
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._with(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path: str, direction: str = ASCENDING) -> "Query":
+        return self._with(orders=self._orders + ((field_path, str(direction).upper().startswith("DESC")),))
+
+    def limit(self, count: int) -> "Query":
+        return self._with(limit_n=int(count))
+
+    def start_after(self, document_fields_or_snapshot) -> "Query":
+        return self._with(cursor=("after", document_fields_or_snapshot))
+
+    def start_at(self, document_fields_or_snapshot) -> "Query":
+        return self._with(cursor=("at", document_fields_or_snapshot))
+
+    # -- evaluation --
+    def _sort_key(self, path: str, data: Dict[str, Any]) -> Tuple:
+        key = []
+        for field_path, _ in self._orders or (("__name__", False),):
+            key.append(path if field_path == "__name__" else _lookup(data, field_path))
+        return tuple(key)
+
+    def _cursor_key(self) -> Tuple:
+        _, value = self._cursor
+        orders = self._orders or (("__name__", False),)
+        if isinstance(value, DocumentSnapshot):
+            return self._sort_key(value.reference.path, value._data or {})
+        if isinstance(value, dict):
+            values = tuple(value.get(f) for f, _ in orders)
+        else:
+            values = tuple(value) if isinstance(value, (list, tuple)) else (value,)
+        # __name__ cursor values may be a DocumentReference or a plain document id
+        return tuple(self._name_path(v) if f == "__name__" else v for (f, _), v in zip(orders, values))
+
+    def _name_path(self, value: Any) -> Any:
+        if isinstance(value, DocumentReference):
+            return value.path
+        if isinstance(value, str) and "/" not in value and self._collection_path is not None:
+            return f"{self._collection_path}/{value}"
+        return value
+
+    def _matches(self) -> List[Tuple[str, Dict[str, Any]]]:
+        rows = self._client._scan(self._collection_path, self._group_id)
+        for field_path, op, value in self._filters:
+            rows = [(p, d) for p, d in rows
+                    if (v := (p.rsplit("/", 1)[-1] if field_path == "__name__" else _lookup(d, field_path)))
+                    is not _MISSING and _compare(v, op, value)]
+        orders = self._orders or (("__name__", False),)
+        # Ordering on a field excludes documents without it (as in Firestore)
+        rows = [(p, d) for p, d in rows
+                if all(f == "__name__" or _lookup(d, f) is not _MISSING for f, _ in orders)]
+        for i in reversed(range(len(orders))):  # stable multi-key sort
+            field_path, desc = orders[i]
+            rows.sort(key=lambda r: _SortValue(r[0] if field_path == "__name__" else _lookup(r[1], field_path)),
+                      reverse=desc)
+        if self._cursor is not None:
+            kind, _ = self._cursor
+            cur = tuple(_SortValue(v) for v in self._cursor_key())
+            descs = [d for _, d in orders]
+
+            def past(row):
+                key = tuple(_SortValue(v) for v in self._sort_key(*row))
+                for k, c, desc in zip(key, cur, descs):
+                    if k == c:
+                        continue
+                    return (k < c) if desc else (c < k)
+                return kind == "at"
+
+            rows = [r for r in rows if past(r)]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        return rows
+
+    def stream(self, transaction=None) -> Iterator[DocumentSnapshot]:
+        self._client._rpc("stream")
+        rows = self._matches()
+        for start in range(0, len(rows), STREAM_PAGE_SIZE):
+            if start:
+                self._client._latency.round_trip()
+            page = rows[start:start + STREAM_PAGE_SIZE]
+            self._client._transfer(len(page))
+            for path, data in page:
+                yield DocumentSnapshot(DocumentReference(self._client, path), data)
+
+    def get(self, transaction=None) -> List[DocumentSnapshot]:
+        return list(self.stream())
+
+
+class _SortValue:
+    """Total order over mixed Firestore values (null < bool < number < timestamp < string < other)."""
+    __slots__ = ("rank", "value")
+    _RANKS = ((type(None), 0), (bool, 1), (int, 2), (float, 2), (datetime, 3), (str, 4))
+
+    def __init__(self, value):
+        self.value = value
+        self.rank = next((r for t, r in self._RANKS if isinstance(value, t)), 5)
+
+    def _key(self):
+        return (self.rank, self.value if self.rank in (1, 2, 3, 4) else repr(self.value))
+
+    def __lt__(self, other):
+        return self._key() < other._key()
+
+    def __eq__(self, other):
+        return self._key() == other._key()
+
+
+class CollectionReference(Query):
+    def __init__(self, client: "FakeFirestore", path: str):
+        super().__init__(client, collection_path=path)
+        self.path = path
+
+    @property
+    def id(self) -> str:
+        return self.path.rsplit("/", 1)[-1]
+
+    @property
+    def parent(self) -> Optional[DocumentReference]:
+        if "/" not in self.path:
+            return None
+        return DocumentReference(self._client, self.path.rsplit("/", 1)[0])
+
+    def document(self, document_id: Optional[str] = None) -> DocumentReference:
+        return DocumentReference(self._client, f"{self.path}/{document_id or uuid.uuid4().hex[:20]}")
+
+    def add(self, data: Dict[str, Any], document_id: Optional[str] = None):
+        ref = self.document(document_id)
+        ref.set(data)
+        return datetime.now(timezone.utc), ref
+
+    def list_documents(self) -> List[DocumentReference]:
+        return [DocumentReference(self._client, p) for p, _ in self._client._scan(self.path, None)]
+
+
+class WriteBatch:
+    def __init__(self, client: "FakeFirestore"):
+        self._client = client
+        self._writes: List[Tuple[str, str, Any, bool]] = []
+
+    def _add(self, op: str, ref: DocumentReference, data, merge: bool) -> None:
+        if len(self._writes) >= MAX_BATCH_WRITES:
+            raise ValueError(f"Batch exceeds {MAX_BATCH_WRITES} writes")
+        self._writes.append((op, ref.path, data, merge))
+
+    def set(self, reference: DocumentReference, document_data: Dict[str, Any], merge: bool = False) -> "WriteBatch":
+        self._add("set", reference, document_data, merge)
+        return self
+
+    def update(self, reference: DocumentReference, field_updates: Dict[str, Any]) -> "WriteBatch":
+        self._add("update", reference, field_updates, False)
+        return self
+
+    def delete(self, reference: DocumentReference) -> "WriteBatch":
+        self._add("delete", reference, None, False)
+        return self
+
+    def commit(self) -> List[datetime]:
+        self._client._rpc("commit")
+        self._client._apply(self._writes)
+        now = datetime.now(timezone.utc)
+        results = [now] * len(self._writes)
+        self._writes = []
+        return results
+
+
+# ----------------------------
+# Client
+# ----------------------------
+class FakeFirestore:
+    """
+    Thread-safe in-memory Firestore. `stats` counts RPCs by kind plus documents
+    read / written, so N+1 patterns and write batching show up in the numbers.
+    """
+
+    def __init__(self, latency: Optional[LatencyModel] = None):
+        self._latency = latency or LatencyModel()
+        self._docs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {}
+
+    # -- public API --
+    def collection(self, path: str) -> CollectionReference:
+        return CollectionReference(self, path.strip("/"))
+
+    def document(self, path: str) -> DocumentReference:
+        return DocumentReference(self, path.strip("/"))
+
+    def collection_group(self, collection_id: str) -> Query:
+        return Query(self, group_id=collection_id)
+
+    def collections(self) -> List[CollectionReference]:
+        return [CollectionReference(self, p) for p in self._subcollections("")]
+
+    def batch(self) -> WriteBatch:
+        return WriteBatch(self)
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.stats = {}
+
+    # -- fixtures --
+    def load_ndjson(self, path: str) -> int:
+        """Add the documents of an NDJSON fixture (no simulated cost); returns docs loaded."""
+        n = 0
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                rec = json.loads(line)
+                doc_path = rec["path"].strip("/")
+                if doc_path.count("/") % 2 != 1:
+                    raise ValueError(f"{path}: {rec['path']!r} is not a document path")
+                self._docs[doc_path] = _decode(rec.get("data") or {})
+                n += 1
+        return n
+
+    def dump_ndjson(self, path: str) -> int:
+        """Write every document as an NDJSON fixture; returns docs written."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._lock:
+            items = sorted(self._docs.items())
+        with open(path, "w", encoding="utf-8") as f:
+            for doc_path, data in items:
+                f.write(json.dumps({"path": doc_path, "data": _encode(data)}, ensure_ascii=False, default=str) + "\n")
+        return len(items)
+
+    # -- internals --
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats[key] = self.stats.get(key, 0) + n
+
+    def _rpc(self, kind: str) -> None:
+        self._count("rpc")
+        self._count(f"rpc_{kind}")
+        self._latency.round_trip()
+
+    def _transfer(self, n_docs: int) -> None:
+        self._count("docs_read", n_docs)
+        self._latency.transfer(n_docs)
+
+    def _read(self, path: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            data = self._docs.get(path)
+            return _copy(data) if data is not None else None
+
+    def _scan(self, collection_path: Optional[str], group_id: Optional[str]) -> List[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            if group_id is not None:
+                return [(p, _copy(d)) for p, d in self._docs.items()
+                        if p.rsplit("/", 2)[-2] == group_id]
+            prefix = collection_path + "/"
+            return [(p, _copy(d)) for p, d in self._docs.items()
+                    if p.startswith(prefix) and "/" not in p[len(prefix):]]
+
+    def _subcollections(self, doc_path: str) -> List[str]:
+        prefix = doc_path + "/" if doc_path else ""
+        with self._lock:
+            found = {prefix + p[len(prefix):].split("/", 1)[0] for p in self._docs if p.startswith(prefix)}
+        return sorted(found)
+
+    def _apply(self, writes: Iterable[Tuple[str, str, Any, bool]]) -> None:
+        writes = list(writes)
+        with self._lock:
+            for op, path, data, merge in writes:
+                if op == "delete":
+                    self._docs.pop(path, None)
+                elif op == "update":
+                    if path not in self._docs:
+                        raise KeyError(f"No document to update: {path}")
+                    doc = self._docs[path]
+                    for field_path, value in data.items():
+                        parts = field_path.split(".")
+                        cur = doc
+                        for part in parts[:-1]:
+                            cur = cur.setdefault(part, {})
+                        cur[parts[-1]] = _copy(value)
+                elif merge and path in self._docs:
+                    _merge(self._docs[path], data)
+                else:
+                    self._docs[path] = _copy(data)
+        self._count("docs_written", len(writes))
+        self._latency.transfer(len(writes), write=True)
+
+
+def _merge(dst: Dict[str, Any], src: Dict[str, Any]) -> None:
+    for k, v in src.items():
+        if isinstance(v, dict) and isinstance(dst.get(k), dict):
+            _merge(dst[k], v)
+        else:
+            dst[k] = _copy(v)
+
+
+def export_ndjson(db, collections: Iterable[str], path: str) -> int:
+    """
+    Copy collections (with their subcollections) from any Firestore client —
+    e.g. a production read — into an NDJSON fixture. Returns docs written.
+    """
+    def walk(col):
+        for snap in col.stream():
+            yield snap.reference.path, snap.to_dict() or {}
+            for sub in snap.reference.collections():
+                yield from walk(sub)
+
+    n = 0
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for name in collections:
+            for doc_path, data in walk(db.collection(name)):
+                f.write(json.dumps({"path": doc_path, "data": _encode(data)}, ensure_ascii=False, default=str) + "\n")
+                n += 1
+    return n
+
+
+def client_from_env() -> Optional[FakeFirestore]:
+    """
+    A FakeFirestore loaded from $FIRESTORE_FIXTURES (comma-separated NDJSON files),
+    with latency from $FIRESTORE_FAKE_LATENCY_MS and throughput caps from
+    $FIRESTORE_FAKE_READ_DOCS_PER_S / $FIRESTORE_FAKE_WRITE_DOCS_PER_S; None when unset.
+    """
+    fixtures = os.environ.get(FIXTURES_ENV)
+    if not fixtures:
+        return None
+
+    def rate(name):
+        v = os.environ.get(name)
+        return float(v) if v else None
+
+    client = FakeFirestore(LatencyModel(
+        rpc_latency_s=float(os.environ.get(LATENCY_MS_ENV) or 0) / 1000.0,
+        read_docs_per_s=rate(READ_DOCS_PER_S_ENV),
+        write_docs_per_s=rate(WRITE_DOCS_PER_S_ENV),
+    ))
+    for path in fixtures.split(","):
+        if path.strip():
+            n = client.load_ndjson(path.strip())
+            print(f"Fake Firestore: loaded {n} docs from {path.strip()}")
+    return client
@@ -6,12 +6,17 @@ from firebase_admin import credentials, firestore
 from math import radians, cos, sin, asin, sqrt
 from collections import defaultdict
 
+import fake_firestore
+
 # ---------- Firebase init ----------
 KEY_PATH = "serviceAccountKey.json"   # adjust if needed
-cred = credentials.Certificate(KEY_PATH)
-if not firebase_admin._apps:
-    firebase_admin.initialize_app(cred)
-db = firestore.client()
+# $FIRESTORE_FIXTURES swaps in the in-memory fake (see fake_firestore.py)
+db = fake_firestore.client_from_env()
+if db is None:
+    cred = credentials.Certificate(KEY_PATH)
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(cred)
+    db = firestore.client()
 
 # ---------- helpers ----------
 def haversine(lat1, lon1, lat2, lon2):
@@ -268,3 +273,5 @@ def generate_orders_by_district(orders_per_district=10, empty_container_prob=0.2
 if __name__ == "__main__":
     # Example: 10 orders per district
     generate_orders_by_district(orders_per_district=1000)
+    if isinstance(db, fake_firestore.FakeFirestore):
+        print(f"Fake Firestore I/O: {db.stats}")
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# regions.py
+# Region (city) parameter sets for sharded demand / recommendation runs.
+# - A region = district polygon file + Firestore query filter (applied to the
+#   orders and station_owners scans) + output namespace (Firestore collections
+#   under regions/<namespace>/..., local files under out/regions/<namespace>/)
+# - Regions are listed in regions.json; without it the only region is the
+#   original single-city setup (Iloilo polygons, unfiltered scans, root outputs)
+# - run_regions() runs service.main for every region in parallel worker
+#   processes with a per-region run checkpoint, so a rerun only redoes the
+#   regions that did not finish
+# Used by service.py.
+
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import choropleth
+import demand_grid
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+REGIONS_PATH = "regions.json"
+REGIONS_COLLECTION = "regions"
+REGIONS_OUT_DIR = os.path.join("out", "regions")
+REGION_STATE_PATH = os.path.join("out", "region_run.json")
+REGION_WORKERS = min(4, os.cpu_count() or 1)
+GRID_MARGIN_DEG = 0.01  # ~1 km around the district polygons
+
+# regions.json example:
+# [
+#   {"name": "iloilo", "namespace": ""},
+#   {"name": "bacolod", "districts_geojson": "bacolod_city_districts.geojson",
+#    "filters": [["cityId", "==", "bacolod"]]}
+# ]
+
+
+@dataclass
+class Region:
+    name: str
+    districts_geojson: str = choropleth.DISTRICTS_GEOJSON
+    filters: List[Tuple[str, str, Any]] = field(default_factory=list)  # (field, op, value) on orders/station_owners
+    namespace: Optional[str] = None  # None = name; "" = root collections and paths
+    grid_bounds: Optional[Tuple[float, float, float, float]] = None  # None = polygon bounds + margin
+
+    def __post_init__(self):
+        if self.namespace is None:
+            self.namespace = self.name
+        self.filters = [tuple(f) for f in self.filters]
+        if self.grid_bounds is not None:
+            self.grid_bounds = tuple(float(b) for b in self.grid_bounds)
+
+    def query(self, db, name: str):
+        """Input collection `name` restricted by the region filter."""
+        query = db.collection(name)
+        for field_path, op, value in self.filters:
+            query = query.where(field_path, op, value)
+        return query
+
+    def collection(self, db, name: str):
+        """Output collection `name` inside the region namespace."""
+        if not self.namespace:
+            return db.collection(name)
+        return db.collection(REGIONS_COLLECTION).document(self.namespace).collection(name)
+
+    def path(self, path: str) -> str:
+        """Local output path inside the region namespace (out/... → out/regions/<namespace>/...)."""
+        if not self.namespace:
+            return path
+        rel = os.path.relpath(os.path.abspath(path), os.path.abspath("out"))
+        if rel.startswith(os.pardir):
+            rel = os.path.basename(path)
+        return os.path.join(REGIONS_OUT_DIR, self.namespace, rel)
+
+    def bounds(self) -> Tuple[float, float, float, float]:
+        """(lat_min, lng_min, lat_max, lng_max) for the demand grid."""
+        if self.grid_bounds is not None:
+            return self.grid_bounds
+        with open(self.districts_geojson, "r", encoding="utf-8") as f:
+            gj = json.load(f)
+        lngs, lats = [], []
+
+        def walk(coords):
+            if coords and isinstance(coords[0], (int, float)):
+                lngs.append(float(coords[0]))
+                lats.append(float(coords[1]))
+            else:
+                for c in coords:
+                    walk(c)
+
+        for feat in gj.get("features", []):
+            walk((feat.get("geometry") or {}).get("coordinates") or [])
+        return (min(lats) - GRID_MARGIN_DEG, min(lngs) - GRID_MARGIN_DEG,
+                max(lats) + GRID_MARGIN_DEG, max(lngs) + GRID_MARGIN_DEG)
+
+
+# Original single-city setup
+DEFAULT_REGION = Region(name="iloilo", namespace="", grid_bounds=demand_grid.GRID_BOUNDS)
+
+
+def load_regions(path: str = REGIONS_PATH) -> List[Region]:
+    if not os.path.exists(path):
+        return [DEFAULT_REGION]
+    with open(path, "r", encoding="utf-8") as f:
+        specs = json.load(f)
+    regions = [Region(**spec) for spec in specs]
+    names = [r.name for r in regions]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate region names in {path}: {names}")
+    return regions
+
+
+def get_region(name: Optional[str], path: str = REGIONS_PATH) -> Region:
+    if name is None:
+        return DEFAULT_REGION
+    for region in load_regions(path):
+        if region.name == name:
+            return region
+    raise ValueError(f"Unknown region {name!r} (see {path})")
+
+
+# ----------------------------
+# Per-region run checkpoints
+# ----------------------------
+def load_region_state(region: Region) -> Optional[Dict[str, Any]]:
+    path = region.path(REGION_STATE_PATH)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def save_region_state(region: Region, state: Dict[str, Any]) -> None:
+    path = region.path(REGION_STATE_PATH)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+
+# ----------------------------
+# Driver
+# ----------------------------
+def run_region(region: Region, run_id: str, main_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """Worker: service.main for one region; records done/failed in the region's run checkpoint."""
+    import service  # imported in the worker process
+
+    t0 = time.time()
+    state = {"region": region.name, "run_id": run_id, "started_at": datetime.utcnow().isoformat()}
+    try:
+        service.main(region=region, **main_kwargs)
+        state.update(status="done")
+    except Exception as e:
+        state.update(status="failed", error=f"{type(e).__name__}: {e}")
+    state.update(finished_at=datetime.utcnow().isoformat(), seconds=round(time.time() - t0, 2))
+    save_region_state(region, state)
+    return state
+
+
+def run_regions(regions: List[Region], run_id: Optional[str] = None, workers: int = REGION_WORKERS,
+                resume: bool = True, **main_kwargs) -> List[Dict[str, Any]]:
+    """
+    Run service.main for every region, `workers` regions at a time in separate
+    processes. With resume=True, regions whose checkpoint says they finished
+    this run_id (default: today's UTC date) are skipped.
+    """
+    run_id = run_id or datetime.utcnow().strftime("%Y-%m-%d")
+    pending = []
+    for region in regions:
+        state = load_region_state(region) if resume else None
+        if state and state.get("run_id") == run_id and state.get("status") == "done":
+            print(f"[{region.name}] already done for run {run_id}, skipping.")
+            continue
+        pending.append(region)
+    if not pending:
+        return []
+
+    states = []
+    workers = max(1, min(workers, len(pending)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_region, region, run_id, main_kwargs): region for region in pending}
+        for fut in as_completed(futures):
+            region = futures[fut]
+            try:
+                state = fut.result()
+            except Exception as e:  # worker process died
+                state = {"region": region.name, "run_id": run_id, "status": "failed",
+                         "error": f"{type(e).__name__}: {e}"}
+                save_region_state(region, state)
+            print(f"[{region.name}] {state['status']}"
+                  + (f" in {state['seconds']}s" if "seconds" in state else "")
+                  + (f": {state['error']}" if state.get("error") else ""))
+            states.append(state)
+    return states
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Run the demand & recommendation job for every region")
+    parser.add_argument("--regions_path", type=str, default=REGIONS_PATH)
+    parser.add_argument("--only", nargs="*", help="Region names to run (default: all)")
+    parser.add_argument("--workers", type=int, default=REGION_WORKERS)
+    parser.add_argument("--run_id", type=str, default=None)
+    parser.add_argument("--no_resume", action="store_true", help="Rerun regions already done for this run_id")
+    parser.add_argument("--mode", choices=["firestore", "warehouse"], default="firestore")
+    args = parser.parse_args()
+
+    selected = [r for r in load_regions(args.regions_path) if not args.only or r.name in args.only]
+    results = run_regions(selected, run_id=args.run_id, workers=args.workers,
+                          resume=not args.no_resume, mode=args.mode)
+    failed = [s["region"] for s in results if s["status"] != "done"]
+    if failed:
+        raise SystemExit(f"Failed regions: {', '.join(failed)}")
@@ -1,23 +1,63 @@
+import json
 import math
+import os
+import pickle
 import time
 import firebase_admin
 from firebase_admin import credentials, firestore
 import pandas as pd
 import numpy as np
 from sklearn.cluster import DBSCAN
+from sklearn.neighbors import NearestNeighbors
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
 import folium
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import argparse
 from datetime import datetime, timedelta, date
 from sklearn.linear_model import LinearRegression
 import calendar
 
-import matplotlib
-matplotlib.use("Agg")  # headless backend for servers (Render / Linux)
-import matplotlib.pyplot as plt
+import warehouse
+import choropleth
+import demand_grid
+import stage_cache
+import regions
+import fake_firestore
+import anomaly
 
 LITERS_PER_REFILL = 25  # 1 container = 25L
 LITERS_PER_M3 = 1000.0  # 1 cubic meter = 1000 liters
+LOCAL_TZ = "Asia/Manila"  # order dates/months are bucketed in local time
+
+# Order scan: cursor pagination + resumable checkpoint
+ORDERS_PAGE_SIZE = 500
+ORDERS_PAGE_RETRIES = 3
+SCAN_CHECKPOINT_PATH = os.path.join("out", "checkpoints", "orders_scan.pkl")
+SCAN_CHECKPOINT_MAX_AGE_HOURS = 24  # older checkpoints are ignored (fresh scan)
+
+# Forecast reconciliation (station → district → Overall)
+RECONCILE_METHODS = ("bottom_up", "top_down", "ols", "wls", "mint")
+RECONCILE_METHOD = "bottom_up"  # bottom_up keeps the historical station-sum behaviour
+
+# Customer demand around each recommended point (from the demand grid, warehouse mode)
+NEARBY_DEMAND_RADIUS_M = 1000
+
+# Chart-ready demand series for the admin app (client-side charts)
+CHART_SERIES_PATH = os.path.join("out", "demand_chart_series.json")
+CHARTS_COLLECTION = "demand_charts"
+
+# Columns of a district's station table that its DBSCAN recommendation depends on
+DISTRICT_STAGE_COLS = ['district_name', 'lat', 'lng', 'total_liters_history',
+                       'forecast_next_month_liters', 'forecast_12m_liters']
+
+# Station DBSCAN (haversine; eps in radians) + parameter sweep grid (eps in meters)
+EARTH_RADIUS_M = 6371000.0
+DBSCAN_EPS = 0.01
+DBSCAN_MIN_SAMPLES = 2
+DBSCAN_SWEEP_EPS_M = (100, 250, 500, 1000, 2000, 5000, 10000, 25000, 64000)
+DBSCAN_SWEEP_MIN_SAMPLES = (2, 3, 4, 5, 8)
 
 # -------------------------------
 # Debug helper
@@ -30,6 +70,10 @@ def log_step(msg: str):
 # Initialize Firebase Admin SDK
 # -------------------------------
 def init_firestore():
+    fake = fake_firestore.client_from_env()
+    if fake is not None:
+        log_step(f"Using in-memory Firestore from ${fake_firestore.FIXTURES_ENV}.")
+        return fake
     log_step("Initializing Firestore client...")
     cred = credentials.Certificate('ai-model/serviceaccount.json')
     try:
@@ -68,9 +112,9 @@ def classify_trend(total_m3: float, forecast_12m_m3: float) -> str:
 # -------------------------------
 # Save district recommendations (already ranked & with trend)
 # -------------------------------
-def save_recommendations(db, recommendations):
+def save_recommendations(db, recommendations, region=regions.DEFAULT_REGION):
     log_step("Saving district recommendations to Firestore...")
-    recs_ref = db.collection("station_recommendations")
+    recs_ref = region.collection(db, "station_recommendations")
     for rec in recommendations:
         rec['createdAt'] = datetime.utcnow()
         doc_id = rec['district'].replace(" ", "_")
@@ -80,7 +124,7 @@ def save_recommendations(db, recommendations):
 # -------------------------------
 # Save overall summary doc (with monthly trend)
 # -------------------------------
-def save_overall_summary(db, recommendations, monthly_trend_current_year):
+def save_overall_summary(db, recommendations, monthly_trend_current_year, region=regions.DEFAULT_REGION):
     if not recommendations:
         log_step("No recommendations to summarize for Overall.")
         return
@@ -109,199 +153,429 @@ def save_overall_summary(db, recommendations, monthly_trend_current_year):
         "createdAt": datetime.utcnow(),
     }
 
-    recs_ref = db.collection("station_recommendations")
+    recs_ref = region.collection(db, "station_recommendations")
     recs_ref.document("Overall").set(overall_doc)
     log_step("Saved Overall district summary document.")
 
 # -------------------------------
-# Fetch station + monthly demand
+# Helper: vectorized timestamp → local day
 # -------------------------------
-def fetch_data_firestore(db):
+def to_local_days(raw_values):
     """
-    Fetch station metadata and compute demand in LITERS (not sales).
+    Parse raw createdAt values (datetimes, ISO strings, Firestore timestamps) in one
+    vectorized pass and return LOCAL_TZ calendar days as datetime64[D] (NaT where unparseable).
+    """
+    raw = pd.Series(raw_values, dtype=object)
+    ts = pd.to_datetime(raw, utc=True, errors='coerce', format='ISO8601')
 
-    Demand is computed only from:
-      - orders where status == 'Completed'
-      - items inside each order whose name contains 'refill'
+    # Rare fallback: objects that only expose to_datetime() (e.g. protobuf timestamps)
+    leftover = ts.isna() & raw.notna()
+    if leftover.any():
+        fixed = raw[leftover].map(lambda v: v.to_datetime() if hasattr(v, 'to_datetime') else None)
+        ts[leftover] = pd.to_datetime(fixed, utc=True, errors='coerce')
 
-    Each such item contributes: item.quantity * 25L.
+    return ts.dt.tz_convert(LOCAL_TZ).dt.tz_localize(None).to_numpy().astype('datetime64[D]')
 
-    We build:
-      station_monthly_liters[station_id][month_start] = liters
-      overall_monthly_liters[month_start] = liters
+def _month_start(yyyymm):
+    return date(int(yyyymm) // 100, int(yyyymm) % 100, 1)
 
-    For each station, we then create:
-      - forecast_next_month_liters
-      - forecast_12m_liters
-      - monthly_forecast_current_year[month] (for trend line)
+def accumulate_liters(raw_created, liters, station_ids,
+                      station_monthly_liters, overall_monthly_liters, station_daily_liters=None):
     """
-    start_total = time.time()
-
-    stations_ref = db.collection('station_owners')
-    stations_data = []
+    Fold a batch of refill orders into the per-station and overall monthly liters
+    dicts (keyed by month-start date) and, if given, the per-station daily liters
+    dict (keyed by local date). Each station on an order gets the order's full
+    liters, as does the overall total once per station.
+    """
+    if not liters:
+        return
+    batch = pd.DataFrame({
+        'day': to_local_days(raw_created),
+        'liters': np.asarray(liters, dtype=float),
+        'sid': station_ids,
+    })
+    batch = batch.dropna(subset=['day']).explode('sid').dropna(subset=['sid'])
+    if batch.empty:
+        return
+    batch['yyyymm'] = batch['day'].dt.year * 100 + batch['day'].dt.month
 
-    log_step('Starting Firestore query for Completed orders...')
-    orders_ref = db.collection('orders').where('status', '==', 'Completed')
+    for (sid, ym), value in batch.groupby(['sid', 'yyyymm'])['liters'].sum().items():
+        station_monthly_liters[sid][_month_start(ym)] += float(value)
+    for ym, value in batch.groupby('yyyymm')['liters'].sum().items():
+        overall_monthly_liters[_month_start(ym)] += float(value)
+    if station_daily_liters is not None:
+        for (sid, day), value in batch.groupby(['sid', 'day'])['liters'].sum().items():
+            station_daily_liters[sid][day.date()] += float(value)
 
-    # Per-station monthly demand (liters)
-    station_monthly_liters = defaultdict(lambda: defaultdict(float))
-    # Overall monthly demand (liters) for graph (all years)
-    overall_monthly_liters = defaultdict(float)
+# -------------------------------
+# Fetch station + monthly demand
+# -------------------------------
+def parse_refill_order(order_dict):
+    """
+    (raw createdAt, liters, station_ids) for a Completed order with refill items,
+    or None if the order does not count toward demand.
+    """
+    # Double-check status, just in case
+    if order_dict.get('status') != "Completed":
+        return None
 
-    order_count = 0
-    loop_start = time.time()
-    for order in orders_ref.stream():
-        order_count += 1
-        if order_count % 200 == 0:
-            log_step(f"Processed {order_count} orders so far...")
+    # Count ONLY refill water items in this order
+    refill_units = 0
+    items = order_dict.get('items', [])
 
-        order_dict = order.to_dict()
+    for item in items:
+        item_name = str(item.get('name', '')).lower()
+        item_quantity = item.get('quantity', 0)
 
-        # Double-check status, just in case
-        if order_dict.get('status') != "Completed":
-            continue
+        # Only include items that are water refills
+        if "refill" in item_name:
+            try:
+                refill_units += float(item_quantity)
+            except (ValueError, TypeError):
+                pass
 
-        # Count ONLY refill water items in this order
-        refill_units = 0
-        items = order_dict.get('items', [])
+    # No refill water in this order → ignore
+    if refill_units <= 0:
+        return None
 
-        for item in items:
-            item_name = str(item.get('name', '')).lower()
-            item_quantity = item.get('quantity', 0)
+    # Convert refills to liters
+    liters = refill_units * LITERS_PER_REFILL
 
-            # Only include items that are water refills
-            if "refill" in item_name:
-                try:
-                    refill_units += float(item_quantity)
-                except (ValueError, TypeError):
-                    pass
+    # Some orders may have stationOwnerIds (array) or stationOwnerId (string)
+    station_ids = order_dict.get('stationOwnerIds') or order_dict.get('stationOwnerId') or []
+    if isinstance(station_ids, str):
+        station_ids = [station_ids]
 
-        # No refill water in this order → ignore
-        if refill_units <= 0:
-            continue
+    return order_dict.get('createdAt') or order_dict.get('created_at'), liters, station_ids
 
-        # Convert refills to liters
-        liters = refill_units * LITERS_PER_REFILL
-
-        # Get order date
-        created_at = order_dict.get('createdAt') or order_dict.get('created_at')
-        order_date = None
-        if isinstance(created_at, datetime):
-            order_date = created_at.date()
-        elif hasattr(created_at, 'to_datetime'):
-            order_date = created_at.to_datetime().date()
-        elif isinstance(created_at, str):
-            try:
-                order_date = datetime.fromisoformat(created_at).date()
-            except ValueError:
-                pass
+def _nested_liters(plain=None):
+    nested = defaultdict(lambda: defaultdict(float))
+    for key, series in (plain or {}).items():
+        nested[key].update(series)
+    return nested
 
-        if order_date is None:
-            continue
+def load_scan_checkpoint(path=SCAN_CHECKPOINT_PATH, max_age_hours=SCAN_CHECKPOINT_MAX_AGE_HOURS):
+    """Return the saved scan state if present and fresh enough, else None."""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+    except Exception as e:
+        log_step(f"Ignoring unreadable scan checkpoint {path}: {e}")
+        return None
+    if datetime.utcnow() - state['saved_at'] > timedelta(hours=max_age_hours):
+        log_step(f"Ignoring stale scan checkpoint from {state['saved_at']:%Y-%m-%d %H:%M} UTC.")
+        return None
+    return state
+
+def save_scan_checkpoint(path, last_doc_id, order_count,
+                         station_monthly_liters, overall_monthly_liters, station_daily_liters):
+    """Atomically persist the cursor and partial aggregates after a page."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    state = {
+        'saved_at': datetime.utcnow(),
+        'last_doc_id': last_doc_id,
+        'order_count': order_count,
+        'station_monthly_liters': {k: dict(v) for k, v in station_monthly_liters.items()},
+        'overall_monthly_liters': dict(overall_monthly_liters),
+        'station_daily_liters': {k: dict(v) for k, v in station_daily_liters.items()},
+    }
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
 
-        # Normalize to "month start" (e.g. 2025-11-01)
-        month_start = order_date.replace(day=1)
+def iter_order_pages(db, page_size=ORDERS_PAGE_SIZE, start_after_id=None, region=regions.DEFAULT_REGION):
+    """
+    Yield lists of the region's Completed order snapshots, page_size at a time,
+    ordered by document id and advanced with start_after(last snapshot). Only one
+    page is held in memory; each page fetch is retried a few times before giving up.
+    """
+    orders_col = db.collection('orders')
+    query = region.query(db, 'orders').where('status', '==', 'Completed').order_by('__name__')
+    cursor = orders_col.document(start_after_id).get() if start_after_id else None
+
+    while True:
+        page_query = query.limit(page_size)
+        if cursor is not None:
+            page_query = page_query.start_after(cursor)
+        for attempt in range(1, ORDERS_PAGE_RETRIES + 1):
+            try:
+                page = list(page_query.stream())
+                break
+            except Exception as e:
+                if attempt == ORDERS_PAGE_RETRIES:
+                    raise
+                log_step(f"Order page fetch failed ({e}); retry {attempt}/{ORDERS_PAGE_RETRIES - 1}...")
+                time.sleep(2 ** attempt)
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        cursor = page[-1]
+
+def stream_refill_liters(db, page_size=ORDERS_PAGE_SIZE, checkpoint_path=SCAN_CHECKPOINT_PATH,
+                         region=regions.DEFAULT_REGION):
+    """
+    Scan Completed orders from Firestore page by page and return
+    (station_monthly_liters, overall_monthly_liters, station_daily_liters);
+    monthly dicts are keyed by month start, the daily dict by local date.
+
+    After every page the cursor and partial aggregates are checkpointed to
+    checkpoint_path, so a restarted job resumes where the last one stopped.
+    The checkpoint is removed once the scan completes. Pass
+    checkpoint_path=None to disable checkpointing.
+    """
+    state = load_scan_checkpoint(checkpoint_path) if checkpoint_path else None
+    if state:
+        log_step(f"Resuming order scan after {state['last_doc_id']} "
+                 f"({state['order_count']} orders already processed)...")
+    else:
+        log_step('Starting Firestore query for Completed orders...')
+        state = {'last_doc_id': None, 'order_count': 0}
 
-        # Some orders may have stationOwnerIds (array) or stationOwnerId (string)
-        station_ids = order_dict.get('stationOwnerIds') or order_dict.get('stationOwnerId') or []
-        if isinstance(station_ids, str):
-            station_ids = [station_ids]
+    # Per-station monthly demand (liters)
+    station_monthly_liters = _nested_liters(state.get('station_monthly_liters'))
+    # Overall monthly demand (liters) for graph (all years)
+    overall_monthly_liters = defaultdict(float, state.get('overall_monthly_liters') or {})
+    # Per-station daily demand (liters) for the dashboard rollups
+    station_daily_liters = _nested_liters(state.get('station_daily_liters'))
 
-        for sid in station_ids:
-            station_monthly_liters[sid][month_start] += liters
-            overall_monthly_liters[month_start] += liters
+    order_count = state['order_count']
+    loop_start = time.time()
+    for page in iter_order_pages(db, page_size, start_after_id=state['last_doc_id'], region=region):
+        # Raw per-order columns for this page; timestamps are parsed in one pass per page
+        order_created = []
+        order_liters = []
+        order_station_ids = []
+        for order in page:
+            parsed = parse_refill_order(order.to_dict())
+            if parsed is None:
+                continue
+            created, liters, station_ids = parsed
+            order_created.append(created)
+            order_liters.append(liters)
+            order_station_ids.append(station_ids)
+
+        # Normalize timestamps to local days/months and aggregate, vectorized
+        accumulate_liters(order_created, order_liters, order_station_ids,
+                          station_monthly_liters, overall_monthly_liters, station_daily_liters)
+
+        order_count += len(page)
+        log_step(f"Processed {order_count} orders so far...")
+        if checkpoint_path:
+            save_scan_checkpoint(checkpoint_path, page[-1].id, order_count,
+                                 station_monthly_liters, overall_monthly_liters, station_daily_liters)
 
     log_step(f"Finished streaming orders. Total orders seen: {order_count}. "
              f"Loop time: {time.time() - loop_start:.2f}s")
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
 
-    # -------------------------------
-    # Forecast next month & 12 months per station (in liters)
-    # + monthly forecast for current year
-    # -------------------------------
+    return station_monthly_liters, overall_monthly_liters, station_daily_liters
+
+def warehouse_refill_liters(conn):
+    """Same result as stream_refill_liters, from the local warehouse's indexed SQL aggregates."""
+    station_monthly_liters = defaultdict(lambda: defaultdict(float))
+    overall_monthly_liters = defaultdict(float)
+    station_daily_liters = defaultdict(lambda: defaultdict(float))
+    monthly = warehouse.monthly_liters_per_station(conn)
+    for sid, ym, liters in monthly[['station_id', 'yyyymm', 'liters']].itertuples(index=False):
+        station_monthly_liters[sid][_month_start(ym)] += float(liters)
+    for ym, liters in monthly.groupby('yyyymm')['liters'].sum().items():
+        overall_monthly_liters[_month_start(ym)] += float(liters)
+    daily = warehouse.daily_liters_per_station(conn)
+    for sid, day, liters in daily[['station_id', 'local_date', 'liters']].itertuples(index=False):
+        station_daily_liters[sid][date.fromisoformat(day)] += float(liters)
+    return station_monthly_liters, overall_monthly_liters, station_daily_liters
+
+def read_station_rows(db, region=regions.DEFAULT_REGION):
+    """The region's station_owners docs as dicts: station_id, district_id, district_name, lat, lng, water_type."""
+    rows = []
+    for station in region.query(db, 'station_owners').stream():
+        station_dict = station.to_dict()
+        rows.append({
+            'station_id': station.id,
+            'district_id': station_dict.get('districtID'),
+            'district_name': station_dict.get('districtName'),
+            'lat': station_dict.get('location', {}).get('latitude'),
+            'lng': station_dict.get('location', {}).get('longitude'),
+            'water_type': station_dict.get('waterType'),
+        })
+    return rows
+
+def linear_trend_forecast(monthly_series, current_year_months):
+    """
+    Linear-trend forecast of one monthly liters series {month_start: liters}.
+
+    Returns (next_month, next_12m_total, current_year_monthly[12], residual_var).
+    Series with fewer than 3 months fall back to the mean monthly demand;
+    residual_var is NaN when it cannot be estimated.
+    """
+    if not monthly_series:
+        return 0.0, 0.0, np.zeros(len(current_year_months)), float('nan')
+
+    months_sorted = sorted(monthly_series.keys())
+    base_month = months_sorted[0]
+
+    # Feature: month index (0,1,2,…) relative to base month
+    X = np.array(
+        [(m.year - base_month.year) * 12 + (m.month - base_month.month)
+         for m in months_sorted],
+        dtype=float
+    ).reshape(-1, 1)
+    y = np.array([monthly_series[m] for m in months_sorted], dtype=float)
+
+    if len(X) >= 3:
+        model = LinearRegression()
+        model.fit(X, y)
+        residual_var = float(np.mean((y - model.predict(X)) ** 2))
+
+        last_index = (months_sorted[-1].year - base_month.year) * 12 + \
+                     (months_sorted[-1].month - base_month.month)
+
+        # === Next month forecast (liters) ===
+        forecast_next_month = float(model.predict(np.array([[last_index + 1]], dtype=float))[0])
+        forecast_next_month = max(0, forecast_next_month)
+
+        # === 12-month total forecast (liters) ===
+        future_indices = np.arange(last_index + 1, last_index + 13, dtype=float).reshape(-1, 1)
+        forecast_12m = float(np.clip(model.predict(future_indices), 0, None).sum())
+
+        # === Monthly forecast for current year (liters) ===
+        year_indices = np.array(
+            [(m.year - base_month.year) * 12 + (m.month - base_month.month) for m in current_year_months],
+            dtype=float
+        ).reshape(-1, 1)
+        current_year_monthly = np.clip(model.predict(year_indices), 0, None)
+    else:
+        # Not enough history → use mean monthly demand
+        mean_monthly = float(y.mean())
+        residual_var = float(y.var()) if len(y) > 1 else float('nan')
+        forecast_next_month = mean_monthly
+        forecast_12m = mean_monthly * 12
+        current_year_monthly = np.full(len(current_year_months), mean_monthly)
+
+    return forecast_next_month, forecast_12m, current_year_monthly, residual_var
+
+def forecast_stations(station_monthly_liters, current_year_months):
+    """
+    linear_trend_forecast for every station.
+
+    Returns (next_month, next_12m, monthly_current_year, residual_var) dicts keyed by station id.
+    """
     log_step("Starting per-station regression & forecasting...")
     station_forecast_next_month_liters = {}
     station_forecast_12m_liters = {}
     station_monthly_forecast_current_year = defaultdict(dict)
 
-    current_year = datetime.utcnow().year
-    current_year_months = [date(current_year, m, 1) for m in range(1, 13)]
-
+    station_forecast_var = {}
     station_counter = 0
     for station_id, monthly_series in station_monthly_liters.items():
         station_counter += 1
         if station_counter % 100 == 0:
             log_step(f"Processed regression for {station_counter} stations...")
 
-        if not monthly_series:
-            station_forecast_next_month_liters[station_id] = 0.0
-            station_forecast_12m_liters[station_id] = 0.0
-            for m in current_year_months:
-                station_monthly_forecast_current_year[station_id][m] = 0.0
-            continue
+        forecast_next_month, forecast_12m, current_year_monthly, residual_var = \
+            linear_trend_forecast(monthly_series, current_year_months)
 
-        months_sorted = sorted(monthly_series.keys())
-        base_month = months_sorted[0]
+        station_forecast_next_month_liters[station_id] = forecast_next_month
+        station_forecast_12m_liters[station_id] = forecast_12m
+        station_monthly_forecast_current_year[station_id] = dict(zip(current_year_months, current_year_monthly))
+        station_forecast_var[station_id] = residual_var
 
-        # Feature: month index (0,1,2,…) relative to base month
-        X = np.array(
-            [(m.year - base_month.year) * 12 + (m.month - base_month.month)
-             for m in months_sorted],
-            dtype=float
-        ).reshape(-1, 1)
-        y = np.array([monthly_series[m] for m in months_sorted], dtype=float)
+    log_step(f"Finished regression/forecasting for {station_counter} stations.")
+    return (
+        station_forecast_next_month_liters,
+        station_forecast_12m_liters,
+        station_monthly_forecast_current_year,
+        station_forecast_var,
+    )
 
-        if len(X) >= 3:
-            model = LinearRegression()
-            model.fit(X, y)
+def fetch_data_firestore(db, warehouse_conn=None, reconcile=RECONCILE_METHOD, cache=None,
+                         region=regions.DEFAULT_REGION, detector=None):
+    """
+    Fetch station metadata and compute demand in LITERS (not sales).
 
-            last_index = (months_sorted[-1].year - base_month.year) * 12 + \
-                         (months_sorted[-1].month - base_month.month)
+    Demand is computed only from:
+      - orders where status == 'Completed'
+      - items inside each order whose name contains 'refill'
 
-            # === Next month forecast (liters) ===
-            next_month_index = np.array([[last_index + 1]], dtype=float)
-            forecast_next_month = float(model.predict(next_month_index)[0])
-            forecast_next_month = max(0, forecast_next_month)
+    Each such item contributes: item.quantity * 25L.
 
-            # === 12-month total forecast (liters) ===
-            future_indices = np.arange(last_index + 1, last_index + 13, dtype=float).reshape(-1, 1)
-            preds = model.predict(future_indices)
-            preds = np.clip(preds, 0, None)
-            forecast_12m = float(preds.sum())
+    We build:
+      station_monthly_liters[station_id][month_start] = liters
+      overall_monthly_liters[month_start] = liters
 
-            # === Monthly forecast for current year (liters) ===
-            for m in current_year_months:
-                idx = (m.year - base_month.year) * 12 + (m.month - base_month.month)
-                pred = float(model.predict(np.array([[idx]], dtype=float))[0])
-                station_monthly_forecast_current_year[station_id][m] = max(0, pred)
+    For each station, we then create:
+      - forecast_next_month_liters
+      - forecast_12m_liters
+      - monthly_forecast_current_year[month] (for trend line)
 
-        else:
-            # Not enough history → use mean monthly demand
-            mean_monthly = float(y.mean()) if len(y) > 0 else 0.0
-            forecast_next_month = mean_monthly
-            forecast_12m = mean_monthly * 12
+    If warehouse_conn is given, orders and stations are read from the local
+    warehouse (see warehouse.py) instead of being streamed from Firestore.
+    With a stage_cache.StageCache, per-station forecasts are reused while the
+    monthly series are unchanged. Firestore scans are restricted by the region's
+    filter and checkpoint into its namespace.
 
-            for m in current_year_months:
-                station_monthly_forecast_current_year[station_id][m] = mean_monthly
+    With an anomaly.DemandAnomalyDetector, the per-station daily liters are
+    folded into its baselines up to ANOMALY_SETTLE_DAYS before today (local
+    time); the caller saves its alerts and state (save_demand_anomalies).
+    """
+    start_total = time.time()
+    stations_data = []
 
-        station_forecast_next_month_liters[station_id] = forecast_next_month
-        station_forecast_12m_liters[station_id] = forecast_12m
+    if warehouse_conn is not None:
+        log_step('Reading monthly refill liters from local warehouse...')
+        station_monthly_liters, overall_monthly_liters, station_daily_liters = warehouse_refill_liters(warehouse_conn)
+        station_rows = warehouse.load_station_rows(warehouse_conn).to_dict('records')
+    else:
+        # station_owners does not depend on the order scan: read it concurrently
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            station_rows_fut = pool.submit(read_station_rows, db, region)
+            station_monthly_liters, overall_monthly_liters, station_daily_liters = stream_refill_liters(
+                db, checkpoint_path=region.path(SCAN_CHECKPOINT_PATH), region=region)
+            station_rows = station_rows_fut.result()
+        log_step(f"Order scan + station_owners read finished in {time.time() - start_total:.2f}s.")
+
+    if detector is not None:
+        through = pd.Timestamp.now(tz=LOCAL_TZ).date() - timedelta(days=anomaly.ANOMALY_SETTLE_DAYS)
+        station_districts = {row['station_id']: row['district_name'] for row in station_rows}
+        folded = detector.advance(station_daily_liters, station_districts, through)
+        log_step(f"Anomaly baselines: {folded} station/district days scored through {through}, "
+                 f"{len(detector.pending_alerts)} new alert(s).")
 
-    log_step(f"Finished regression/forecasting for {station_counter} stations.")
+    # -------------------------------
+    # Forecast next month & 12 months per station (in liters)
+    # + monthly forecast for current year
+    # -------------------------------
+    current_year = datetime.utcnow().year
+    current_year_months = [date(current_year, m, 1) for m in range(1, 13)]
+
+    cache = cache or stage_cache.StageCache(enabled=False)
+    (
+        station_forecast_next_month_liters,
+        station_forecast_12m_liters,
+        station_monthly_forecast_current_year,
+        station_forecast_var,
+    ) = cache.run("station_forecasts", (station_monthly_liters, current_year_months),
+                  lambda: forecast_stations(station_monthly_liters, current_year_months))
 
     # -------------------------------
     # Build stations_df (liters stored, m³ shown in UI)
     # -------------------------------
     log_step("Building stations_df from station_owners collection...")
     station_docs_count = 0
-    for station in stations_ref.stream():
+    for row in station_rows:
         station_docs_count += 1
-        station_dict = station.to_dict()
-        station_id = station.id
-        district_id = station_dict.get('districtID')
-        district_name = station_dict.get('districtName')
-        lat = station_dict.get('location', {}).get('latitude')
-        lng = station_dict.get('location', {}).get('longitude')
-        water_type = station_dict.get('waterType')
+        station_id = row['station_id']
+        district_id = row['district_id']
+        district_name = row['district_name']
+        lat = row['lat']
+        lng = row['lng']
+        water_type = row['water_type']
 
         if pd.isna(lat) or pd.isna(lng):
             continue
@@ -330,33 +604,18 @@ def fetch_data_firestore(db):
     stations_df = pd.DataFrame(stations_data)
 
     # -------------------------------
-    # Build district & overall monthly actual + forecast (current year)
+    # Reconcile station / district / Overall forecasts and aggregate
+    # district & overall monthly actual + forecast (current year)
     # -------------------------------
-    log_step("Aggregating district & overall monthly actual + forecast (current year)...")
-    district_monthly_actual_liters = defaultdict(lambda: defaultdict(float))
-    district_monthly_forecast_liters = defaultdict(lambda: defaultdict(float))
-    overall_monthly_forecast_current_year_liters = defaultdict(float)
-
-    # Map station → district
-    station_to_district = {row['station_id']: row['district_name'] for row in stations_data}
-
-    # Actual (only current year)
-    for station_id, monthly_series in station_monthly_liters.items():
-        district_name = station_to_district.get(station_id)
-        if not district_name:
-            continue
-        for m, liters in monthly_series.items():
-            if m.year == current_year:
-                district_monthly_actual_liters[district_name][m] += liters
-
-    # Forecast (current year months)
-    for station_id, monthly_forecast in station_monthly_forecast_current_year.items():
-        district_name = station_to_district.get(station_id)
-        if not district_name:
-            continue
-        for m, liters in monthly_forecast.items():
-            district_monthly_forecast_liters[district_name][m] += liters
-            overall_monthly_forecast_current_year_liters[m] += liters
+    (
+        stations_df,
+        district_monthly_actual_liters,
+        district_monthly_forecast_liters,
+        overall_monthly_forecast_current_year_liters,
+    ) = reconcile_station_forecasts(
+        stations_df, station_monthly_liters, station_monthly_forecast_current_year,
+        station_forecast_var, current_year_months, method=reconcile,
+    )
 
     log_step(f"Finished fetch_data_firestore in {time.time() - start_total:.2f}s.")
     return (
@@ -366,17 +625,390 @@ def fetch_data_firestore(db):
         district_monthly_forecast_liters,
         overall_monthly_forecast_current_year_liters,
         current_year,
+        station_daily_liters,
     )
 
+# -------------------------------
+# Hierarchical forecast reconciliation (station → district → Overall)
+# -------------------------------
+def build_aggregation_matrix(station_districts):
+    """
+    Sparse aggregation matrix C for the station → district → Overall hierarchy.
+
+    Row 0 is Overall, rows 1.. are districts (sorted); column i is station i.
+    The full summing matrix is S = [C; I], so every aggregate is C @ bottom.
+    Returns (C as CSR, district names).
+    """
+    districts, district_idx = np.unique(np.asarray(station_districts, dtype=object), return_inverse=True)
+    n_bottom = len(district_idx)
+    rows = np.concatenate([np.zeros(n_bottom, dtype=int), district_idx + 1])
+    cols = np.concatenate([np.arange(n_bottom), np.arange(n_bottom)])
+    C = csr_matrix((np.ones(2 * n_bottom), (rows, cols)), shape=(len(districts) + 1, n_bottom))
+    return C, list(districts)
+
+def reconcile_forecasts(C, base_agg, base_bottom, method=RECONCILE_METHOD,
+                        var_agg=None, var_bottom=None, history_bottom=None):
+    """
+    Make base forecasts coherent with the hierarchy given by aggregation matrix C.
+
+    base_agg is (n_agg × h) for the C rows, base_bottom (n_bottom × h); every
+    column (horizon) is reconciled independently. Methods:
+      - bottom_up: aggregates are sums of the station forecasts
+      - top_down:  the Overall forecast is split by historical station shares
+                   (history_bottom, total liters per station)
+      - ols / wls / mint: trace-minimizing projection with diagonal weights W =
+                   identity / number of stations under each node / in-sample
+                   residual variances of each base forecast
+    For the projection methods, with r = base_agg - C @ base_bottom the coherence
+    gap, the bottom level moves by W_b C' (W_agg + C W_b C')^-1 r; that solve is
+    only (n_agg × n_agg), so cost stays linear in the number of stations.
+    Negative reconciled station forecasts are clipped to 0 before re-aggregating.
+
+    Returns (reconciled_agg, reconciled_bottom).
+    """
+    base_bottom = np.asarray(base_bottom, dtype=float)
+    n_agg, n_bottom = C.shape
+
+    if method == "bottom_up":
+        rec_bottom = base_bottom
+    elif method == "top_down":
+        history = np.asarray(history_bottom, dtype=float) if history_bottom is not None else np.zeros(n_bottom)
+        total = history.sum()
+        shares = history / total if total > 0 else np.full(n_bottom, 1.0 / max(n_bottom, 1))
+        rec_bottom = shares[:, None] * np.asarray(base_agg, dtype=float)[0][None, :]
+    elif method in ("ols", "wls", "mint"):
+        base_agg = np.asarray(base_agg, dtype=float)
+        structural_agg = np.asarray(C.sum(axis=1)).ravel()
+        if method == "ols":
+            w_agg, w_bottom = np.ones(n_agg), np.ones(n_bottom)
+        elif method == "wls":
+            w_agg, w_bottom = structural_agg, np.ones(n_bottom)
+        else:
+            # Residual variances; scale-free structural weights where they are unusable
+            w_agg = np.asarray(var_agg, dtype=float)
+            w_bottom = np.asarray(var_bottom, dtype=float)
+            typical = np.nanmedian(w_bottom[w_bottom > 0]) if np.any(w_bottom > 0) else 1.0
+            w_agg = np.where(np.isfinite(w_agg) & (w_agg > 0), w_agg, structural_agg * typical)
+            w_bottom = np.where(np.isfinite(w_bottom) & (w_bottom > 0), w_bottom, typical)
+
+        gap = base_agg - C @ base_bottom
+        system = (C.multiply(w_bottom[None, :]) @ C.T).toarray() + np.diag(w_agg)
+        multipliers = np.linalg.solve(system, gap)
+        rec_bottom = base_bottom + w_bottom[:, None] * (C.T @ multipliers)
+    else:
+        raise ValueError(f"Unknown reconciliation method: {method!r} (expected one of {RECONCILE_METHODS})")
+
+    rec_bottom = np.clip(rec_bottom, 0, None)
+    return C @ rec_bottom, rec_bottom
+
+def reconcile_station_forecasts(stations_df, station_monthly_liters, station_monthly_forecast_current_year,
+                                station_forecast_var, current_year_months, method=RECONCILE_METHOD):
+    """
+    Reconcile next-month, 12-month and current-year monthly forecasts over the
+    station → district → Overall hierarchy of stations_df, with district and
+    Overall base forecasts fitted directly on their aggregated history.
+
+    Returns (stations_df with reconciled forecast_*_liters,
+             district_monthly_actual_liters, district_monthly_forecast_liters,
+             overall_monthly_forecast_current_year_liters).
+    """
+    log_step(f"Reconciling station/district/Overall forecasts ({method})...")
+    district_monthly_actual_liters = defaultdict(lambda: defaultdict(float))
+    district_monthly_forecast_liters = defaultdict(lambda: defaultdict(float))
+    overall_monthly_forecast_current_year_liters = defaultdict(float)
+
+    if stations_df.empty:
+        return (stations_df, district_monthly_actual_liters, district_monthly_forecast_liters,
+                overall_monthly_forecast_current_year_liters)
+
+    in_hierarchy = stations_df['district_name'].notna() & (stations_df['district_name'] != '')
+    bottom = stations_df[in_hierarchy]
+    station_ids = bottom['station_id'].tolist()
+    C, districts = build_aggregation_matrix(bottom['district_name'].values)
+
+    # Station × month history matrix; aggregate histories are C @ history
+    months = sorted({m for sid in station_ids for m in station_monthly_liters.get(sid, {})})
+    month_pos = {m: j for j, m in enumerate(months)}
+    history = np.zeros((len(station_ids), len(months)))
+    for i, sid in enumerate(station_ids):
+        for m, liters in station_monthly_liters.get(sid, {}).items():
+            history[i, month_pos[m]] = liters
+    agg_history = C @ history
+
+    # Base forecasts: columns = [next month, next 12 months, current-year months...]
+    base_bottom = np.column_stack([
+        bottom['forecast_next_month_liters'].to_numpy(dtype=float),
+        bottom['forecast_12m_liters'].to_numpy(dtype=float),
+        np.array([[station_monthly_forecast_current_year.get(sid, {}).get(m, 0.0) for m in current_year_months]
+                  for sid in station_ids]).reshape(len(station_ids), len(current_year_months)),
+    ])
+    var_bottom = np.array([station_forecast_var.get(sid, np.nan) for sid in station_ids], dtype=float)
+
+    base_agg = np.zeros((C.shape[0], 2 + len(current_year_months)))
+    var_agg = np.full(C.shape[0], np.nan)
+    if method != "bottom_up":
+        for k in range(C.shape[0]):
+            series = {m: v for m, v in zip(months, agg_history[k]) if v > 0}
+            next_month, next_12m, current_year_monthly, residual_var = \
+                linear_trend_forecast(series, current_year_months)
+            base_agg[k] = np.concatenate([[next_month, next_12m], current_year_monthly])
+            var_agg[k] = residual_var
+
+    rec_agg, rec_bottom = reconcile_forecasts(
+        C, base_agg, base_bottom, method=method,
+        var_agg=var_agg, var_bottom=var_bottom, history_bottom=history.sum(axis=1),
+    )
+    if method != "bottom_up":
+        shift = np.abs(rec_agg[1:, 0] - base_agg[1:, 0])
+        log_step(f"Reconciled {len(districts)} districts; mean |district next-month shift| "
+                 f"{shift.mean() if len(shift) else 0.0:.1f} L, Overall next month "
+                 f"{base_agg[0, 0]:.1f} L → {rec_agg[0, 0]:.1f} L")
+
+    stations_df = stations_df.copy()
+    stations_df.loc[in_hierarchy, 'forecast_next_month_liters'] = rec_bottom[:, 0]
+    stations_df.loc[in_hierarchy, 'forecast_12m_liters'] = rec_bottom[:, 1]
+
+    # District actual (current year only) and reconciled current-year forecasts
+    current_year_pos = [(month_pos.get(m), j) for j, m in enumerate(current_year_months)]
+    for k, district_name in enumerate(districts, start=1):
+        for pos, j in current_year_pos:
+            if pos is not None and agg_history[k, pos] > 0:
+                district_monthly_actual_liters[district_name][current_year_months[j]] += float(agg_history[k, pos])
+            district_monthly_forecast_liters[district_name][current_year_months[j]] = float(rec_agg[k, 2 + j])
+    for j, m in enumerate(current_year_months):
+        overall_monthly_forecast_current_year_liters[m] = float(rec_agg[0, 2 + j])
+
+    return (stations_df, district_monthly_actual_liters, district_monthly_forecast_liters,
+            overall_monthly_forecast_current_year_liters)
+
+# -------------------------------
+# Multi-resolution demand rollups (dashboard)
+# -------------------------------
+ROLLUPS_COLLECTION = "demand_rollups"
+ROLLUP_LEVELS = [
+    # (level name, stations_df column; None = all stations)
+    ("station", "station_id"),
+    ("district", "district_name"),
+    ("waterType", "water_type"),
+    ("overall", None),
+]
+
+def _pack_f32(values):
+    return np.asarray(values, dtype='<f4').tobytes()
+
+def build_demand_rollups(station_daily_liters, stations_df):
+    """
+    Build the station/district/waterType/overall × day/week/month demand cube in one
+    pass over station-day liters. Returns {doc_id: doc}, one doc per entity per year,
+    with demand in m³ packed as little-endian float32 arrays:
+      daily_m3   [366] indexed by day of year - 1
+      weekly_m3  [53]  indexed by (day of year - 1) // 7
+      monthly_m3 [12]  indexed by month - 1
+    """
+    rows = [(sid, day, liters)
+            for sid, series in station_daily_liters.items()
+            for day, liters in series.items()]
+    if not rows:
+        return {}
+    df = pd.DataFrame(rows, columns=['station_id', 'day', 'liters'])
+    if not stations_df.empty:
+        meta = stations_df.drop_duplicates('station_id').set_index('station_id')[['district_name', 'water_type']]
+        df = df.join(meta, on='station_id')
+    else:
+        df['district_name'] = None
+        df['water_type'] = None
+
+    day = pd.to_datetime(df['day'])
+    year = day.dt.year.to_numpy()
+    doy = day.dt.dayofyear.to_numpy() - 1
+    month = day.dt.month.to_numpy() - 1
+    m3 = df['liters'].to_numpy(dtype=float) / LITERS_PER_M3
+
+    docs = {}
+    created_at = datetime.utcnow()
+    for level, col in ROLLUP_LEVELS:
+        entity = df[col].fillna('Unknown').astype(str) if col else pd.Series('Overall', index=df.index)
+        codes, keys = pd.factorize(pd.MultiIndex.from_arrays([entity, year]))
+        n = len(keys)
+        daily = np.zeros((n, 366))
+        weekly = np.zeros((n, 53))
+        monthly = np.zeros((n, 12))
+        np.add.at(daily, (codes, doy), m3)
+        np.add.at(weekly, (codes, doy // 7), m3)
+        np.add.at(monthly, (codes, month), m3)
+
+        for i, (name, yr) in enumerate(keys):
+            doc_id = f"{level}_{name}_{yr}".replace(" ", "_").replace("/", "_")
+            docs[doc_id] = {
+                "level": level,
+                "entity": name,
+                "year": int(yr),
+                "unit": "m3",
+                "encoding": "float32le",
+                "daily_m3": _pack_f32(daily[i]),
+                "weekly_m3": _pack_f32(weekly[i]),
+                "monthly_m3": _pack_f32(monthly[i]),
+                "total_m3": float(monthly[i].sum()),
+                "createdAt": created_at,
+            }
+    return docs
+
+def save_demand_rollups(db, docs, batch_size=400, region=regions.DEFAULT_REGION):
+    """Write rollup docs with batched commits (overwrite mode)."""
+    log_step(f"Saving {len(docs)} demand rollup docs to {ROLLUPS_COLLECTION}...")
+    col = region.collection(db, ROLLUPS_COLLECTION)
+    batch, pending = db.batch(), 0
+    for doc_id, doc in docs.items():
+        batch.set(col.document(doc_id), doc)
+        pending += 1
+        if pending >= batch_size:
+            batch.commit()
+            batch, pending = db.batch(), 0
+    if pending:
+        batch.commit()
+    log_step("Saved demand rollups.")
+
+def save_demand_anomalies(db, detector, region=regions.DEFAULT_REGION):
+    """Write the detector's new alerts to demand_anomalies, then checkpoint its baselines."""
+    written = anomaly.save_alerts(db, detector.take_alerts(), col=region.collection(db, anomaly.ANOMALY_COLLECTION))
+    anomaly.save_detector(detector, region.path(anomaly.ANOMALY_STATE_PATH))
+    log_step(f"Saved {written} demand anomaly alert(s); {len(detector.stats)} baselines checkpointed.")
+
 # -------------------------------
 # DBSCAN clustering + recommendation (district-level, saved in m³)
 # -------------------------------
-def dynamic_clustering(stations_df):
+def dynamic_clustering(stations_df, eps=DBSCAN_EPS, min_samples=DBSCAN_MIN_SAMPLES):
     locations = stations_df[['lat', 'lng']].values
-    clustering = DBSCAN(eps=0.01, min_samples=2, metric='haversine').fit(np.radians(locations))
+    clustering = DBSCAN(eps=eps, min_samples=min_samples, metric='haversine').fit(np.radians(locations))
     stations_df.loc[:, 'cluster'] = clustering.labels_
     return stations_df
 
+# -------------------------------
+# DBSCAN parameter sweep (precomputed neighbor graph)
+# -------------------------------
+def kdistance_elbow(kdist):
+    """
+    Elbow of a k-distance curve: the sorted point farthest from the chord joining
+    the curve's ends. Returns the k-distance there (same units as kdist).
+    """
+    curve = np.sort(np.asarray(kdist, dtype=float))
+    n = len(curve)
+    if n < 3 or curve[-1] == curve[0]:
+        return float(curve[-1]) if n else float('nan')
+    x = np.linspace(0.0, 1.0, n)
+    y = (curve - curve[0]) / (curve[-1] - curve[0])
+    # Distance to the diagonal y = x (up to a constant factor)
+    return float(curve[np.argmax(np.abs(x - y))])
+
+def _sweep_row(eps_m, min_samples, labels, elbow_m):
+    n = len(labels)
+    clustered = labels[labels >= 0]
+    sizes = np.bincount(clustered) if len(clustered) else np.zeros(0, dtype=int)
+    return {
+        'eps_m': float(eps_m),
+        'min_samples': int(min_samples),
+        'n_clusters': int(len(sizes)),
+        'noise_ratio': float((labels < 0).mean()) if n else 0.0,
+        'largest_cluster_share': float(sizes.max() / n) if len(sizes) else 0.0,
+        'kdist_elbow_m': elbow_m,
+    }
+
+def dbscan_sweep_district(coords_deg, eps_grid_m=DBSCAN_SWEEP_EPS_M,
+                          min_samples_grid=DBSCAN_SWEEP_MIN_SAMPLES):
+    """
+    Cluster one district's stations for every (eps, min_samples) in the grid.
+
+    The haversine radius-neighbor graph is built once at the largest eps. For a
+    given min_samples, with core distance c(p) = distance to the min_samples-th
+    neighbor (self included), a point is core at eps iff c(p) <= eps and two core
+    points are directly connected iff max(c(p), c(q), d(p, q)) <= eps. So each
+    edge is bucketed once by that value and clusters for increasing eps are grown
+    from the previous eps by merging only the edges of the new bucket. A border
+    point joins the cluster of the core neighbor minimizing max(c(q), d(p, q)).
+    Cluster count and noise match sklearn's DBSCAN exactly (border points within
+    reach of two clusters may resolve differently).
+
+    Returns a list of dicts with cluster count, noise ratio, largest-cluster
+    share and the k-distance elbow (meters) for k = min_samples.
+    """
+    X = np.radians(np.asarray(coords_deg, dtype=float))
+    n = len(X)
+    eps_grid_m = sorted(eps_grid_m)
+    eps_grid_rad = np.asarray(eps_grid_m, dtype=float) / EARTH_RADIUS_M
+
+    nn = NearestNeighbors(radius=eps_grid_rad[-1], metric='haversine', algorithm='ball_tree').fit(X)
+    graph = nn.radius_neighbors_graph(X, mode='distance')  # self-edges included
+    row_start = graph.indptr[:-1]
+    rows = np.repeat(np.arange(n), np.diff(graph.indptr))
+    cols, dists = graph.indices, graph.data
+    # The graph is symmetric: one direction of each pair is enough for linking
+    upper = rows < cols
+    link_rows, link_cols, link_dists = rows[upper], cols[upper], dists[upper]
+
+    # k-distance (self counts as the first neighbor, as in DBSCAN's min_samples)
+    k_max = min(max(min_samples_grid), n)
+    kdist_all, _ = nn.kneighbors(X, n_neighbors=k_max)
+
+    rows_out = []
+    for min_samples in min_samples_grid:
+        if min_samples <= n:
+            core_dist = kdist_all[:, min_samples - 1]
+            elbow_m = kdistance_elbow(core_dist) * EARTH_RADIUS_M
+        else:
+            core_dist = np.full(n, np.inf)
+            elbow_m = float('nan')
+
+        # Border reach: nearest-by-max(c(q), d) neighbor of every point
+        via = np.maximum(core_dist[cols], dists)
+        reach = np.minimum.reduceat(via, row_start)
+        first_hit = np.flatnonzero(via == reach[rows])
+        hit_rows, hit_at = np.unique(rows[first_hit], return_index=True)
+        anchor = np.empty(n, dtype=int)
+        anchor[hit_rows] = cols[first_hit[hit_at]]
+
+        # Bucket core-core edges by the eps at which they connect
+        link = np.maximum(core_dist[link_rows], core_dist[link_cols])
+        np.maximum(link, link_dists, out=link)
+        bucket = np.searchsorted(eps_grid_rad, link, side='left').astype(np.int8)
+
+        component = np.arange(n)
+        for j, eps_m in enumerate(eps_grid_m):
+            new_edges = np.flatnonzero(bucket == j)
+            if len(new_edges):
+                merged = csr_matrix((np.ones(len(new_edges), dtype=np.int8),
+                                     (component[link_rows[new_edges]], component[link_cols[new_edges]])),
+                                    shape=(n, n))
+                _, relabel = connected_components(merged, directed=False)
+                component = relabel[component]
+
+            eps = eps_grid_rad[j]
+            core = core_dist <= eps
+            labels = np.full(n, -1, dtype=int)
+            if core.any():
+                _, labels[core] = np.unique(component[core], return_inverse=True)
+                border = ~core & (reach <= eps)
+                labels[border] = labels[anchor[border]]
+            rows_out.append(_sweep_row(eps_m, min_samples, labels, elbow_m))
+
+    return sorted(rows_out, key=lambda r: (r['eps_m'], min_samples_grid.index(r['min_samples'])))
+
+def dbscan_parameter_sweep(stations_df, eps_grid_m=DBSCAN_SWEEP_EPS_M,
+                           min_samples_grid=DBSCAN_SWEEP_MIN_SAMPLES):
+    """Per-district DBSCAN sweep table (one row per district × eps × min_samples)."""
+    log_step(f"DBSCAN sweep: {len(eps_grid_m)} eps × {len(min_samples_grid)} min_samples per district...")
+    sweep_start = time.time()
+    frames = []
+    for district_name, district_df in stations_df.dropna(subset=['lat', 'lng']).groupby('district_name'):
+        if len(district_df) < 2:
+            continue
+        rows = dbscan_sweep_district(district_df[['lat', 'lng']].values, eps_grid_m, min_samples_grid)
+        frame = pd.DataFrame(rows)
+        frame.insert(0, 'district', district_name)
+        frame.insert(1, 'n_stations', len(district_df))
+        frames.append(frame)
+    log_step(f"DBSCAN sweep finished in {time.time() - sweep_start:.2f}s")
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
 def recommend_best_location_for_district(stations_df, district_name, range_radius=50):
     log_step(f"Running DBSCAN & recommendation for district: {district_name}...")
     district_df = stations_df[stations_df['district_name'] == district_name].copy()
@@ -450,56 +1082,145 @@ def recommend_best_location_for_district(stations_df, district_name, range_radiu
     }
 
 # -------------------------------
-# Plot overall monthly demand (for Federated view, in m³)
+# Chart-ready demand series (for Federated view, in m³)
 # -------------------------------
-def plot_overall_monthly_demand(overall_monthly_liters):
+def build_demand_chart_series(overall_monthly_liters, station_daily_liters=None, stations_df=None):
     """
-    Creates a PNG graph: overall_monthly_demand.png
-    - X-axis: months (YYYY-MM)
-    - Y-axis: total m³ per month (converted from liters)
+    Overall, per-district and per-year monthly demand in m³ on one shared month
+    axis, ready for client-side charting:
+      months               ["YYYY-MM", ...] (every month from first to last, gaps = 0)
+      overall_m3           [len(months)]
+      districts            {district: [len(months)]} (from station daily liters)
+      years                {"YYYY": {"monthly_m3": [12], "total_m3": x}}
+    Returns None when there is no demand.
     """
-    log_step("Generating overall_monthly_demand.png...")
     if not overall_monthly_liters:
-        log_step("No monthly demand data available for plotting.")
-        return
+        return None
+    first, last = min(overall_monthly_liters), max(overall_monthly_liters)
+    months = [d.date() for d in pd.date_range(first, last, freq='MS')]
+    month_pos = {m: j for j, m in enumerate(months)}
+    labels = [m.strftime("%Y-%m") for m in months]
+
+    overall = np.zeros(len(months))
+    for m, liters in overall_monthly_liters.items():
+        overall[month_pos[m]] += liters / LITERS_PER_M3
+
+    districts = {}
+    rows = [(sid, day, liters)
+            for sid, series in (station_daily_liters or {}).items()
+            for day, liters in series.items()]
+    if rows and stations_df is not None and not stations_df.empty:
+        df = pd.DataFrame(rows, columns=['station_id', 'day', 'liters'])
+        meta = stations_df.drop_duplicates('station_id').set_index('station_id')['district_name']
+        df['district'] = df['station_id'].map(meta).fillna('Unknown').astype(str)
+        df['month'] = pd.to_datetime(df['day']).dt.to_period('M').dt.to_timestamp().dt.date
+        df = df[df['month'].isin(list(month_pos))]
+        table = df.pivot_table(index='district', columns='month', values='liters', aggfunc='sum', fill_value=0.0)
+        table = table.reindex(columns=months, fill_value=0.0) / LITERS_PER_M3
+        districts = {name: values for name, values in zip(table.index, table.to_numpy())}
+
+    years = {}
+    for year in sorted({m.year for m in months}):
+        monthly = np.zeros(12)
+        for m, value in zip(months, overall):
+            if m.year == year:
+                monthly[m.month - 1] = value
+        years[str(year)] = {"monthly_m3": monthly, "total_m3": float(monthly.sum())}
 
-    months_sorted = sorted(overall_monthly_liters.keys())
-    # Convert liters → m³ for plotting
-    values_m3 = [overall_monthly_liters[m] / LITERS_PER_M3 for m in months_sorted]
-    labels = [m.strftime("%Y-%m") for m in months_sorted]
+    return {
+        "unit": "m3",
+        "months": labels,
+        "overall_m3": overall,
+        "districts": districts,
+        "years": years,
+        "generatedAt": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+    }
 
+def _rounded(values, decimals=3):
+    return [round(float(v), decimals) for v in values]
+
+def chart_series_json(series):
+    """Compact JSON text of build_demand_chart_series output (m³ rounded to the liter)."""
+    payload = {
+        "unit": series["unit"],
+        "months": series["months"],
+        "overall_m3": _rounded(series["overall_m3"]),
+        "districts": {name: _rounded(v) for name, v in series["districts"].items()},
+        "years": {y: {"monthly_m3": _rounded(v["monthly_m3"]), "total_m3": round(v["total_m3"], 3)}
+                  for y, v in series["years"].items()},
+        "generatedAt": series["generatedAt"],
+    }
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+
+def write_chart_series(series, path=CHART_SERIES_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    text = chart_series_json(series)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+    log_step(f"Saved chart series ({len(text) / 1024:.1f} KB) to {path}")
+
+def save_chart_series(db, series, region=regions.DEFAULT_REGION):
+    """One Firestore doc with the series packed as little-endian float32 arrays (district rows concatenated)."""
+    names = sorted(series["districts"])
+    years = sorted(series["years"])
+    n = len(series["months"])
+    doc = {
+        "unit": "m3",
+        "encoding": "float32le",
+        "months": series["months"],
+        "overall_m3": _pack_f32(series["overall_m3"]),
+        "district_names": names,
+        "district_m3": _pack_f32(np.concatenate([series["districts"][d] for d in names]) if names else []),
+        "district_len": n,
+        "years": [int(y) for y in years],
+        "year_monthly_m3": _pack_f32(np.concatenate([series["years"][y]["monthly_m3"] for y in years])),
+        "year_total_m3": [series["years"][y]["total_m3"] for y in years],
+        "createdAt": datetime.utcnow(),
+    }
+    region.collection(db, CHARTS_COLLECTION).document("overall_monthly").set(doc)
+    log_step(f"Saved packed chart series to {CHARTS_COLLECTION}/overall_monthly.")
+
+def log_yearly_totals(series):
+    """Yearly totals and a previous vs current year comparison, for the job log."""
+    totals = {int(y): v["total_m3"] for y, v in series["years"].items()}
+    for year, total_m3 in sorted(totals.items()):
+        log_step(f"Year {year}: total demand ≈ {total_m3:.2f} m³")
+    current_year = datetime.utcnow().year
+    if current_year in totals and current_year - 1 in totals:
+        log_step(
+            f"Comparison: Year {current_year - 1} demand = {totals[current_year - 1]:.2f} m³, "
+            f"current year {current_year} demand = {totals[current_year]:.2f} m³"
+        )
+
+def plot_overall_monthly_demand(series, path="overall_monthly_demand.png"):
+    """
+    Optional PNG export of the overall chart series (matplotlib is only imported here):
+    - X-axis: months (YYYY-MM)
+    - Y-axis: total m³ per month
+    """
+    import matplotlib
+    matplotlib.use("Agg")  # headless backend for servers (Render / Linux)
+    import matplotlib.pyplot as plt
+
+    log_step(f"Generating {path}...")
     plt.figure(figsize=(10, 5))
-    plt.plot(labels, values_m3, marker='o')
+    plt.plot(series["months"], series["overall_m3"], marker='o')
     plt.xticks(rotation=45, ha='right')
     plt.xlabel("Month")
     plt.ylabel("Total demand (m³)")
     plt.title("Overall Monthly Water Demand (All Stations) in m³")
     plt.tight_layout()
-    plt.savefig("overall_monthly_demand.png")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    plt.savefig(path)
     plt.close()
-    log_step("Saved demand trend graph to overall_monthly_demand.png")
-
-    # Print simple year comparison in m³ to help your explanation
-    current_year = datetime.utcnow().year
-    yearly_totals_m3 = defaultdict(float)
-    for month, liters in overall_monthly_liters.items():
-        yearly_totals_m3[month.year] += liters / LITERS_PER_M3
-
-    for year, total_m3 in sorted(yearly_totals_m3.items()):
-        log_step(f"Year {year}: total demand ≈ {total_m3:.2f} m³")
-
-    if len(yearly_totals_m3) >= 2 and current_year in yearly_totals_m3:
-        prev_year = current_year - 1
-        if prev_year in yearly_totals_m3:
-            log_step(
-                f"Comparison: Year {prev_year} demand = {yearly_totals_m3[prev_year]:.2f} m³, "
-                f"current year {current_year} demand = {yearly_totals_m3[current_year]:.2f} m³"
-            )
+    log_step(f"Saved demand trend graph to {path}")
 
 # -------------------------------
 # Visualization of stations + recommendations (map)
 # -------------------------------
-def visualize_stations(stations_df, recommendations):
+def visualize_stations(stations_df, recommendations, path="stations_recommendations_map.html"):
     log_step("Generating Folium map for stations & recommendations...")
     map_center = [stations_df['lat'].mean(), stations_df['lng'].mean()]
     m = folium.Map(location=map_center, zoom_start=12)
@@ -535,19 +1256,36 @@ def visualize_stations(stations_df, recommendations):
             icon=folium.Icon(color='red', icon='star')
         ).add_to(m)
 
-    m.save("stations_recommendations_map.html")
-    log_step("Map saved to stations_recommendations_map.html")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    m.save(path)
+    log_step(f"Map saved to {path}")
 
 # -------------------------------
 # Main
 # -------------------------------
-def main(mode="firestore", csv_path="synthetic_stations.csv"):
-    log_step("===== AI Demand & Recommendation job started =====")
+def main(mode="firestore", csv_path="synthetic_stations.csv", warehouse_path=warehouse.WAREHOUSE_PATH,
+         dbscan_sweep=False, reconcile=RECONCILE_METHOD, use_cache=True, region=None, png=False,
+         anomalies=True):
+    region = region or regions.DEFAULT_REGION
+    log_step(f"===== AI Demand & Recommendation job started (region {region.name}) =====")
     job_start = time.time()
+    cache = stage_cache.StageCache(root=region.path(stage_cache.STAGE_CACHE_DIR), enabled=use_cache)
 
     db = init_firestore()
 
-    if mode == "firestore":
+    demand_surface = None
+    if mode in ("firestore", "warehouse"):
+        detector = anomaly.load_detector(region.path(anomaly.ANOMALY_STATE_PATH)) if anomalies else None
+        warehouse_conn = None
+        if mode == "warehouse":
+            warehouse_path = region.path(warehouse_path)
+            log_step(f"Syncing local warehouse ({warehouse_path})...")
+            warehouse_conn = warehouse.connect(warehouse_path)
+            warehouse.sync_from_firestore(warehouse_conn, db, filters=region.filters)
+            demand_surface = demand_grid.update_from_warehouse(
+                warehouse_conn, path=region.path(demand_grid.DEMAND_GRID_PATH), bounds=region.bounds())
+            log_step(f"Demand grid: {demand_surface.n_rows}×{demand_surface.n_cols} cells, "
+                     f"{len(demand_surface.months)} monthly layers.")
         (
             stations_df,
             overall_monthly_liters,
@@ -555,7 +1293,17 @@ def main(mode="firestore", csv_path="synthetic_stations.csv"):
             district_monthly_forecast_liters,
             overall_monthly_forecast_current_year_liters,
             current_year,
-        ) = fetch_data_firestore(db)
+            station_daily_liters,
+        ) = fetch_data_firestore(db, warehouse_conn=warehouse_conn, reconcile=reconcile, cache=cache,
+                                 region=region, detector=detector)
+
+        log_step("Building multi-resolution demand rollups...")
+        rollup_docs = build_demand_rollups(station_daily_liters, stations_df)
+        if rollup_docs:
+            save_demand_rollups(db, rollup_docs, region=region)
+
+        if detector is not None:
+            save_demand_anomalies(db, detector, region=region)
     else:
         log_step("Running in CSV demo mode.")
         stations_df = pd.read_csv(csv_path)
@@ -564,6 +1312,19 @@ def main(mode="firestore", csv_path="synthetic_stations.csv"):
         district_monthly_forecast_liters = defaultdict(lambda: defaultdict(float))
         overall_monthly_forecast_current_year_liters = defaultdict(float)
         current_year = datetime.utcnow().year
+        station_daily_liters = {}
+
+    if dbscan_sweep:
+        sweep_df = cache.run("dbscan_sweep", stations_df[['district_name', 'lat', 'lng']],
+                             lambda: dbscan_parameter_sweep(stations_df))
+        sweep_path = region.path("dbscan_sweep.csv")
+        sweep_df.to_csv(sweep_path, index=False)
+        log_step(f"DBSCAN sweep table ({len(sweep_df)} rows) saved to {sweep_path}")
+        if not sweep_df.empty:
+            print(sweep_df.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+        log_step(cache.summary())
+        log_step(f"===== DBSCAN sweep finished in {time.time() - job_start:.2f}s =====")
+        return
 
     current_year_months = [date(current_year, m, 1) for m in range(1, 13)]
     today = datetime.utcnow().date()
@@ -572,12 +1333,20 @@ def main(mode="firestore", csv_path="synthetic_stations.csv"):
     log_step("Starting per-district DBSCAN + recommendation...")
     recommendations = []
     for district_name in stations_df['district_name'].dropna().unique():
-        rec = recommend_best_location_for_district(stations_df, district_name, range_radius=50)
+        district_rows = stations_df.loc[stations_df['district_name'] == district_name, DISTRICT_STAGE_COLS]
+        rec = cache.run("district_recommendation", (district_rows, 50, DBSCAN_EPS, DBSCAN_MIN_SAMPLES),
+                        lambda: recommend_best_location_for_district(stations_df, district_name, range_radius=50))
         if rec:
             recommendations.append(rec)
 
     log_step(f"Finished generating raw recommendations for {len(recommendations)} districts.")
 
+    if demand_surface is not None:
+        for rec in recommendations:
+            nearby = demand_surface.radius_sum(rec['lat'], rec['lng'], NEARBY_DEMAND_RADIUS_M)
+            rec['nearby_customer_demand_m3'] = nearby['liters'] / LITERS_PER_M3
+            rec['nearby_customer_orders'] = int(nearby['orders'])
+
     if recommendations:
         # ----- Add monthly trend map for each district (Option B: hybrid for current month) -----
         log_step("Building monthly_trend_current_year for each district...")
@@ -682,9 +1451,24 @@ def main(mode="firestore", csv_path="synthetic_stations.csv"):
                 "forecast_m3": forecast_m3,
             }
 
-        save_recommendations(db, recs_sorted)
-        save_overall_summary(db, recs_sorted, overall_monthly_trend_current_year)
-        visualize_stations(stations_df, recs_sorted)
+        save_recommendations(db, recs_sorted, region=region)
+        save_overall_summary(db, recs_sorted, overall_monthly_trend_current_year, region=region)
+
+        log_step("Exporting simplified district demand choropleth...")
+        choropleth_payloads = choropleth.build_choropleth_payloads(recs_sorted, geojson_path=region.districts_geojson)
+        choropleth.write_choropleth_payloads(choropleth_payloads, out_dir=region.path(choropleth.CHOROPLETH_DIR))
+        choropleth.save_choropleth_payloads(db, choropleth_payloads,
+                                            col=region.collection(db, choropleth.CHOROPLETH_COLLECTION))
+        log_step("Choropleth payloads: " + ", ".join(
+            f"{level} {len(p['topojson']) / 1024:.1f} KB" for level, p in choropleth_payloads.items()))
+        map_inputs = (
+            stations_df[['station_id', 'district_name', 'lat', 'lng', 'total_liters_history',
+                         'forecast_next_month_liters', 'forecast_12m_liters']],
+            [{k: rec[k] for k in ('district', 'lat', 'lng', 'explanation')} for rec in recs_sorted],
+        )
+        map_path = region.path("stations_recommendations_map.html")
+        cache.file("stations_map", map_inputs, map_path,
+                   lambda: visualize_stations(stations_df, recs_sorted, path=map_path))
 
         # Print summary lines (good for logs / thesis demo)
         log_step("Printing per-district summary to logs...")
@@ -699,14 +1483,44 @@ def main(mode="firestore", csv_path="synthetic_stations.csv"):
                 f"Recommended point: ({rec['lat']}, {rec['lng']})"
             )
 
-    # Create yearly/monthly demand graph for Federated admin (all years)
-    plot_overall_monthly_demand(overall_monthly_liters)
-
+    # Chart-ready yearly/monthly demand series for Federated admin (all years)
+    log_step("Building demand chart series...")
+    chart_series = build_demand_chart_series(overall_monthly_liters, station_daily_liters, stations_df)
+    if chart_series is None:
+        log_step("No monthly demand data available for charting.")
+    else:
+        write_chart_series(chart_series, path=region.path(CHART_SERIES_PATH))
+        save_chart_series(db, chart_series, region=region)
+        log_yearly_totals(chart_series)
+        if png:
+            png_path = region.path("overall_monthly_demand.png")
+            cache.file("overall_demand_png", (chart_series["months"], chart_series["overall_m3"]), png_path,
+                       lambda: plot_overall_monthly_demand(chart_series, path=png_path))
+
+    log_step(cache.summary())
+    if isinstance(db, fake_firestore.FakeFirestore):
+        log_step(f"Fake Firestore I/O: {db.stats}")
     log_step(f"===== AI job finished in {time.time() - job_start:.2f}s =====")
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument("--mode", choices=["firestore", "csv"], default="firestore")
+    parser.add_argument("--mode", choices=["firestore", "warehouse", "csv"], default="firestore")
     parser.add_argument("--csv_path", type=str, default="synthetic_stations.csv")
+    parser.add_argument("--warehouse_path", type=str, default=warehouse.WAREHOUSE_PATH)
+    parser.add_argument("--dbscan_sweep", action="store_true",
+                        help="Report per-district DBSCAN stats over an eps/min_samples grid and exit")
+    parser.add_argument("--reconcile", choices=RECONCILE_METHODS, default=RECONCILE_METHOD,
+                        help="How station/district/Overall forecasts are made coherent")
+    parser.add_argument("--no_cache", action="store_true",
+                        help="Recompute every stage instead of reusing out/stage_cache results")
+    parser.add_argument("--png", action="store_true",
+                        help="Also render overall_monthly_demand.png (needs matplotlib)")
+    parser.add_argument("--no_anomalies", action="store_true",
+                        help="Skip the online demand anomaly stage (demand_anomalies alerts)")
+    parser.add_argument("--region", type=str, default=None,
+                        help=f"Region name from {regions.REGIONS_PATH} (default: the original single city); "
+                             f"use regions.py to run all regions in parallel")
     args = parser.parse_args()
-    main(mode=args.mode, csv_path=args.csv_path)
+    main(mode=args.mode, csv_path=args.csv_path, warehouse_path=args.warehouse_path,
+         dbscan_sweep=args.dbscan_sweep, reconcile=args.reconcile, use_cache=not args.no_cache,
+         region=regions.get_region(args.region), png=args.png, anomalies=not args.no_anomalies)
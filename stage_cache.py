@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# stage_cache.py
+# Content-addressed cache for pipeline stage results.
+# - Each stage declares its inputs; the cache key is a hash of the stage name,
+#   its version and the inputs' content (DataFrames, arrays, dicts, dates...)
+# - Results are pickled under out/stage_cache/<stage>/<key>.pkl; file stages
+#   (map HTML, PNG, CSV) only record the hash of the file they produced and are
+#   skipped while that file is still on disk unchanged
+# - Size-capped: least recently used entries are evicted past STAGE_CACHE_MAX_BYTES
+# Used by service.py and ai_analytics.py.
+
+import dataclasses
+import hashlib
+import os
+import pickle
+from datetime import date, datetime
+from typing import Any, Callable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+STAGE_CACHE_DIR = os.path.join("out", "stage_cache")
+STAGE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+
+# ----------------------------
+# Fingerprints
+# ----------------------------
+def _feed(h, obj: Any) -> None:
+    """Feed a type-tagged, order-stable encoding of obj into hash h."""
+    if obj is None or isinstance(obj, (bool, int, float, str, np.generic)):
+        h.update(f"{type(obj).__name__}:{obj!r};".encode())
+    elif isinstance(obj, bytes):
+        h.update(b"bytes:%d;" % len(obj))
+        h.update(obj)
+    elif isinstance(obj, (datetime, date, pd.Timestamp)):
+        h.update(f"{type(obj).__name__}:{obj.isoformat()};".encode())
+    elif isinstance(obj, pd.DataFrame):
+        h.update(f"df:{list(obj.columns)!r}:{[str(t) for t in obj.dtypes]!r}:{len(obj)};".encode())
+        try:
+            h.update(pd.util.hash_pandas_object(obj, index=False).to_numpy().tobytes())
+        except TypeError:  # unhashable cells (dicts/lists)
+            _feed(h, obj.to_dict("list"))
+    elif isinstance(obj, pd.Series):
+        h.update(f"series:{obj.name!r}:{obj.dtype};".encode())
+        _feed(h, obj.to_frame())
+    elif isinstance(obj, np.ndarray):
+        if obj.dtype == object:
+            _feed(h, obj.tolist())
+        else:
+            h.update(f"ndarray:{obj.dtype.str}:{obj.shape};".encode())
+            h.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, dict):
+        h.update(b"dict:%d;" % len(obj))
+        for k, v in sorted(obj.items(), key=lambda kv: repr(kv[0])):
+            _feed(h, k)
+            _feed(h, v)
+    elif isinstance(obj, (list, tuple)):
+        h.update(f"{type(obj).__name__}:{len(obj)};".encode())
+        for v in obj:
+            _feed(h, v)
+    elif isinstance(obj, (set, frozenset)):
+        _feed(h, sorted(obj, key=repr))
+    elif dataclasses.is_dataclass(obj):
+        h.update(f"{type(obj).__name__};".encode())
+        _feed(h, dataclasses.asdict(obj))
+    else:
+        h.update(f"{type(obj).__name__}:{obj!r};".encode())
+
+
+def fingerprint(*inputs: Any) -> str:
+    """sha256 of the inputs' content."""
+    h = hashlib.sha256()
+    for obj in inputs:
+        _feed(h, obj)
+    return h.hexdigest()
+
+
+def file_sha256(path: str) -> Optional[str]:
+    if not os.path.exists(path):
+        return None
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# ----------------------------
+# Cache
+# ----------------------------
+class StageCache:
+    """
+    On-disk stage result cache. run() serves a stage from cache when its input
+    fingerprint matches a stored entry and computes + stores it otherwise; with
+    enabled=False every stage is simply computed.
+    """
+
+    def __init__(self, root: str = STAGE_CACHE_DIR, max_bytes: int = STAGE_CACHE_MAX_BYTES,
+                 enabled: bool = True):
+        self.root = root
+        self.max_bytes = int(max_bytes)
+        self.enabled = enabled
+        self.hits = []
+        self.misses = []
+
+    def _path(self, stage: str, key: str) -> str:
+        return os.path.join(self.root, stage, f"{key}.pkl")
+
+    def get(self, stage: str, key: str) -> Tuple[bool, Any]:
+        path = self._path(stage, key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return False, None
+        except Exception as e:
+            print(f"Warning: dropping unreadable cache entry {path}: {e}")
+            os.remove(path)
+            return False, None
+        os.utime(path)  # mtime = last use, for LRU eviction
+        return True, value
+
+    def put(self, stage: str, key: str, value: Any) -> None:
+        path = self._path(stage, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self.evict(keep=path)
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """Delete least recently used entries until the cache fits max_bytes; returns entries removed."""
+        entries = []
+        for dirpath, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+    def run(self, stage: str, inputs: Any, compute: Callable[[], Any], version: str = "1") -> Any:
+        """
+        Result of compute() for these inputs, served from cache when the same
+        stage/version/inputs ran before. Bump version when the stage's code changes.
+        """
+        if not self.enabled:
+            return compute()
+        key = fingerprint(stage, version, inputs)
+        hit, value = self.get(stage, key)
+        if hit:
+            self.hits.append(stage)
+            return value
+        self.misses.append(stage)
+        value = compute()
+        self.put(stage, key, value)
+        return value
+
+    def file(self, stage: str, inputs: Any, path: str, build: Callable[[], Any], version: str = "1") -> bool:
+        """
+        Run build() (which writes `path`) unless the same inputs last produced the
+        file that is on disk now. Returns True when build() ran.
+        """
+        if not self.enabled:
+            build()
+            return True
+        key = fingerprint(stage, version, inputs)
+        hit, recorded = self.get(stage, key)
+        if hit and recorded == file_sha256(path):
+            self.hits.append(stage)
+            return False
+        self.misses.append(stage)
+        build()
+        written = file_sha256(path)
+        if written is not None:
+            self.put(stage, key, written)
+        return True
+
+    def summary(self) -> str:
+        return (f"stage cache: {len(self.hits)} hit(s) [{', '.join(self.hits)}], "
+                f"{len(self.misses)} miss(es) [{', '.join(self.misses)}]")
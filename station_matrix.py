@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# station_matrix.py
+# Dense station × day sales / order-count matrices for the time-series stages.
+# - Built from the long daily table (timeseries_by_station /
+#   warehouse.daily_sales_per_station): one row per (stationOwnerId, waterType),
+#   one column per calendar day on a shared date axis, days without orders = 0
+# - Rows are sorted by (waterType, stationOwnerId), so a station, a waterType
+#   or a date range is a plain slice: views of the same buffer, never copies
+# - Stored as .npy files under out/station_day/ and opened memory-mapped; the
+#   matrix is only rebuilt when the daily table's fingerprint changes
+# Used by ai_analytics.py.
+
+import json
+import os
+import shutil
+from datetime import date
+from typing import Iterator, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+import stage_cache
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+STATION_DAY_DIR = os.path.join("out", "station_day")
+METRICS = ("sales", "orders")
+METRIC_DTYPES = {"sales": np.float64, "orders": np.int32}
+
+DateLike = Union[str, date, np.datetime64, pd.Timestamp, None]
+
+
+def _day(d: DateLike) -> Optional[np.datetime64]:
+    return None if d is None else np.datetime64(pd.Timestamp(d).date(), "D")
+
+
+class StationDayMatrix:
+    """
+    (rows, days) `sales` (float64) and `orders` (int32) arrays with their row
+    index (station_ids / water_types) and date axis (datetime64[D]). Slicing
+    methods return another StationDayMatrix over views of the same arrays.
+    """
+
+    def __init__(self, station_ids: np.ndarray, water_types: np.ndarray, dates: np.ndarray,
+                 sales: np.ndarray, orders: np.ndarray):
+        self.station_ids = station_ids
+        self.water_types = water_types
+        self.dates = dates
+        self.sales = sales
+        self.orders = orders
+
+    def __len__(self):
+        return len(self.station_ids)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.sales.shape
+
+    def __repr__(self):
+        span = f"{self.dates[0]}..{self.dates[-1]}" if len(self.dates) else "no days"
+        return f"StationDayMatrix({len(self)} stations × {len(self.dates)} days, {span})"
+
+    # ----------------------------
+    # Build
+    # ----------------------------
+    @classmethod
+    def from_daily(cls, daily_df: pd.DataFrame, start: DateLike = None, end: DateLike = None) -> "StationDayMatrix":
+        """
+        Dense matrices from the long daily table (stationOwnerId, waterType, date,
+        orders, totalSales). The date axis runs from `start` (default: first day
+        with orders) to `end` (default: last day with orders).
+        """
+        if daily_df is None or daily_df.empty:
+            empty = np.empty(0, dtype=object)
+            return cls(empty, empty.copy(), np.empty(0, dtype="datetime64[D]"),
+                       np.zeros((0, 0), dtype=METRIC_DTYPES["sales"]),
+                       np.zeros((0, 0), dtype=METRIC_DTYPES["orders"]))
+        days = pd.to_datetime(daily_df["date"]).to_numpy().astype("datetime64[D]")
+        first = _day(start) if start is not None else days.min()
+        last = _day(end) if end is not None else days.max()
+        dates = np.arange(first, last + np.timedelta64(1, "D"), dtype="datetime64[D]")
+
+        keys = daily_df[["waterType", "stationOwnerId"]].astype(str)
+        pairs = keys.drop_duplicates().sort_values(["waterType", "stationOwnerId"], kind="stable")
+        row_of = {k: i for i, k in enumerate(zip(pairs["waterType"], pairs["stationOwnerId"]))}
+        rows = np.fromiter((row_of[k] for k in zip(keys["waterType"], keys["stationOwnerId"])),
+                           dtype=np.int64, count=len(keys))
+        cols = (days - first).astype(np.int64)
+        keep = (cols >= 0) & (cols < len(dates))
+
+        sales = np.zeros((len(pairs), len(dates)), dtype=METRIC_DTYPES["sales"])
+        orders = np.zeros((len(pairs), len(dates)), dtype=METRIC_DTYPES["orders"])
+        np.add.at(sales, (rows[keep], cols[keep]), daily_df["totalSales"].to_numpy(dtype=float)[keep])
+        np.add.at(orders, (rows[keep], cols[keep]), daily_df["orders"].to_numpy(dtype=np.int64)[keep])
+        return cls(pairs["stationOwnerId"].to_numpy(dtype=object), pairs["waterType"].to_numpy(dtype=object),
+                   dates, sales, orders)
+
+    # ----------------------------
+    # Views (no copies)
+    # ----------------------------
+    def _view(self, rows: slice = slice(None), cols: slice = slice(None)) -> "StationDayMatrix":
+        return StationDayMatrix(self.station_ids[rows], self.water_types[rows], self.dates[cols],
+                                self.sales[rows, cols], self.orders[rows, cols])
+
+    def _row_span(self, water_type: str) -> slice:
+        lo = int(np.searchsorted(self.water_types.astype(str), water_type, side="left"))
+        hi = int(np.searchsorted(self.water_types.astype(str), water_type, side="right"))
+        return slice(lo, hi)
+
+    def water_type(self, water_type: str) -> "StationDayMatrix":
+        """All stations of one waterType (a contiguous row block)."""
+        return self._view(rows=self._row_span(str(water_type)))
+
+    def station(self, station_id: str, water_type: Optional[str] = None) -> "StationDayMatrix":
+        """One station's row(s); stations selling several waterTypes need water_type for a single row."""
+        span = self._row_span(str(water_type)) if water_type is not None else slice(0, len(self))
+        hits = np.flatnonzero(self.station_ids[span] == station_id) + (span.start or 0)
+        if len(hits) == 0:
+            raise KeyError(f"Unknown station {station_id!r}" + (f" / {water_type!r}" if water_type else ""))
+        if len(hits) > 1:
+            raise KeyError(f"Station {station_id!r} has rows for several waterTypes "
+                           f"({', '.join(map(str, self.water_types[hits]))}); pass water_type")
+        return self._view(rows=slice(int(hits[0]), int(hits[0]) + 1))
+
+    def window(self, start: DateLike = None, end: DateLike = None) -> "StationDayMatrix":
+        """Days start..end inclusive (either side open when None)."""
+        lo = 0 if start is None else int(np.searchsorted(self.dates, _day(start), side="left"))
+        hi = len(self.dates) if end is None else int(np.searchsorted(self.dates, _day(end), side="right"))
+        return self._view(cols=slice(lo, hi))
+
+    def rows(self) -> Iterator[Tuple[str, str, np.ndarray, np.ndarray]]:
+        """(stationOwnerId, waterType, sales row, orders row) per row; the rows are views."""
+        for i in range(len(self)):
+            yield self.station_ids[i], self.water_types[i], self.sales[i], self.orders[i]
+
+    # ----------------------------
+    # Persistence (memory-mapped)
+    # ----------------------------
+    def save(self, root: str = STATION_DAY_DIR, key: Optional[str] = None) -> None:
+        """Write the matrices as .npy files plus an index; replaces `root` as a whole."""
+        tmp = root.rstrip(os.sep) + ".tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for metric in METRICS:
+            src = getattr(self, metric)
+            out = np.lib.format.open_memmap(os.path.join(tmp, f"{metric}.npy"), mode="w+",
+                                            dtype=METRIC_DTYPES[metric], shape=src.shape)
+            out[...] = src
+            out.flush()
+            del out
+        index = {
+            "key": key,
+            "start": str(self.dates[0]) if len(self.dates) else None,
+            "n_days": int(len(self.dates)),
+            "station_ids": [str(s) for s in self.station_ids],
+            "water_types": [str(w) for w in self.water_types],
+        }
+        with open(os.path.join(tmp, "index.json"), "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        shutil.rmtree(root, ignore_errors=True)
+        os.replace(tmp, root)
+
+    @classmethod
+    def load(cls, root: str = STATION_DAY_DIR) -> Tuple["StationDayMatrix", Optional[str]]:
+        """Open a saved matrix read-only and memory-mapped; returns (matrix, key)."""
+        with open(os.path.join(root, "index.json"), "r", encoding="utf-8") as f:
+            index = json.load(f)
+        start = np.datetime64(index["start"], "D") if index["start"] else np.datetime64("1970-01-01", "D")
+        dates = start + np.arange(index["n_days"]).astype("timedelta64[D]")
+        arrays = {m: np.load(os.path.join(root, f"{m}.npy"), mmap_mode="r") for m in METRICS}
+        matrix = cls(np.array(index["station_ids"], dtype=object), np.array(index["water_types"], dtype=object),
+                     dates, arrays["sales"], arrays["orders"])
+        return matrix, index.get("key")
+
+
+# ----------------------------
+# Build / reuse
+# ----------------------------
+def load_or_build(daily_df: pd.DataFrame, root: Optional[str] = STATION_DAY_DIR) -> StationDayMatrix:
+    """
+    The memory-mapped matrix saved under `root` when it was built from the same
+    daily table; otherwise build it, save it and reopen it memory-mapped.
+    root=None (or an empty table, which can't be mapped) keeps it in memory only.
+    """
+    if root is None or daily_df is None or daily_df.empty:
+        return StationDayMatrix.from_daily(daily_df)
+    key = stage_cache.fingerprint("station_day", daily_df)
+    if os.path.exists(os.path.join(root, "index.json")):
+        try:
+            saved, saved_key = StationDayMatrix.load(root)
+            if saved_key == key:
+                return saved
+        except Exception as e:
+            print(f"Warning: could not load station × day matrix {root}: {e}")
+    StationDayMatrix.from_daily(daily_df).save(root, key=key)
+    return StationDayMatrix.load(root)[0]
+
@@ -0,0 +1,97 @@
+# test_anomaly.py
+# pytest: EWMA folding, settle-window advance and checkpoint round trip of anomaly.py.
+
+import json
+import pickle
+from datetime import date, timedelta
+
+import pytest
+
+import anomaly
+
+START = date(2025, 1, 1)
+
+
+def _days(n, liters=100.0, start=START):
+    return {start + timedelta(days=i): liters for i in range(n)}
+
+
+def test_steady_series_raises_no_alert():
+    det = anomaly.DemandAnomalyDetector()
+    det.advance({"s1": _days(60)}, {}, START + timedelta(days=59))
+    assert det.take_alerts() == []
+    assert det.baseline("station", "s1")["mean_liters"] == pytest.approx(100.0)
+
+
+def test_spike_alerts_once_per_episode():
+    series = _days(40)
+    for i in (30, 31, 32):
+        series[START + timedelta(days=i)] = 2000.0
+    det = anomaly.DemandAnomalyDetector()
+    det.advance({"s1": series}, {}, START + timedelta(days=39))
+    alerts = det.take_alerts()
+    assert [(a["kind"], a["day"]) for a in alerts] == [("spike", "2025-01-31")]
+
+
+def test_missing_days_count_as_zero_and_alert_as_drop():
+    series = _days(30, liters=500.0)
+    det = anomaly.DemandAnomalyDetector()
+    det.advance({"s1": series}, {}, START + timedelta(days=34))
+    alerts = det.take_alerts()
+    assert [(a["kind"], a["day"]) for a in alerts] == [("drop", "2025-01-31")]
+    assert det.baseline("station", "s1")["days"] == 35
+
+
+def test_district_is_sum_of_its_stations():
+    det = anomaly.DemandAnomalyDetector()
+    det.advance({"a": _days(10, 100.0), "b": _days(10, 50.0)}, {"a": "D", "b": "D"},
+                START + timedelta(days=9))
+    assert det.baseline("district", "D")["mean_liters"] == pytest.approx(150.0)
+
+
+def test_advance_skips_closed_days_and_is_incremental():
+    data = {"s1": _days(50), "s2": _days(20, 40.0, start=START + timedelta(days=10))}
+    districts = {"s1": "D", "s2": "D"}
+    whole = anomaly.DemandAnomalyDetector()
+    whole.advance(data, districts, START + timedelta(days=49))
+
+    stepped = anomaly.DemandAnomalyDetector()
+    for through in (15, 30, 30, 49):
+        stepped.advance(data, districts, START + timedelta(days=through))
+    assert stepped.stats == whole.stats
+    assert stepped.closed_through == whole.closed_through
+    # Re-reading the same history folds nothing new
+    assert stepped.advance(data, districts, START + timedelta(days=49)) == 0
+
+
+def test_new_station_starts_at_its_first_day():
+    det = anomaly.DemandAnomalyDetector()
+    det.advance({"s1": _days(20)}, {}, START + timedelta(days=19))
+    late = _days(5, start=START + timedelta(days=25))
+    det.advance({"s1": _days(30), "s2": late}, {}, START + timedelta(days=29))
+    assert det.baseline("station", "s2")["days"] == 5
+    assert det.baseline("station", "s1")["days"] == 30
+
+
+def test_checkpoint_round_trip(tmp_path):
+    path = str(tmp_path / "demand_anomaly.json")
+    det = anomaly.DemandAnomalyDetector()
+    det.advance({"s1": _days(30), "s2": _days(30, 7.0)}, {"s1": "D", "s2": "E"}, START + timedelta(days=29))
+    anomaly.save_detector(det, path)
+    loaded = anomaly.load_detector(path)
+    assert loaded.stats == det.stats
+    assert loaded.closed_through == det.closed_through
+    with open(path, "r", encoding="utf-8") as f:
+        assert json.load(f)["version"] == anomaly.ANOMALY_STATE_VERSION
+
+
+@pytest.mark.parametrize("payload", [
+    pickle.dumps(anomaly.DemandAnomalyDetector()),
+    json.dumps({"version": 1, "closed_through": None, "baselines": []}).encode(),
+    json.dumps({"version": anomaly.ANOMALY_STATE_VERSION, "closed_through": None}).encode(),
+])
+def test_foreign_checkpoint_starts_fresh(tmp_path, payload):
+    path = tmp_path / "demand_anomaly.json"
+    path.write_bytes(payload)
+    det = anomaly.load_detector(str(path))
+    assert det.stats == {} and det.closed_through is None
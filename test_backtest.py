@@ -0,0 +1,58 @@
+# test_backtest.py
+# pytest: haversine coverage and the walk-forward backtest of the test_model.py
+# evaluation script.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ai_analytics
+import fake_firestore
+import test_model
+from conftest import populate
+
+
+@pytest.fixture(scope="module")
+def joined_and_stations():
+    db = populate(fake_firestore.FakeFirestore(), n_orders=900, days=120)
+    stations_df, sales_df = ai_analytics.fetch_data(db)
+    return ai_analytics.build_station_joined_sales(sales_df, stations_df), stations_df
+
+
+def test_coverage_matches_brute_force():
+    rng = np.random.default_rng(0)
+    test_df = pd.DataFrame({"customer_lat": rng.uniform(10.69, 10.74, 300),
+                            "customer_lng": rng.uniform(122.52, 122.60, 300)})
+    recs = pd.DataFrame({"lat": [10.70, 10.72, 10.73], "lng": [122.55, 122.58, 122.53]})
+    d = ai_analytics.haversine_m_matrix(test_df["customer_lat"], test_df["customer_lng"], recs["lat"], recs["lng"])
+    for radius in (200, 500, 1500):
+        expected = float((d.min(axis=1) <= radius).mean())
+        assert test_model.coverage(test_df, recs, cover_radius_m=radius) == pytest.approx(expected, abs=1 / 300)
+    assert test_model.coverage(test_df, recs.iloc[:0]) == 0
+    assert test_model.coverage(test_df.iloc[:0], recs) == 0
+
+
+def test_walk_forward_folds_train_on_the_past(joined_and_stations):
+    joined, stations_df = joined_and_stations
+    folds = test_model.walk_forward_backtest(joined, stations_df, workers=1)
+    months = joined["createdAt"].dt.tz_convert(ai_analytics.ASIA_MANILA).dt.tz_localize(None).dt.to_period("M")
+    assert list(folds["test_month"]) == [str(m) for m in sorted(months.unique())[1:]]
+    for f in folds.itertuples(index=False):
+        test_month = pd.Period(f.test_month)
+        assert f.test_rows == int((months == test_month).sum())
+        assert f.train_rows == int((months < test_month).sum())
+        assert 0.0 <= f.coverage <= 1.0
+    assert folds["train_rows"].is_monotonic_increasing
+
+
+def test_walk_forward_pool_matches_serial(joined_and_stations):
+    joined, stations_df = joined_and_stations
+    serial = test_model.walk_forward_backtest(joined, stations_df, workers=1)
+    pooled = test_model.walk_forward_backtest(joined, stations_df, workers=2)
+    pd.testing.assert_frame_equal(serial, pooled)
+
+
+def test_single_month_has_no_folds(joined_and_stations):
+    joined, stations_df = joined_and_stations
+    months = joined["createdAt"].dt.tz_convert(ai_analytics.ASIA_MANILA).dt.month
+    assert test_model.walk_forward_backtest(joined[months == months.iloc[0]], stations_df, workers=1).empty
@@ -0,0 +1,78 @@
+# test_catchments.py
+# pytest: nearest-station catchments of ai_analytics.station_catchments against
+# a brute-force haversine assignment.
+
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ai_analytics
+
+STATIONS = pd.DataFrame({
+    "stationOwnerId": ["a", "b", "c", "m"],
+    "waterType": ["Alkaline", "Alkaline", "Alkaline", "Mineral"],
+    "district": ["Jaro", "Jaro", "Molo", "Molo"],
+    "station_lat": [10.700, 10.704, 10.720, 10.701],
+    "station_lng": [122.560, 122.560, 122.540, 122.561],
+})
+
+
+def _haversine_m(lat1, lng1, lat2, lng2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((p2 - p1) / 2) ** 2
+         + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2)
+    return 2 * ai_analytics.EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+@pytest.fixture(scope="module")
+def joined():
+    rng = np.random.default_rng(0)
+    rows = []
+    for i in range(400):
+        lat, lng = 10.695 + rng.uniform(0, 0.03), 122.535 + rng.uniform(0, 0.03)
+        wtype = "Mineral" if i % 4 == 0 else "Alkaline"
+        # Customers mostly, not always, order from a station of their waterType
+        sid = "m" if wtype == "Mineral" else str(rng.choice(["a", "b", "c"]))
+        for j in range(int(rng.integers(1, 3))):
+            rows.append({"saleId": f"o{i}_{j}", "customer_lat": round(lat, 5), "customer_lng": round(lng, 5),
+                         "waterType": wtype, "stationOwnerId": sid, "totalPrice": 100.0,
+                         "delivery_distance_m": float(rng.uniform(100, 2000))})
+    return pd.DataFrame(rows)
+
+
+def test_catchments_match_brute_force(joined):
+    out = ai_analytics.station_catchments(joined, STATIONS, service_radius_m=600).set_index("stationOwnerId")
+    locs = joined.groupby(["waterType", "customer_lat", "customer_lng"])["saleId"].nunique().reset_index()
+    expected_orders = {sid: 0 for sid in STATIONS["stationOwnerId"]}
+    overlap = dict(expected_orders)
+    for wtype, lat, lng, n in locs.itertuples(index=False):
+        cands = STATIONS[STATIONS["waterType"] == wtype]
+        d = sorted((_haversine_m(lat, lng, s.station_lat, s.station_lng), s.stationOwnerId)
+                   for s in cands.itertuples())
+        expected_orders[d[0][1]] += n
+        if len(d) > 1 and d[1][0] <= 600:
+            overlap[d[0][1]] += n
+    assert out["catchment_orders"].to_dict() == expected_orders
+    assert out["overlap_orders"].to_dict() == overlap
+    assert out["catchment_orders"].sum() == joined["saleId"].nunique()
+    # A single Mineral station can't overlap with anything
+    assert out.loc["m", "overlap_orders"] == 0 and pd.isna(out.loc["m", "overlap_station_id"])
+
+
+def test_capture_rate_and_delivery_distance(joined):
+    out = ai_analytics.station_catchments(joined, STATIONS).set_index("stationOwnerId")
+    assert out.loc["m", "capture_rate"] == 1.0
+    assert ((out["capture_rate"] >= 0) & (out["capture_rate"] <= 1)).all()
+    assert out["captured_orders"].le(out["catchment_orders"]).all()
+    assert out.loc["a", "median_delivery_distance_m"] == pytest.approx(
+        joined.loc[joined["stationOwnerId"] == "a", "delivery_distance_m"].median())
+
+
+def test_empty_inputs_keep_columns(joined):
+    empty = ai_analytics.station_catchments(joined.iloc[:0], STATIONS)
+    assert empty.empty and "capture_rate" in empty.columns
+    recs = pd.DataFrame({"nearest_station_id": ["a", "zz"]})
+    merged = ai_analytics.attach_catchment_stats(recs, ai_analytics.station_catchments(joined, STATIONS))
+    assert merged["nearest_station_catchment_orders"].notna().tolist() == [True, False]
@@ -0,0 +1,61 @@
+# test_chart_series.py
+# pytest: chart-ready demand series of service.py (build / JSON / packed Firestore doc).
+
+import json
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import fake_firestore
+import service
+
+OVERALL = {date(2024, 11, 1): 5000.0, date(2025, 1, 1): 2500.0, date(2025, 2, 1): 1234.5}
+DAILY = {
+    "s0": {date(2024, 11, 3): 3000.0, date(2025, 1, 9): 2500.0},
+    "s1": {date(2024, 11, 20): 2000.0, date(2025, 2, 28): 1234.5},
+}
+STATIONS = pd.DataFrame({"station_id": ["s0"], "district_name": ["Jaro"]})
+
+
+@pytest.fixture
+def series():
+    return service.build_demand_chart_series(OVERALL, DAILY, STATIONS)
+
+
+def test_shared_month_axis_with_gaps_filled(series):
+    assert series["months"] == ["2024-11", "2024-12", "2025-01", "2025-02"]
+    np.testing.assert_allclose(series["overall_m3"], [5.0, 0.0, 2.5, 1.2345])
+    np.testing.assert_allclose(series["districts"]["Jaro"], [3.0, 0.0, 2.5, 0.0])
+    np.testing.assert_allclose(series["districts"]["Unknown"], [2.0, 0.0, 0.0, 1.2345])
+    assert series["years"]["2024"]["total_m3"] == pytest.approx(5.0)
+    assert series["years"]["2025"]["monthly_m3"][:2].tolist() == pytest.approx([2.5, 1.2345])
+
+
+def test_no_demand_gives_no_series():
+    assert service.build_demand_chart_series({}) is None
+
+
+def test_json_is_compact_and_rounded(series):
+    text = service.chart_series_json(series)
+    payload = json.loads(text)
+    assert text == json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+    assert payload["overall_m3"] == [round(float(v), 3) for v in series["overall_m3"]]
+    assert len(payload["years"]["2025"]["monthly_m3"]) == 12
+
+
+def test_write_and_packed_doc_round_trip(series, tmp_path):
+    path = str(tmp_path / "charts" / "series.json")
+    service.write_chart_series(series, path=path)
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f)["months"] == series["months"]
+
+    db = fake_firestore.FakeFirestore()
+    service.save_chart_series(db, series)
+    doc = db.collection(service.CHARTS_COLLECTION).document("overall_monthly").get().to_dict()
+    districts = np.frombuffer(doc["district_m3"], dtype="<f4").reshape(-1, doc["district_len"])
+    assert doc["district_names"] == ["Jaro", "Unknown"]
+    np.testing.assert_allclose(districts[0], series["districts"]["Jaro"], rtol=1e-6)
+    years = np.frombuffer(doc["year_monthly_m3"], dtype="<f4").reshape(len(doc["years"]), 12)
+    np.testing.assert_allclose(years[1], series["years"]["2025"]["monthly_m3"], rtol=1e-6)
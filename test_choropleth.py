@@ -0,0 +1,138 @@
+# test_choropleth.py
+# pytest: shared-arc topology, simplification repair and encoders of choropleth.py.
+
+import json
+
+import pytest
+from shapely.geometry import Polygon
+
+import choropleth
+
+# Two unit squares sharing the edge x=1, plus a separate island
+LEFT = [(0.0, 0.0), (1.0, 0.0), (1.0, 0.5), (1.0, 1.0), (0.0, 1.0)]
+RIGHT = [(1.0, 0.0), (2.0, 0.0), (2.0, 1.0), (1.0, 1.0), (1.0, 0.5)]
+ISLAND = [(5.0, 5.0), (5.0001, 5.0), (5.00005, 5.00002), (5.0, 5.00001)]
+SQUARES = [("Left", [[LEFT]]), ("Right", [[RIGHT]])]
+# A sliver glued onto a square's edge: two arcs that any coarse tolerance flattens into one line
+HOST = [(0.0, 0.0), (1.0, 0.0), (1.0, 0.4), (1.0, 0.6), (1.0, 1.0), (0.0, 1.0)]
+SLIVER = [(1.0, 0.4), (1.00001, 0.5), (1.0, 0.6)]
+
+
+def _same_ring(a, b):
+    """Equal up to rotation and direction."""
+    a, b = list(a), list(b)
+    if a[0] == a[-1]:
+        a = a[:-1]
+    if b[0] == b[-1]:
+        b = b[:-1]
+    if len(a) != len(b) or set(a) != set(b):
+        return False
+    for seq in (b, b[::-1]):
+        i = seq.index(a[0])
+        if seq[i:] + seq[:i] == a:
+            return True
+    return False
+
+
+def _decode_topojson(topo):
+    kx, ky = topo["transform"]["scale"]
+    x0, y0 = topo["transform"]["translate"]
+    arcs = []
+    for delta in topo["arcs"]:
+        x = y = 0
+        pts = []
+        for dx, dy in delta:
+            x, y = x + dx, y + dy
+            pts.append((x * kx + x0, y * ky + y0))
+        arcs.append(pts)
+    return arcs
+
+
+def _arc_uses(geometries):
+    uses = {}
+    for polys in geometries:
+        for rings in polys:
+            for refs in rings:
+                for ref in refs:
+                    i = ref if ref >= 0 else ~ref
+                    uses.setdefault(i, []).append(ref >= 0)
+    return uses
+
+
+def test_shared_edge_is_one_arc_used_in_both_directions():
+    arcs, geometries = choropleth.build_topology(SQUARES)
+    shared = [i for i, dirs in _arc_uses(geometries).items() if len(dirs) == 2]
+    assert len(shared) == 1
+    assert sorted(_arc_uses(geometries)[shared[0]]) == [False, True]
+    assert set(arcs[shared[0]]) == {(1.0, 0.0), (1.0, 0.5), (1.0, 1.0)}
+
+
+def test_rings_rebuild_from_arcs():
+    arcs, geometries = choropleth.build_topology(SQUARES + [("Island", [[ISLAND]])])
+    for (_, polys), geom in zip(SQUARES + [("Island", [[ISLAND]])], geometries):
+        for ring, refs in zip(polys[0], geom[0]):
+            assert _same_ring(ring, choropleth._ring_points(refs, arcs))
+
+
+def test_collapsed_ring_is_repaired():
+    arcs, geometries = choropleth.build_topology([("Host", [[HOST]]), ("Sliver", [[SLIVER]])])
+    simplified = choropleth.simplify_arcs(arcs, 0.01)
+    sliver_refs = geometries[1][0][0]
+    assert len(sliver_refs) == 2
+    assert len(set(choropleth._ring_points(sliver_refs, simplified))) < 3
+    repaired = choropleth._repair_collapsed(geometries, arcs, simplified)
+    assert _same_ring(SLIVER, choropleth._ring_points(sliver_refs, repaired))
+    # Only the collapsed ring's arcs revert; the host's other arc stays simplified
+    for ref in geometries[0][0][0]:
+        i = ref if ref >= 0 else ~ref
+        if i not in {r if r >= 0 else ~r for r in sliver_refs}:
+            assert repaired[i] == simplified[i]
+
+
+@pytest.fixture(scope="module")
+def iloilo():
+    return choropleth.load_district_rings(choropleth.DISTRICTS_GEOJSON)
+
+
+def test_real_districts_share_boundaries(iloilo):
+    arcs, geometries = choropleth.build_topology(iloilo)
+    uses = _arc_uses(geometries)
+    assert max(len(d) for d in uses.values()) <= 2
+    assert any(len(d) == 2 for d in uses.values())
+    for (_, polys), geom in zip(iloilo, geometries):
+        for poly, geom_rings in zip(polys, geom):
+            for ring, refs in zip(poly, geom_rings):
+                assert _same_ring(ring, choropleth._ring_points(refs, arcs))
+
+
+@pytest.mark.parametrize("level", list(choropleth.ZOOM_TOLERANCES_DEG))
+def test_simplified_neighbours_do_not_overlap(iloilo, level):
+    arcs, geometries = choropleth.build_topology(iloilo)
+    tol = choropleth.ZOOM_TOLERANCES_DEG[level]
+    simplified = choropleth._repair_collapsed(geometries, arcs, choropleth.simplify_arcs(arcs, tol))
+    shapes = []
+    for geom in geometries:
+        rings = [choropleth._ring_points(refs, simplified) for refs in geom[0]]
+        shapes.append(Polygon(rings[0], rings[1:]).buffer(0))
+    total = sum(s.area for s in shapes)
+    for i in range(len(shapes)):
+        for j in range(i + 1, len(shapes)):
+            assert shapes[i].intersection(shapes[j]).area < 1e-6 * total
+
+
+def test_payloads_decode_within_quantization(iloilo):
+    payloads = choropleth.build_choropleth_payloads(
+        [{"district": iloilo[0][0].upper(), "district_total_m3": 12.345}], tolerances={"z13": 2e-4})
+    topo = json.loads(payloads["z13"]["topojson"])
+    geo = json.loads(payloads["z13"]["geojson"])
+    props = [g["properties"] for g in topo["objects"]["districts"]["geometries"]]
+    assert props[0]["district_total_m3"] == 12.35 and props[1]["district_total_m3"] is None
+    assert [f["properties"]["name"] for f in geo["features"]] == [name for name, _ in iloilo]
+
+    arcs, geometries = choropleth.build_topology(iloilo)
+    simplified = choropleth._repair_collapsed(geometries, arcs, choropleth.simplify_arcs(arcs, 2e-4))
+    decoded = _decode_topojson(topo)
+    kx, ky = topo["transform"]["scale"]
+    for arc, got in zip(simplified, decoded):
+        assert got[0] == pytest.approx(arc[0], abs=max(kx, ky))
+        assert got[-1] == pytest.approx(arc[-1], abs=max(kx, ky))
@@ -0,0 +1,87 @@
+# test_churn_model.py
+# pytest: persisted churn model of ai_analytics.py: drift statistics, retrain
+# decisions and chunked batch scoring.
+
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ai_analytics
+
+
+def _dataset(n=400, seed=0, recency_shift=0.0):
+    rng = np.random.default_rng(seed)
+    recency = rng.exponential(40, n) + recency_shift
+    return pd.DataFrame({
+        "customerId": [f"c{i}" for i in range(n)],
+        "recency_days": recency,
+        "frequency": rng.poisson(5, n).astype(float),
+        "avgSpend": rng.uniform(50, 300, n),
+        "churn": (recency > 60).astype(int),
+    })
+
+
+def test_psi_is_zero_on_training_data_and_flags_shift():
+    X = _dataset()[ai_analytics.CHURN_FEATURES].to_numpy(dtype=float)
+    ref = ai_analytics._reference_bins(X)
+    assert np.allclose(ai_analytics.population_stability(X, ref), 0.0, atol=1e-9)
+    for r in ref:
+        assert sum(r["props"]) == pytest.approx(1.0)
+    shifted = _dataset(seed=1, recency_shift=80)[ai_analytics.CHURN_FEATURES].to_numpy(dtype=float)
+    psi = ai_analytics.population_stability(shifted, ref)
+    assert psi[0] > ai_analytics.CHURN_DRIFT_PSI and psi[1:].max() < ai_analytics.CHURN_DRIFT_PSI
+
+
+def test_retrain_reasons():
+    ds = _dataset()
+    X = ds[ai_analytics.CHURN_FEATURES].to_numpy(dtype=float)
+    meta = {"features": list(ai_analytics.CHURN_FEATURES), "fingerprint": ai_analytics.data_fingerprint(X),
+            "reference": ai_analytics._reference_bins(X), "trained_at": datetime.now(tz=timezone.utc).isoformat()}
+    assert ai_analytics.churn_retrain_reason(ds, None) == "no saved model"
+    assert ai_analytics.churn_retrain_reason(ds, meta) is None
+    # New rows from the same population: fingerprint differs, no drift
+    assert ai_analytics.churn_retrain_reason(_dataset(seed=2), meta) is None
+    assert ai_analytics.churn_retrain_reason(_dataset(seed=2, recency_shift=80), meta).startswith("drift on recency_days")
+    assert ai_analytics.churn_retrain_reason(ds, dict(meta, features=["frequency"])) == "feature schema changed"
+    old = (datetime.now(tz=timezone.utc) - timedelta(days=ai_analytics.CHURN_MAX_MODEL_AGE_DAYS + 1)).isoformat()
+    assert ai_analytics.churn_retrain_reason(ds, dict(meta, trained_at=old)).startswith("model age")
+
+
+@pytest.mark.skipif(not ai_analytics._HAS_XGB, reason="xgboost not installed")
+def test_model_is_reused_until_drift(tmp_path):
+    model_dir = str(tmp_path / "churn")
+    ds = _dataset()
+    model, feat, status = ai_analytics.ensure_churn_model(ds, model_dir)
+    assert status == "retrained (no saved model)" and feat == ai_analytics.CHURN_FEATURES
+    with open(os.path.join(model_dir, "meta.json")) as f:
+        assert json.load(f)["n_rows"] == len(ds)
+
+    _, _, status = ai_analytics.ensure_churn_model(_dataset(seed=3), model_dir)
+    assert status.startswith("reused saved model")
+    _, _, status = ai_analytics.ensure_churn_model(_dataset(seed=3, recency_shift=30), model_dir)
+    assert status.startswith("retrained (drift on recency_days")
+
+    # A too-small dataset keeps the saved model instead of dropping it
+    tiny = _dataset(n=10, recency_shift=200)
+    saved, _, status = ai_analytics.ensure_churn_model(tiny, model_dir)
+    assert saved is not None and status.startswith("retrain skipped")
+
+
+@pytest.mark.skipif(not ai_analytics._HAS_XGB, reason="xgboost not installed")
+def test_chunked_scoring_matches_one_batch(tmp_path):
+    ds = _dataset()
+    model, feat = ai_analytics.train_churn_model(ds)
+    whole = ai_analytics.score_churn(model, feat, ds, chunk_size=len(ds))
+    chunked = ai_analytics.score_churn(model, feat, ds, chunk_size=37)
+    pd.testing.assert_frame_equal(whole, chunked)
+    assert list(whole["customerId"]) == list(ds["customerId"])
+    assert whole["churn_prob"].between(0, 1).all()
+
+    ai_analytics.save_churn_model(model, feat, ds[feat].to_numpy(dtype=float), str(tmp_path / "m"))
+    loaded, meta = ai_analytics.load_churn_model(str(tmp_path / "m"))
+    pd.testing.assert_frame_equal(ai_analytics.score_churn(loaded, meta["features"], ds), whole, atol=1e-6)
+    assert ai_analytics.load_churn_model(str(tmp_path / "missing")) == (None, None)
@@ -0,0 +1,60 @@
+# test_cluster_metrics.py
+# pytest: scalable cluster-quality metrics of the test_model.py evaluation script
+# against sklearn's exact implementations.
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.metrics import davies_bouldin_score, silhouette_score
+
+import test_model
+
+
+@pytest.fixture(scope="module")
+def blobs():
+    rng = np.random.default_rng(0)
+    centers = np.array([[10.70, 122.55], [10.72, 122.57], [10.71, 122.60], [10.74, 122.54]])
+    sizes = [400, 150, 40, 3]
+    pts = np.vstack([c + rng.normal(0, 0.004, (n, 2)) for c, n in zip(centers, sizes)])
+    labels = np.repeat(np.arange(len(sizes)), sizes)
+    return pts, labels
+
+
+def test_davies_bouldin_matches_sklearn(blobs):
+    pts, labels = blobs
+    assert test_model.davies_bouldin(pts, labels) == pytest.approx(davies_bouldin_score(pts, labels))
+    # Label values need not be 0..k-1
+    assert test_model.davies_bouldin(pts, labels * 7 + 3) == pytest.approx(davies_bouldin_score(pts, labels))
+    assert test_model.davies_bouldin(pts, np.zeros(len(pts), dtype=int)) == 0.0
+
+
+def test_stratified_sample_keeps_every_label(blobs):
+    pts, labels = blobs
+    idx = test_model.stratified_sample(labels, 100, np.random.default_rng(1))
+    assert len(idx) == len(set(idx.tolist()))
+    counts = np.bincount(labels[idx], minlength=4)
+    assert (counts >= 2).all()
+    assert abs(len(idx) - 100) <= 4
+    assert counts[0] / counts[1] == pytest.approx(400 / 150, rel=0.1)
+    assert len(test_model.stratified_sample(labels, 10_000, np.random.default_rng(1))) == len(labels)
+
+
+def test_sampled_silhouette(blobs):
+    pts, labels = blobs
+    full = silhouette_score(pts, labels)
+    # A sample as large as the data is the exact score
+    mean, (lo, hi) = test_model.sampled_silhouette(pts, labels, sample_size=len(pts), rounds=2)
+    assert mean == pytest.approx(full) and lo == pytest.approx(hi)
+    mean, (lo, hi) = test_model.sampled_silhouette(pts, labels, sample_size=150, rounds=8)
+    assert lo <= mean <= hi and abs(mean - full) < 0.1
+    assert test_model.sampled_silhouette(pts, np.zeros(len(pts), dtype=int)) == (None, (None, None))
+
+
+def test_nearest_recommendation_is_haversine_nearest(blobs):
+    pts, _ = blobs
+    recs = pd.DataFrame({"lat": [10.70, 10.73, 10.715], "lng": [122.55, 122.56, 122.60]})
+    idx = test_model.nearest_recommendation(pts, recs)
+    lat1, lng1 = np.radians(pts[:, :1]), np.radians(pts[:, 1:])
+    lat2, lng2 = np.radians(recs["lat"].to_numpy())[None], np.radians(recs["lng"].to_numpy())[None]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    np.testing.assert_array_equal(idx, a.argmin(axis=1))
@@ -0,0 +1,49 @@
+# test_concurrent_fetch.py
+# pytest: the independent Firestore reads of ai_analytics.fetch_data and
+# service.fetch_data_firestore run concurrently and return the same results.
+
+import threading
+
+import pandas as pd
+import pytest
+
+import ai_analytics
+import service
+
+
+def _meeting(fn, barrier):
+    """fn, but only after the other read has started too (a sequential caller times out)."""
+    def wrapped(*args, **kwargs):
+        barrier.wait()
+        return fn(*args, **kwargs)
+    return wrapped
+
+
+def test_fetch_data_overlaps_stations_and_sales(fake_db, monkeypatch):
+    expected = ai_analytics.fetch_stations(fake_db), ai_analytics.fetch_sales(fake_db)
+    barrier = threading.Barrier(2, timeout=10)
+    monkeypatch.setattr(ai_analytics, "fetch_stations", _meeting(ai_analytics.fetch_stations, barrier))
+    monkeypatch.setattr(ai_analytics, "fetch_sales", _meeting(ai_analytics.fetch_sales, barrier))
+    stations_df, sales_df = ai_analytics.fetch_data(fake_db)
+    pd.testing.assert_frame_equal(stations_df, expected[0])
+    pd.testing.assert_frame_equal(sales_df, expected[1])
+
+
+def test_station_rows_read_during_order_scan(fake_db, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    baseline = service.fetch_data_firestore(fake_db)
+    barrier = threading.Barrier(2, timeout=10)
+    monkeypatch.setattr(service, "read_station_rows", _meeting(service.read_station_rows, barrier))
+    monkeypatch.setattr(service, "stream_refill_liters", _meeting(service.stream_refill_liters, barrier))
+    overlapped = service.fetch_data_firestore(fake_db)
+    pd.testing.assert_frame_equal(overlapped[0], baseline[0])
+    assert dict(overlapped[1]) == dict(baseline[1])
+
+
+def test_failed_read_propagates(fake_db, monkeypatch):
+    def broken(db):
+        raise ConnectionError("station_owners unavailable")
+
+    monkeypatch.setattr(ai_analytics, "fetch_stations", broken)
+    with pytest.raises(ConnectionError):
+        ai_analytics.fetch_data(fake_db)
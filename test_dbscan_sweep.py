@@ -0,0 +1,63 @@
+# test_dbscan_sweep.py
+# pytest: service.dbscan_sweep_district (one neighbor graph per district) against
+# sklearn's DBSCAN run separately for every (eps, min_samples).
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.cluster import DBSCAN
+
+import service
+
+EPS_GRID_M = [80.0, 150.0, 300.0, 600.0, 1200.0]
+MIN_SAMPLES_GRID = [2, 3, 5]
+
+
+def _stations(n=120, seed=0):
+    """A few dense pockets plus scattered stations around Iloilo City."""
+    rng = np.random.default_rng(seed)
+    centers = np.array([[10.700, 122.560], [10.720, 122.545], [10.735, 122.580]])
+    pocket = centers[rng.integers(0, len(centers), n // 2)] + rng.normal(0, 0.002, (n // 2, 2))
+    scatter = np.column_stack([rng.uniform(10.68, 10.76, n - n // 2), rng.uniform(122.52, 122.60, n - n // 2)])
+    return np.vstack([pocket, scatter])
+
+
+def _sklearn_labels(coords_deg, eps_m, min_samples):
+    return DBSCAN(eps=eps_m / service.EARTH_RADIUS_M, min_samples=min_samples, metric="haversine",
+                  algorithm="ball_tree").fit(np.radians(coords_deg)).labels_
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_sweep_matches_sklearn_counts(seed):
+    coords = _stations(seed=seed)
+    rows = service.dbscan_sweep_district(coords, EPS_GRID_M, MIN_SAMPLES_GRID)
+    assert len(rows) == len(EPS_GRID_M) * len(MIN_SAMPLES_GRID)
+    for row in rows:
+        labels = _sklearn_labels(coords, row["eps_m"], row["min_samples"])
+        n_clusters = len(set(labels) - {-1})
+        assert row["n_clusters"] == n_clusters, row
+        assert row["noise_ratio"] == pytest.approx((labels == -1).mean()), row
+
+
+def test_rows_are_sorted_and_bounded():
+    rows = service.dbscan_sweep_district(_stations(), EPS_GRID_M, MIN_SAMPLES_GRID)
+    assert [(r["eps_m"], r["min_samples"]) for r in rows] == [
+        (e, m) for e in EPS_GRID_M for m in MIN_SAMPLES_GRID]
+    for r in rows:
+        assert 0.0 <= r["noise_ratio"] <= 1.0 and 0.0 <= r["largest_cluster_share"] <= 1.0
+        assert r["kdist_elbow_m"] >= 0
+
+
+def test_min_samples_above_station_count():
+    rows = service.dbscan_sweep_district(_stations(n=4), [100.0], [2, 10])
+    big = [r for r in rows if r["min_samples"] == 10][0]
+    assert big["n_clusters"] == 0 and big["noise_ratio"] == 1.0 and np.isnan(big["kdist_elbow_m"])
+
+
+def test_parameter_sweep_skips_small_districts():
+    coords = _stations(n=40)
+    stations_df = pd.DataFrame({"lat": coords[:, 0], "lng": coords[:, 1],
+                                "district_name": ["Jaro"] * 39 + ["Molo"]})
+    table = service.dbscan_parameter_sweep(stations_df, [150.0, 600.0], [3])
+    assert set(table["district"]) == {"Jaro"}
+    assert (table["n_stations"] == 39).all() and len(table) == 2
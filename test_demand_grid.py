@@ -0,0 +1,122 @@
+# test_demand_grid.py
+# pytest: summed-area lookups of demand_grid.DemandGrid against brute force, and
+# incremental re-binning from the warehouse's dirty months.
+
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import demand_grid
+import fake_firestore
+import warehouse
+from conftest import order_doc, populate
+
+
+def _random_points(grid, n=2000, seed=1):
+    rng = np.random.default_rng(seed)
+    lat_min, lng_min, lat_max, lng_max = grid.bounds
+    return pd.DataFrame({
+        "customer_lat": rng.uniform(lat_min - 0.005, lat_max + 0.005, n),
+        "customer_lng": rng.uniform(lng_min - 0.005, lng_max + 0.005, n),
+        "yyyymm": rng.choice([202501, 202502, 202503, 202504], n),
+        "liters": rng.integers(1, 5, n) * 25.0,
+    })
+
+
+def _cell_centers(grid):
+    lat = grid.bounds[0] + (np.arange(grid.n_rows) + 0.5) * grid.dlat
+    lng = grid.bounds[1] + (np.arange(grid.n_cols) + 0.5) * grid.dlng
+    return np.meshgrid(lat, lng, indexing="ij")
+
+
+@pytest.fixture
+def grid():
+    g = demand_grid.DemandGrid()
+    g.set_months([], _random_points(g))
+    return g
+
+
+@pytest.mark.parametrize("months", [None, 202502, (202502, 202503)])
+def test_rect_sum_matches_brute_force(grid, months):
+    rng = np.random.default_rng(2)
+    lat_c, lng_c = _cell_centers(grid)
+    m0, m1 = grid._month_span(months)
+    for _ in range(25):
+        lat0, lat1 = np.sort(rng.uniform(grid.bounds[0], grid.bounds[2], 2))
+        lng0, lng1 = np.sort(rng.uniform(grid.bounds[1], grid.bounds[3], 2))
+        mask = (lat_c >= lat0) & (lat_c <= lat1) & (lng_c >= lng0) & (lng_c <= lng1)
+        got = grid.rect_sum(lat0, lng0, lat1, lng1, months=months)
+        assert got["liters"] == pytest.approx(grid.liters[m0:m1][:, mask].sum())
+        assert got["orders"] == pytest.approx(grid.orders[m0:m1][:, mask].sum())
+
+
+@pytest.mark.parametrize("radius_m", [150.0, 1000.0, 3500.0])
+def test_radius_sum_matches_brute_force(grid, radius_m):
+    rng = np.random.default_rng(3)
+    lat_c, lng_c = _cell_centers(grid)
+    for _ in range(10):
+        lat = rng.uniform(grid.bounds[0], grid.bounds[2])
+        lng = rng.uniform(grid.bounds[1], grid.bounds[3])
+        # Same planar cell metric the grid uses
+        dist = np.hypot((lat_c - lat) / grid.dlat, (lng_c - lng) / grid.dlng) * grid.cell_m
+        mask = dist <= radius_m
+        got = grid.radius_sum(lat, lng, radius_m)
+        assert got["liters"] == pytest.approx(grid.liters[:, mask].sum())
+        assert got["orders"] == pytest.approx(grid.orders[:, mask].sum())
+
+
+def test_points_outside_bounds_are_dropped(grid):
+    points = _random_points(grid)
+    _, _, inside = grid.cell_index(points["customer_lat"], points["customer_lng"])
+    assert grid.orders.sum() == inside.sum()
+    assert grid.liters.sum() == pytest.approx(points["liters"][inside].sum())
+
+
+def _full_build(conn):
+    return demand_grid.update_from_warehouse(conn, path=None)
+
+
+def test_incremental_update_matches_full_rebuild(tmp_path):
+    db = populate(fake_firestore.FakeFirestore())
+    # An old order with no updatedAt, still Pending at the first sync
+    late = order_doc(datetime(2025, 1, 15, 3, tzinfo=timezone.utc), "s1", refills=8, status="Pending",
+                     lat=10.73, lng=122.57)
+    db.collection("orders").document("late").set(late)
+    conn = warehouse.connect(str(tmp_path / "w.sqlite"))
+    path = str(tmp_path / "grid.npz")
+
+    warehouse.sync_from_firestore(conn, db)
+    first = demand_grid.update_from_warehouse(conn, path=path)
+    assert warehouse.dirty_months(conn) == []
+    before = first.rect_sum(*first.bounds, months=202501)["liters"]
+
+    # It completes without ever getting updatedAt: only the open-order re-read leg picks it up
+    db.collection("orders").document("late").update({"status": "Completed"})
+    warehouse.sync_from_firestore(conn, db)
+    assert 202501 in warehouse.dirty_months(conn)
+    updated = demand_grid.update_from_warehouse(conn, path=path)
+
+    assert updated.rect_sum(*updated.bounds, months=202501)["liters"] == pytest.approx(before + 8 * 25)
+    full = _full_build(conn)
+    assert updated.months == full.months
+    np.testing.assert_allclose(updated.liters, full.liters)
+    np.testing.assert_allclose(updated.orders, full.orders)
+    conn.close()
+
+
+def test_unknown_grid_format_is_rebuilt(tmp_path):
+    db = populate(fake_firestore.FakeFirestore(), n_orders=100)
+    conn = warehouse.connect(str(tmp_path / "w.sqlite"))
+    warehouse.sync_from_firestore(conn, db)
+    path = str(tmp_path / "grid.npz")
+    stale = demand_grid.DemandGrid()
+    np.savez_compressed(path, liters=stale.liters, orders=stale.orders,
+                        meta=np.array('{"bounds": %s, "cell_m": 100.0, "months": []}' % list(stale.bounds)))
+    warehouse.clear_dirty_months(conn, warehouse.dirty_months(conn))
+    grid = demand_grid.update_from_warehouse(conn, path=path)
+    assert grid.months == warehouse.order_months(conn)
+    assert os.path.exists(path)
+    conn.close()
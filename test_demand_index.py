@@ -0,0 +1,59 @@
+# test_demand_index.py
+# pytest: the per-group customer demand index of ai_analytics.py
+# (build_customer_demand_index) against filtering the joined sales per group.
+
+import pandas as pd
+import pytest
+
+import ai_analytics
+import fake_firestore
+from conftest import populate
+
+GROUP_COLS = ["waterType", "district"]
+
+
+@pytest.fixture(scope="module")
+def joined():
+    db = populate(fake_firestore.FakeFirestore(), n_orders=900)
+    stations_df, sales_df = ai_analytics.fetch_data(db)
+    return ai_analytics.build_station_joined_sales(sales_df, stations_df)
+
+
+def _naive_group(joined, key):
+    mask = pd.Series(True, index=joined.index)
+    for col, val in zip(GROUP_COLS, key):
+        mask &= joined[col] == val
+    sub = joined[mask].dropna(subset=["customer_lat", "customer_lng"])
+    sub = sub.assign(yyyymm=ai_analytics.yyyymm(sub))
+    per_month = (sub.groupby(["customer_lat", "customer_lng", "yyyymm"])
+                    .agg(orders=("saleId", "nunique"), sales=("totalPrice", "sum")).reset_index())
+    pts = (per_month.groupby(["customer_lat", "customer_lng"])
+                    .agg(orders=("orders", "sum"), sales=("sales", "sum")).reset_index())
+    return pts, int(per_month["yyyymm"].nunique())
+
+
+def test_group_slices_match_per_group_filtering(joined):
+    index = ai_analytics.build_customer_demand_index(joined, GROUP_COLS)
+    keys = list(joined.dropna(subset=["customer_lat"]).groupby(GROUP_COLS, observed=True).groups)
+    assert sorted(index.slices) == sorted(keys) and len(keys) > 1
+    for key in keys:
+        pts, months = index.group(key)
+        expected, expected_months = _naive_group(joined, key)
+        assert months == expected_months
+        got = pts[["customer_lat", "customer_lng", "orders", "sales"]].reset_index(drop=True)
+        pd.testing.assert_frame_equal(got, expected, check_dtype=False)
+
+
+def test_slices_are_contiguous_and_cover_all_rows(joined):
+    index = ai_analytics.build_customer_demand_index(joined, GROUP_COLS)
+    spans = sorted((sl.start, sl.stop) for sl in index.slices.values())
+    assert spans[0][0] == 0 and spans[-1][1] == len(index.pts)
+    assert all(a[1] == b[0] for a, b in zip(spans, spans[1:]))
+
+
+def test_unknown_group_and_empty_input(joined):
+    index = ai_analytics.build_customer_demand_index(joined, GROUP_COLS)
+    pts, months = index.group(("Sparkling", "Nowhere"))
+    assert pts.empty and months == 0
+    empty = ai_analytics.build_customer_demand_index(joined.iloc[:0], GROUP_COLS)
+    assert empty.slices == {} and list(empty.pts.columns[-2:]) == ["orders", "sales"]
@@ -0,0 +1,109 @@
+# test_fake_firestore.py
+# pytest: query semantics, writes, fixtures and I/O counters of fake_firestore.py.
+
+from datetime import datetime, timezone
+
+import pytest
+
+import fake_firestore
+
+T = datetime(2025, 3, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def db():
+    db = fake_firestore.FakeFirestore()
+    orders = db.collection("orders")
+    orders.document("a").set({"createdAt": T, "status": "Completed", "n": 3, "tags": ["x"]})
+    orders.document("b").set({"createdAt": "2025-03-02T00:00:00", "status": "Pending", "n": 1})
+    orders.document("c").set({"createdAt": T.replace(day=5), "status": "Completed", "n": 2, "tags": ["x", "y"]})
+    orders.document("d").set({"status": "Completed", "n": 2.5, "meta": {"region": "iloilo"}})
+    db.collection("station_owners").document("s1").collection("products").document("p1").set({"waterType": "Mineral"})
+    db.collection("station_owners").document("s2").collection("products").document("p1").set({"waterType": "Alkaline"})
+    db.reset_stats()
+    return db
+
+
+def _ids(query):
+    return [snap.id for snap in query.stream()]
+
+
+def test_range_filters_only_match_their_own_type(db):
+    orders = db.collection("orders")
+    assert _ids(orders.where("createdAt", ">=", T)) == ["a", "c"]
+    assert _ids(orders.where("createdAt", ">=", "2025-01-01")) == ["b"]
+    assert _ids(orders.where("n", ">", 1)) == ["a", "c", "d"]
+    assert _ids(orders.where("meta.region", "==", "iloilo")) == ["d"]
+    assert _ids(orders.where("status", "not-in", ["Pending"])) == ["a", "c", "d"]
+    assert _ids(orders.where("tags", "array-contains", "y")) == ["c"]
+    assert _ids(orders.where("tags", "array-contains-any", ["x", "z"])) == ["a", "c"]
+    assert _ids(orders.where(filter=type("F", (), {"field_path": "n", "op_string": "<", "value": 2})())) == ["b"]
+    with pytest.raises(ValueError):
+        _ids(orders.where("n", "~", 1))
+
+
+def test_order_by_limit_and_cursors(db):
+    orders = db.collection("orders")
+    by_n = orders.order_by("n", direction=fake_firestore.DESCENDING)
+    assert _ids(by_n) == ["a", "d", "c", "b"]
+    assert _ids(by_n.limit(2)) == ["a", "d"]
+    c = orders.document("c").get()
+    assert _ids(by_n.start_after(c)) == ["b"]
+    assert _ids(by_n.start_at(c)) == ["c", "b"]
+    assert _ids(orders.order_by("__name__").start_after("b")) == ["c", "d"]
+    # Ordering on a field drops documents without it, as in Firestore
+    assert _ids(orders.order_by("createdAt")) == ["a", "c", "b"]
+
+
+def test_writes_merge_update_delete_and_batches(db):
+    ref = db.collection("orders").document("a")
+    ref.set({"meta": {"k": 1}}, merge=True)
+    assert ref.get().to_dict()["status"] == "Completed" and ref.get().get("meta.k") == 1
+    ref.update({"status": "Cancelled"})
+    assert ref.get().get("status") == "Cancelled"
+    ref.delete()
+    assert not ref.get().exists
+
+    batch = db.batch()
+    for i in range(fake_firestore.MAX_BATCH_WRITES):
+        batch.set(db.collection("bulk").document(f"b{i}"), {"i": i})
+    with pytest.raises(ValueError):
+        batch.set(db.collection("bulk").document("over"), {})
+    batch.commit()
+    assert len(db.collection("bulk").get()) == fake_firestore.MAX_BATCH_WRITES
+    assert db.stats["rpc_commit"] == 1
+
+
+def test_snapshots_are_copies(db):
+    data = db.collection("orders").document("a").get().to_dict()
+    data["tags"].append("mutated")
+    assert db.collection("orders").document("a").get().to_dict()["tags"] == ["x"]
+
+
+def test_subcollections_and_collection_group(db):
+    assert sorted(s.get("waterType") for s in db.collection_group("products").stream()) == ["Alkaline", "Mineral"]
+    snap = next(iter(db.collection_group("products").where("waterType", "==", "Mineral").stream()))
+    assert snap.reference.parent.parent.id == "s1"
+    assert [c.id for c in db.collections()] == ["orders", "station_owners"]
+
+
+def test_ndjson_round_trip_keeps_timestamps(db, tmp_path):
+    path = str(tmp_path / "fixture.ndjson")
+    n = db.dump_ndjson(path)
+    copy = fake_firestore.FakeFirestore()
+    assert copy.load_ndjson(path) == n
+    assert copy.collection("orders").document("a").get().to_dict() == db.collection("orders").document("a").get().to_dict()
+    assert copy.collection("orders").document("b").get().get("createdAt") == "2025-03-02T00:00:00"
+
+
+def test_stream_pages_and_latency_are_counted(monkeypatch):
+    slept = []
+    monkeypatch.setattr(fake_firestore.time, "sleep", slept.append)
+    db = fake_firestore.FakeFirestore(fake_firestore.LatencyModel(rpc_latency_s=0.05, read_docs_per_s=1000))
+    for i in range(fake_firestore.STREAM_PAGE_SIZE * 2 + 1):
+        db._docs[f"orders/o{i:04d}"] = {"i": i}
+    assert len(db.collection("orders").get()) == fake_firestore.STREAM_PAGE_SIZE * 2 + 1
+    assert db.stats == {"rpc": 1, "rpc_stream": 1, "docs_read": fake_firestore.STREAM_PAGE_SIZE * 2 + 1}
+    # One RPC round trip, two more stream responses, and transfer time per page
+    assert slept.count(0.05) == 3
+    assert sum(s for s in slept if s != 0.05) == pytest.approx((fake_firestore.STREAM_PAGE_SIZE * 2 + 1) / 1000)
@@ -4,19 +4,21 @@
 
 import os
 import logging
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
-from sklearn.metrics import silhouette_score, davies_bouldin_score
+from sklearn.metrics import silhouette_score
 from sklearn.model_selection import train_test_split
+from sklearn.neighbors import BallTree
 
 from ai_analytics import (
     get_db,
-    fetch_sales,
-    fetch_stations,
+    fetch_data,
     build_station_joined_sales,
     recommend_new_locations,
     ASIA_MANILA
 )
+import warehouse
 
 # ----------------------------
 # Logging setup
@@ -27,10 +29,70 @@ logging.basicConfig(
     handlers=[logging.StreamHandler()]
 )
 
+# Silhouette is O(n²): score a stratified sample, repeated for a confidence interval
+SILHOUETTE_SAMPLE_SIZE = 5000
+SILHOUETTE_ROUNDS = 5
+
+EARTH_RADIUS_M = 6371000.0
+COVER_RADIUS_M = 500
+BACKTEST_WORKERS = min(4, os.cpu_count() or 1)  # walk-forward folds run in parallel; <=1 runs serially
+
+# ----------------------------
+# Metric helpers
+# ----------------------------
+def nearest_recommendation(pts, recs_df):
+    """Index of the nearest recommendation for every (lat, lng) point, via one BallTree query."""
+    tree = BallTree(np.radians(recs_df[["lat", "lng"]].values), metric="haversine")
+    _, idx = tree.query(np.radians(pts), k=1)
+    return idx[:, 0]
+
+def stratified_sample(labels, n, rng):
+    """Row indices of a sample of ~n points, proportional per label (at least 2 per label when possible)."""
+    if len(labels) <= n:
+        return np.arange(len(labels))
+    counts = np.bincount(labels)
+    take = np.maximum(np.minimum(counts, 2), np.round(counts * n / len(labels)).astype(int))
+    # Random order inside each label block, then keep the first `take` of each block
+    perm = rng.permutation(len(labels))
+    order = perm[np.argsort(labels[perm], kind="stable")]
+    starts = np.cumsum(counts) - counts
+    rank = np.arange(len(order)) - np.repeat(starts, counts)
+    return order[rank < np.repeat(take, counts)]
+
+def sampled_silhouette(pts, labels, sample_size=SILHOUETTE_SAMPLE_SIZE, rounds=SILHOUETTE_ROUNDS, seed=42):
+    """Mean silhouette over `rounds` stratified samples, with a 95% normal-approximation CI."""
+    rng = np.random.default_rng(seed)
+    scores = []
+    for _ in range(rounds):
+        idx = stratified_sample(labels, sample_size, rng)
+        if len(np.unique(labels[idx])) < 2:
+            continue
+        scores.append(silhouette_score(pts[idx], labels[idx]))
+    if not scores:
+        return None, (None, None)
+    scores = np.array(scores)
+    half = 1.96 * scores.std(ddof=1) / np.sqrt(len(scores)) if len(scores) > 1 else 0.0
+    return float(scores.mean()), (float(scores.mean() - half), float(scores.mean() + half))
+
+def davies_bouldin(pts, labels):
+    """Davies–Bouldin index computed with bincount centroids and one centroid distance matrix."""
+    _, labels = np.unique(labels, return_inverse=True)
+    k = labels.max() + 1
+    counts = np.bincount(labels, minlength=k).astype(float)
+    centroids = np.stack([np.bincount(labels, weights=pts[:, d], minlength=k) for d in range(pts.shape[1])], axis=1)
+    centroids /= counts[:, None]
+    scatter = np.bincount(labels, weights=np.linalg.norm(pts - centroids[labels], axis=1), minlength=k) / counts
+    sep = np.linalg.norm(centroids[:, None, :] - centroids[None, :, :], axis=2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = (scatter[:, None] + scatter[None, :]) / sep
+    ratio[~np.isfinite(ratio)] = 0.0
+    np.fill_diagonal(ratio, 0.0)
+    return float(ratio.max(axis=1).mean()) if k > 1 else 0.0
+
 # ----------------------------
 # Cluster Quality Evaluation
 # ----------------------------
-def evaluate_clusters(df_joined, stations_df):
+def evaluate_clusters(df_joined, stations_df, sample_size=SILHOUETTE_SAMPLE_SIZE, rounds=SILHOUETTE_ROUNDS):
     logging.info("Running recommendation model for evaluation…")
     recs = recommend_new_locations(df_joined, stations_df)
     if not recs:
@@ -46,13 +108,15 @@ def evaluate_clusters(df_joined, stations_df):
         pts = df_joined[["customer_lat", "customer_lng"]].dropna().values
         if len(pts) > 2:
             # dummy labels: assign each point to nearest recommendation
-            labels = []
-            for lat, lng in pts:
-                dists = np.sqrt((recs_df["lat"] - lat) ** 2 + (recs_df["lng"] - lng) ** 2)
-                labels.append(np.argmin(dists))
-            sil = silhouette_score(pts, labels)
-            dbi = davies_bouldin_score(pts, labels)
-            logging.info(f"Silhouette Score: {sil:.3f}")
+            labels = nearest_recommendation(pts, recs_df)
+            if len(np.unique(labels)) < 2:
+                logging.warning("All demand points map to one recommendation; metrics undefined.")
+                return recs_df
+            sil, (lo, hi) = sampled_silhouette(pts, labels, sample_size=sample_size, rounds=rounds)
+            dbi = davies_bouldin(pts, labels)
+            if sil is not None:
+                logging.info(f"Silhouette Score: {sil:.3f} (95% CI {lo:.3f}–{hi:.3f}, "
+                             f"{rounds} x {min(sample_size, len(pts))} sampled points)")
             logging.info(f"Davies–Bouldin Index: {dbi:.3f}")
         else:
             logging.warning("Not enough points for global cluster metrics.")
@@ -64,7 +128,69 @@ def evaluate_clusters(df_joined, stations_df):
 # ----------------------------
 # Backtesting (hold-out validation)
 # ----------------------------
-def backtest(df_joined, stations_df, test_size=0.2):
+def coverage(test_df, recs_df, cover_radius_m=COVER_RADIUS_M):
+    """Share of test rows whose customer lies within cover_radius_m of any recommendation."""
+    if len(test_df) == 0 or recs_df.empty:
+        return 0
+    pts = test_df[["customer_lat", "customer_lng"]].dropna().values
+    if len(pts) == 0:
+        return 0
+    tree = BallTree(np.radians(recs_df[["lat", "lng"]].values), metric="haversine")
+    counts = tree.query_radius(np.radians(pts), r=cover_radius_m / EARTH_RADIUS_M, count_only=True)
+    return int((counts > 0).sum()) / len(test_df)
+
+def _walk_forward_fold(month, train_df, test_df, stations_df, cover_radius_m):
+    # Folds already run in parallel, so cluster each fold serially
+    recs = recommend_new_locations(train_df, stations_df, workers=1)
+    recs_df = pd.DataFrame([r.__dict__ for r in recs])
+    return {
+        "test_month": str(month),
+        "train_rows": len(train_df),
+        "test_rows": len(test_df),
+        "recommendations": len(recs_df),
+        "coverage": coverage(test_df, recs_df, cover_radius_m),
+    }
+
+def walk_forward_backtest(df_joined, stations_df, cover_radius_m=COVER_RADIUS_M, workers=None):
+    """
+    Train on all months <= T, test on month T+1, for every T with a following month.
+    Returns one row per fold.
+    """
+    months = df_joined["createdAt"].dt.tz_convert(ASIA_MANILA).dt.tz_localize(None).dt.to_period("M")
+    folds = []
+    for month in sorted(months.unique())[:-1]:
+        test_mask = (months == month + 1).values
+        if not test_mask.any():
+            continue
+        folds.append((month + 1, df_joined[(months <= month).values], df_joined[test_mask]))
+    if not folds:
+        return pd.DataFrame()
+
+    workers = BACKTEST_WORKERS if workers is None else workers
+    workers = min(workers, len(folds))
+    args = [(m, tr, te, stations_df, cover_radius_m) for m, tr, te in folds]
+    if workers <= 1:
+        results = [_walk_forward_fold(*a) for a in args]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_walk_forward_fold, *zip(*args)))
+    return pd.DataFrame(results)
+
+def backtest(df_joined, stations_df, test_size=0.2, mode="holdout", cover_radius_m=COVER_RADIUS_M, workers=None):
+    if mode == "walk_forward":
+        logging.info("Walk-forward backtest (train months <= T, test month T+1)…")
+        folds = walk_forward_backtest(df_joined, stations_df, cover_radius_m=cover_radius_m, workers=workers)
+        if folds.empty:
+            logging.warning("Not enough months for walk-forward backtest.")
+            return None
+        for f in folds.itertuples(index=False):
+            logging.info(f"  {f.test_month}: train={f.train_rows} test={f.test_rows} "
+                         f"recs={f.recommendations} coverage={f.coverage:.2%}")
+        weighted = float(np.average(folds["coverage"], weights=folds["test_rows"]))
+        logging.info(f"Walk-forward coverage within {cover_radius_m}m: mean {folds['coverage'].mean():.2%}, "
+                     f"row-weighted {weighted:.2%} over {len(folds)} folds")
+        return weighted
+
     logging.info(f"Backtesting with {test_size*100:.0f}% holdout customers…")
     train_df, test_df = train_test_split(df_joined, test_size=test_size, random_state=42)
 
@@ -76,30 +202,25 @@ def backtest(df_joined, stations_df, test_size=0.2):
     recs_df = pd.DataFrame([r.__dict__ for r in recs])
 
     # Check coverage: how many test customers fall near a recommended location
-    cover_radius_m = 500  # meters
-    covered = 0
-    for _, row in test_df.iterrows():
-        lat, lng = row["customer_lat"], row["customer_lng"]
-        if pd.isna(lat) or pd.isna(lng):
-            continue
-        dists = np.sqrt((recs_df["lat"] - lat) ** 2 + (recs_df["lng"] - lng) ** 2)
-        if dists.min() * 111000 < cover_radius_m:  # rough lat/lng→meters
-            covered += 1
-
-    coverage = covered / len(test_df) if len(test_df) > 0 else 0
-    logging.info(f"Backtest coverage within {cover_radius_m}m: {coverage:.2%}")
-    return coverage
+    cov = coverage(test_df, recs_df, cover_radius_m)
+    logging.info(f"Backtest coverage within {cover_radius_m}m: {cov:.2%}")
+    return cov
 
 # ----------------------------
 # MAIN
 # ----------------------------
-def main():
+def main(source="firestore", warehouse_path=warehouse.WAREHOUSE_PATH):
     logging.info("Connecting to Firestore…")
     db = get_db()
 
     logging.info("Fetching stations & sales…")
-    stations_df = fetch_stations(db)
-    sales_df = fetch_sales(db)
+    if source == "warehouse":
+        wh = warehouse.connect(warehouse_path)
+        warehouse.sync_from_firestore(wh, db)
+        stations_df = warehouse.load_stations(wh)
+        sales_df = warehouse.load_sales(wh)
+    else:
+        stations_df, sales_df = fetch_data(db)
 
     if sales_df.empty or stations_df.empty:
         logging.error("No data available for testing.")
@@ -116,7 +237,13 @@ def main():
 
     # Run backtesting
     backtest(joined, stations_df, test_size=0.2)
+    backtest(joined, stations_df, mode="walk_forward")
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", choices=["firestore", "warehouse"], default="firestore")
+    parser.add_argument("--warehouse_path", type=str, default=warehouse.WAREHOUSE_PATH)
+    args = parser.parse_args()
+    main(source=args.source, warehouse_path=args.warehouse_path)
@@ -0,0 +1,87 @@
+# test_order_scan.py
+# pytest: the paged, checkpointed Completed-orders scan of service.py
+# (iter_order_pages / stream_refill_liters).
+
+import os
+import pickle
+from datetime import datetime, timedelta
+
+import pytest
+
+import service
+from conftest import order_doc
+
+
+def _plain(liters):
+    station_monthly, overall_monthly, station_daily = liters
+    return ({k: dict(v) for k, v in station_monthly.items()}, dict(overall_monthly),
+            {k: dict(v) for k, v in station_daily.items()})
+
+
+@pytest.fixture
+def db(fake_db):
+    # Orders the scan must skip
+    fake_db.collection("orders").document("pending").set(
+        order_doc(datetime(2025, 2, 1), "s0", refills=40, status="Pending"))
+    return fake_db
+
+
+def test_pages_cover_every_completed_order_once(db):
+    pages = list(service.iter_order_pages(db, page_size=64))
+    ids = [snap.id for page in pages for snap in page]
+    assert all(len(page) == 64 for page in pages[:-1])
+    assert ids == sorted(ids) and len(ids) == len(set(ids))
+    completed = {d.id for d in db.collection("orders").stream() if d.to_dict()["status"] == "Completed"}
+    assert set(ids) == completed
+
+
+def test_page_size_does_not_change_totals(db):
+    whole = _plain(service.stream_refill_liters(db, page_size=10_000, checkpoint_path=None))
+    paged = _plain(service.stream_refill_liters(db, page_size=37, checkpoint_path=None))
+    assert whole == paged
+    assert sum(whole[1].values()) > 0
+
+
+def test_interrupted_scan_resumes_from_checkpoint(db, tmp_path, monkeypatch):
+    path = str(tmp_path / "orders_scan.pkl")
+    expected = _plain(service.stream_refill_liters(db, page_size=50, checkpoint_path=None))
+
+    accumulate = service.accumulate_liters
+    calls = []
+
+    def failing(*args):
+        calls.append(1)
+        if len(calls) == 4:
+            raise ConnectionError("stream reset")
+        return accumulate(*args)
+
+    monkeypatch.setattr(service, "accumulate_liters", failing)
+    with pytest.raises(ConnectionError):
+        service.stream_refill_liters(db, page_size=50, checkpoint_path=path)
+    state = service.load_scan_checkpoint(path)
+    assert state["order_count"] == 150
+
+    resumed_pages = []
+    monkeypatch.setattr(service, "accumulate_liters", lambda *a: resumed_pages.append(1) or accumulate(*a))
+    resumed = _plain(service.stream_refill_liters(db, page_size=50, checkpoint_path=path))
+    assert resumed == expected
+    # Only the pages after the checkpoint are read again
+    assert len(resumed_pages) == len(list(service.iter_order_pages(db, page_size=50))) - 3
+    assert not os.path.exists(path)
+
+
+def test_stale_or_unreadable_checkpoint_is_ignored(tmp_path):
+    path = str(tmp_path / "orders_scan.pkl")
+    service.save_scan_checkpoint(path, "o1", 1, {}, {}, {})
+    assert service.load_scan_checkpoint(path)["last_doc_id"] == "o1"
+
+    with open(path, "rb") as f:
+        state = pickle.load(f)
+    state["saved_at"] -= timedelta(hours=service.SCAN_CHECKPOINT_MAX_AGE_HOURS + 1)
+    with open(path, "wb") as f:
+        pickle.dump(state, f)
+    assert service.load_scan_checkpoint(path) is None
+
+    with open(path, "wb") as f:
+        f.write(b"truncated")
+    assert service.load_scan_checkpoint(path) is None
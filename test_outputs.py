@@ -0,0 +1,84 @@
+# test_outputs.py
+# pytest: partitioned Parquet output tables of ai_analytics.py (write_output / read_output).
+
+import os
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+import ai_analytics
+import stage_cache
+
+
+@pytest.fixture
+def out_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(ai_analytics, "OUT_DIR", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return stage_cache.StageCache(root=str(tmp_path / "stage_cache"))
+
+
+def _daily(values):
+    """timeseries_daily_per_station rows: one per (date, liters)."""
+    return pd.DataFrame({
+        "stationOwnerId": "s1",
+        "waterType": "Alkaline",
+        "date": pd.to_datetime(list(values)),
+        "orders": 1,
+        "totalSales": [float(v) for v in values.values()],
+    })
+
+
+def test_snapshot_reads_newest_run_only(out_dir, cache):
+    name = "rfm_by_customer"
+    ai_analytics.write_output(pd.DataFrame({"customerId": ["a", "b"], "frequency": [1, 2]}), name,
+                              run_date="2025-03-01", cache=cache)
+    ai_analytics.write_output(pd.DataFrame({"customerId": ["a"], "frequency": [5]}), name,
+                              run_date="2025-03-02", cache=cache)
+    latest = ai_analytics.read_output(name)
+    assert latest["customerId"].tolist() == ["a"] and latest["run_date"].unique().tolist() == ["2025-03-02"]
+    older = ai_analytics.read_output(name, partitions=["2025-03-01"])
+    assert older["frequency"].tolist() == [1, 2]
+
+
+def test_empty_snapshot_replaces_previous(out_dir, cache):
+    name = "recommendations_new_stations"
+    ai_analytics.write_output(pd.DataFrame({"lat": [10.7], "lng": [122.5]}), name,
+                              run_date="2025-03-01", cache=cache)
+    ai_analytics.write_output(pd.DataFrame({"lat": pd.Series(dtype=float), "lng": pd.Series(dtype=float)}),
+                              name, run_date="2025-03-02", cache=cache)
+    assert ai_analytics.read_output(name).empty
+
+
+def test_only_changed_months_are_rewritten(out_dir, cache):
+    name = "timeseries_daily_per_station"
+    rows = {"2025-01-05": 100, "2025-01-20": 50, "2025-02-03": 75, "2025-03-09": 25}
+    ai_analytics.write_output(_daily(rows), name, cache=cache)
+    mar = os.path.join(str(out_dir), name, "month=2025-03", "part-0.parquet")
+    mar_mtime = os.stat(mar).st_mtime_ns
+
+    # A late refill lands in the (closed) January partition
+    rows["2025-01-28"] = 40
+    cache.hits, cache.misses = [], []
+    ai_analytics.write_output(_daily(rows), name, cache=cache)
+    assert len(cache.misses) == 1 and len(cache.hits) == 2
+    assert os.stat(mar).st_mtime_ns == mar_mtime
+
+    jan = ai_analytics.read_output(name, partitions=["2025-01"])
+    assert jan["totalSales"].sum() == pytest.approx(190.0)
+    assert ai_analytics.read_output(name)["totalSales"].sum() == pytest.approx(290.0)
+
+
+def test_partition_file_changed_on_disk_is_rewritten(out_dir, cache):
+    name = "timeseries_daily_per_station"
+    df = _daily({"2025-01-05": 100})
+    ai_analytics.write_output(df, name, cache=cache)
+    path = os.path.join(str(out_dir), name, "month=2025-01", "part-0.parquet")
+    df.assign(totalSales=0.0).to_parquet(path, index=False)
+    ai_analytics.write_output(df, name, cache=cache)
+    assert ai_analytics.read_output(name)["totalSales"].sum() == pytest.approx(100.0)
@@ -0,0 +1,39 @@
+# test_recommend.py
+# pytest: per-group KMeans recommendations of ai_analytics.py, serial vs process pool.
+
+import pandas as pd
+import pytest
+
+import ai_analytics
+import fake_firestore
+from conftest import populate
+
+
+@pytest.fixture(scope="module")
+def joined_and_stations():
+    db = populate(fake_firestore.FakeFirestore(), n_orders=1500)
+    stations_df, sales_df = ai_analytics.fetch_data(db)
+    return ai_analytics.build_station_joined_sales(sales_df, stations_df), stations_df
+
+
+def _frame(recs):
+    return pd.DataFrame([r.__dict__ for r in recs])
+
+
+def test_pool_matches_serial_and_reports_timing(joined_and_stations, capsys):
+    joined, stations_df = joined_and_stations
+    serial = ai_analytics.recommend_new_locations(joined, stations_df, workers=1)
+    out = capsys.readouterr().out
+    assert "KMeans:" in out and "group(s) clustered in" in out and "on 1 worker(s)" in out
+
+    pooled = ai_analytics.recommend_new_locations(joined, stations_df, workers=2)
+    assert serial, "fixture should yield recommendations"
+    pd.testing.assert_frame_equal(_frame(serial), _frame(pooled))
+
+
+def test_no_groups_prints_nothing(joined_and_stations, capsys):
+    _, stations_df = joined_and_stations
+    empty = pd.DataFrame(columns=["customerId", "customer_lat", "customer_lng", "stationOwnerId",
+                                  "waterType", "district", "createdAt", "totalPrice", "saleId"])
+    assert ai_analytics.recommend_new_locations(empty, stations_df) == []
+    assert "KMeans:" not in capsys.readouterr().out
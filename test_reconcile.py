@@ -0,0 +1,96 @@
+# test_reconcile.py
+# pytest: sparse station → district → Overall forecast reconciliation in service.py.
+
+import numpy as np
+import pytest
+
+import service
+
+DISTRICTS = ["Jaro", "Molo", "Jaro", "La Paz", "Molo", "Jaro"]
+
+
+@pytest.fixture
+def hierarchy():
+    C, names = service.build_aggregation_matrix(DISTRICTS)
+    rng = np.random.default_rng(0)
+    base_bottom = rng.uniform(100, 1000, (len(DISTRICTS), 4))
+    # Aggregate base forecasts that disagree with the station sums
+    base_agg = (C @ base_bottom) * rng.uniform(0.8, 1.2, (C.shape[0], 1))
+    return C, names, base_bottom, base_agg
+
+
+def _dense_projection(C, base_agg, base_bottom, w_agg, w_bottom):
+    """Textbook S (S' W^-1 S)^-1 S' W^-1 y with S = [C; I], on dense matrices."""
+    S = np.vstack([C.toarray(), np.eye(C.shape[1])])
+    W_inv = np.diag(1.0 / np.concatenate([w_agg, w_bottom]))
+    y = np.vstack([base_agg, base_bottom])
+    P = np.linalg.solve(S.T @ W_inv @ S, S.T @ W_inv)
+    return S @ P @ y
+
+
+def test_aggregation_matrix_structure():
+    C, names = service.build_aggregation_matrix(DISTRICTS)
+    assert names == ["Jaro", "La Paz", "Molo"]
+    dense = C.toarray()
+    assert dense.shape == (4, len(DISTRICTS))
+    assert (dense[0] == 1).all()
+    assert (dense[1:].sum(axis=0) == 1).all()
+    assert dense[1].tolist() == [1, 0, 1, 0, 0, 1]
+
+
+@pytest.mark.parametrize("method", service.RECONCILE_METHODS)
+def test_reconciled_forecasts_are_coherent(hierarchy, method):
+    C, _, base_bottom, base_agg = hierarchy
+    var = np.full(C.shape[1], 50.0)
+    rec_agg, rec_bottom = service.reconcile_forecasts(
+        C, base_agg, base_bottom, method=method, var_agg=np.full(C.shape[0], 80.0), var_bottom=var,
+        history_bottom=base_bottom[:, 0])
+    np.testing.assert_allclose(rec_agg, C @ rec_bottom)
+    assert (rec_bottom >= 0).all()
+
+
+def test_bottom_up_keeps_station_forecasts(hierarchy):
+    C, _, base_bottom, base_agg = hierarchy
+    rec_agg, rec_bottom = service.reconcile_forecasts(C, base_agg, base_bottom, method="bottom_up")
+    np.testing.assert_allclose(rec_bottom, base_bottom)
+
+
+def test_top_down_splits_overall_by_history(hierarchy):
+    C, _, base_bottom, base_agg = hierarchy
+    history = np.arange(1.0, len(DISTRICTS) + 1)
+    rec_agg, rec_bottom = service.reconcile_forecasts(C, base_agg, base_bottom, method="top_down",
+                                                      history_bottom=history)
+    np.testing.assert_allclose(rec_agg[0], base_agg[0])
+    np.testing.assert_allclose(rec_bottom[:, 0], base_agg[0, 0] * history / history.sum())
+
+
+@pytest.mark.parametrize("method", ["ols", "wls", "mint"])
+def test_projection_matches_dense_formula(hierarchy, method):
+    C, _, base_bottom, base_agg = hierarchy
+    rng = np.random.default_rng(1)
+    var_agg, var_bottom = rng.uniform(10, 100, C.shape[0]), rng.uniform(10, 100, C.shape[1])
+    rec_agg, rec_bottom = service.reconcile_forecasts(C, base_agg, base_bottom, method=method,
+                                                      var_agg=var_agg, var_bottom=var_bottom)
+    structural = np.asarray(C.sum(axis=1)).ravel()
+    w_agg, w_bottom = {
+        "ols": (np.ones(C.shape[0]), np.ones(C.shape[1])),
+        "wls": (structural, np.ones(C.shape[1])),
+        "mint": (var_agg, var_bottom),
+    }[method]
+    expected = _dense_projection(C, base_agg, base_bottom, w_agg, w_bottom)
+    np.testing.assert_allclose(np.vstack([rec_agg, rec_bottom]), expected, rtol=1e-9)
+
+
+@pytest.mark.parametrize("method", ["ols", "wls", "mint"])
+def test_coherent_input_is_a_fixed_point(hierarchy, method):
+    C, _, base_bottom, _ = hierarchy
+    rec_agg, rec_bottom = service.reconcile_forecasts(
+        C, C @ base_bottom, base_bottom, method=method,
+        var_agg=np.full(C.shape[0], np.nan), var_bottom=np.full(C.shape[1], np.nan))
+    np.testing.assert_allclose(rec_bottom, base_bottom)
+
+
+def test_unknown_method_raises(hierarchy):
+    C, _, base_bottom, base_agg = hierarchy
+    with pytest.raises(ValueError):
+        service.reconcile_forecasts(C, base_agg, base_bottom, method="median")
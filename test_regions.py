@@ -0,0 +1,92 @@
+# test_regions.py
+# pytest: region parameter sets of regions.py: namespaced outputs, filtered
+# scans, regions.json loading and per-region run checkpoints.
+
+import json
+import os
+
+import pytest
+
+import fake_firestore
+import regions
+import service
+from conftest import order_doc
+
+
+@pytest.fixture
+def in_tmp(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_namespaces_outputs_but_not_the_default_region():
+    db = fake_firestore.FakeFirestore()
+    bacolod = regions.Region(name="bacolod", filters=[["cityId", "==", "bacolod"]])
+    assert bacolod.namespace == "bacolod" and bacolod.filters == [("cityId", "==", "bacolod")]
+    assert bacolod.collection(db, "demand_rollups").document("x").path == "regions/bacolod/demand_rollups/x"
+    assert regions.DEFAULT_REGION.collection(db, "demand_rollups").document("x").path == "demand_rollups/x"
+    assert bacolod.path(os.path.join("out", "checkpoints", "a.json")) == \
+        os.path.join(regions.REGIONS_OUT_DIR, "bacolod", "checkpoints", "a.json")
+    assert bacolod.path("/elsewhere/a.json") == os.path.join(regions.REGIONS_OUT_DIR, "bacolod", "a.json")
+    assert regions.DEFAULT_REGION.path(os.path.join("out", "a.json")) == os.path.join("out", "a.json")
+
+
+def test_query_applies_region_filters():
+    db = fake_firestore.FakeFirestore()
+    for i, city in enumerate(["iloilo", "bacolod", "bacolod"]):
+        doc = order_doc("2025-01-01T00:00:00Z", f"s{i}")
+        doc["cityId"] = city
+        db.collection("orders").document(f"o{i}").set(doc)
+    bacolod = regions.Region(name="bacolod", filters=[("cityId", "==", "bacolod")])
+    assert [d.id for d in bacolod.query(db, "orders").stream()] == ["o1", "o2"]
+    assert len(regions.DEFAULT_REGION.query(db, "orders").get()) == 3
+
+
+def test_bounds_from_district_polygons(in_tmp):
+    gj = {"type": "FeatureCollection", "features": [
+        {"type": "Feature", "geometry": {"type": "Polygon", "coordinates": [
+            [[122.9, 10.6], [123.0, 10.6], [123.0, 10.7], [122.9, 10.6]]]}},
+        {"type": "Feature", "geometry": {"type": "MultiPolygon", "coordinates": [
+            [[[122.8, 10.65], [122.85, 10.65], [122.85, 10.8], [122.8, 10.65]]]]}},
+    ]}
+    (in_tmp / "b.geojson").write_text(json.dumps(gj))
+    m = regions.GRID_MARGIN_DEG
+    bounds = regions.Region(name="b", districts_geojson="b.geojson").bounds()
+    assert bounds == pytest.approx((10.6 - m, 122.8 - m, 10.8 + m, 123.0 + m))
+    assert regions.Region(name="b", grid_bounds=[1, 2, 3, 4]).bounds() == (1.0, 2.0, 3.0, 4.0)
+
+
+def test_load_regions(in_tmp):
+    assert regions.load_regions() == [regions.DEFAULT_REGION]
+    (in_tmp / regions.REGIONS_PATH).write_text(json.dumps([
+        {"name": "iloilo", "namespace": ""}, {"name": "bacolod", "filters": [["cityId", "==", "bacolod"]]}]))
+    loaded = regions.load_regions()
+    assert [r.name for r in loaded] == ["iloilo", "bacolod"]
+    assert regions.get_region("bacolod").filters == [("cityId", "==", "bacolod")]
+    assert regions.get_region(None) is regions.DEFAULT_REGION
+    with pytest.raises(ValueError):
+        regions.get_region("cebu")
+    (in_tmp / regions.REGIONS_PATH).write_text(json.dumps([{"name": "a"}, {"name": "a"}]))
+    with pytest.raises(ValueError, match="Duplicate"):
+        regions.load_regions()
+
+
+def test_run_region_records_outcome_and_resume_skips_done(in_tmp, monkeypatch):
+    calls = []
+
+    def fake_main(region, **kwargs):
+        calls.append((region.name, kwargs))
+        if region.name == "bad":
+            raise RuntimeError("no fixtures")
+
+    monkeypatch.setattr(service, "main", fake_main)
+    good, bad = regions.Region(name="good"), regions.Region(name="bad")
+    assert regions.run_region(good, "r1", {"mode": "warehouse"})["status"] == "done"
+    state = regions.run_region(bad, "r1", {})
+    assert state["status"] == "failed" and "RuntimeError: no fixtures" in state["error"]
+    assert calls == [("good", {"mode": "warehouse"}), ("bad", {})]
+    assert regions.load_region_state(good)["run_id"] == "r1"
+    assert os.path.exists(os.path.join(regions.REGIONS_OUT_DIR, "bad", "region_run.json"))
+
+    # Finished regions are skipped for the same run id (no worker pool started)
+    assert regions.run_regions([good], run_id="r1") == []
@@ -0,0 +1,71 @@
+# test_rollups.py
+# pytest: station / district / waterType / overall demand rollup docs of service.py.
+
+from collections import defaultdict
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import fake_firestore
+import service
+
+
+def _unpack(blob):
+    return np.frombuffer(blob, dtype="<f4")
+
+
+@pytest.fixture
+def daily():
+    rng = np.random.default_rng(0)
+    liters = defaultdict(dict)
+    for sid in ("s0", "s1", "s2", "s9"):
+        for k in rng.choice(500, 120, replace=False):
+            liters[sid][date(2024, 10, 1) + timedelta(days=int(k))] = float(rng.integers(1, 40) * 25)
+    return liters
+
+
+@pytest.fixture
+def stations_df():
+    return pd.DataFrame({"station_id": ["s0", "s1", "s2"], "district_name": ["Jaro", "Jaro", "La Paz"],
+                         "water_type": ["Alkaline", "Mineral", "Alkaline"]})
+
+
+def test_resolutions_agree_and_match_input(daily, stations_df):
+    docs = service.build_demand_rollups(daily, stations_df)
+    for doc in docs.values():
+        d, w, m = (_unpack(doc[k]).astype(float) for k in ("daily_m3", "weekly_m3", "monthly_m3"))
+        assert (len(d), len(w), len(m)) == (366, 53, 12)
+        assert w.sum() == pytest.approx(d.sum(), rel=1e-5) and m.sum() == pytest.approx(d.sum(), rel=1e-5)
+        assert doc["total_m3"] == pytest.approx(m.sum(), rel=1e-5)
+
+    s0_2025 = {day: v for day, v in daily["s0"].items() if day.year == 2025}
+    doc = docs["station_s0_2025"]
+    assert doc["total_m3"] == pytest.approx(sum(s0_2025.values()) / service.LITERS_PER_M3)
+    some_day = min(s0_2025)
+    assert _unpack(doc["daily_m3"])[some_day.timetuple().tm_yday - 1] == pytest.approx(
+        s0_2025[some_day] / service.LITERS_PER_M3)
+
+
+def test_levels_partition_the_overall_total(daily, stations_df):
+    docs = service.build_demand_rollups(daily, stations_df)
+    for year in (2024, 2025, 2026):
+        overall = docs[f"overall_Overall_{year}"]["total_m3"]
+        for level in ("station", "district", "waterType"):
+            level_sum = sum(d["total_m3"] for d in docs.values() if d["level"] == level and d["year"] == year)
+            assert level_sum == pytest.approx(overall)
+    # Stations missing from stations_df roll up under "Unknown"
+    assert "district_Unknown_2025" in docs and "waterType_Unknown_2025" in docs
+    assert docs["district_Jaro_2025"]["total_m3"] == pytest.approx(
+        docs["station_s0_2025"]["total_m3"] + docs["station_s1_2025"]["total_m3"])
+
+
+def test_empty_input_and_save(daily, stations_df):
+    assert service.build_demand_rollups({}, stations_df) == {}
+    db = fake_firestore.FakeFirestore()
+    docs = service.build_demand_rollups(daily, stations_df)
+    service.save_demand_rollups(db, docs, batch_size=7)
+    saved = {d.id: d.to_dict() for d in db.collection(service.ROLLUPS_COLLECTION).stream()}
+    assert set(saved) == set(docs)
+    assert saved["overall_Overall_2025"]["monthly_m3"] == docs["overall_Overall_2025"]["monthly_m3"]
@@ -0,0 +1,74 @@
+# test_sales_columns.py
+# pytest: typed sales column buffers of ai_analytics.py (SalesColumnBuilder / fetch_sales).
+
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ai_analytics
+from conftest import order_doc
+
+RAW_TIMESTAMPS = [
+    datetime(2025, 3, 31, 20, 0),                       # naive datetime: Manila local (to_dt)
+    datetime(2025, 3, 31, 20, 0, tzinfo=timezone.utc),
+    "2025-03-31T20:00:00Z",
+    "2025-03-31T20:00:00",                              # naive ISO string: UTC (to_dt)
+    "2025-04-01T04:00:00+08:00",
+    pd.Timestamp("2025-03-31 15:59:59.999", tz="UTC"),
+    None,
+    "not a date",
+    1743450000,
+]
+
+
+def _builder(values):
+    b = ai_analytics.SalesColumnBuilder()
+    for i, v in enumerate(values):
+        b.append(f"o{i}", v, "Completed", "s1", "c1", 10.7, 122.5, 100.0, 110.0)
+    return b
+
+
+def test_created_at_matches_to_dt():
+    df = _builder(RAW_TIMESTAMPS).to_frame()
+    for raw, got in zip(RAW_TIMESTAMPS, df["createdAt"]):
+        expected = ai_analytics.to_dt(raw)
+        if expected is None:
+            assert pd.isna(got), raw
+        else:
+            assert got == pd.Timestamp(expected), raw
+
+
+def test_created_at_is_an_int64_buffer_wrapped_without_copy():
+    b = _builder(RAW_TIMESTAMPS)
+    assert b.created_ms.typecode == "q"
+    df = b.to_frame()
+    assert str(df["createdAt"].dt.tz) == "Asia/Manila"
+    buf = np.frombuffer(b.created_ms, dtype=np.int64)
+    assert np.shares_memory(df["totalPrice"].to_numpy(), np.frombuffer(b.floats["totalPrice"]))
+    assert (buf == ai_analytics.NAT_MS).sum() == df["createdAt"].isna().sum()
+
+
+def test_fetch_sales_explodes_stations_and_buckets_manila_months(fake_db):
+    orders = fake_db.collection("orders")
+    # 23:30 UTC on Mar 31 is already April in Manila
+    orders.document("edge").set(order_doc(datetime(2025, 3, 31, 23, 30, tzinfo=timezone.utc), "s2"))
+    multi = order_doc(datetime(2025, 2, 1, tzinfo=timezone.utc), "s0")
+    multi.pop("stationOwnerId")
+    multi["stationOwnerIds"] = ["s0", "s3"]
+    orders.document("multi").set(multi)
+    orders.document("pending").set(order_doc(datetime(2025, 2, 1, tzinfo=timezone.utc), "s0", status="Pending"))
+
+    df = ai_analytics.fetch_sales(fake_db)
+    assert df.loc[df["saleId"] == "edge", "yyyymm"].tolist() == [202504]
+    assert sorted(df.loc[df["saleId"] == "multi", "stationOwnerId"].astype(str)) == ["s0", "s3"]
+    assert "pending" not in set(df["saleId"].astype(str))
+    n_completed = sum(1 for d in orders.stream() if (d.to_dict() or {}).get("status") == "Completed")
+    assert df["saleId"].nunique() == n_completed
+
+
+@pytest.mark.parametrize("values", [[], [None]])
+def test_empty_and_all_missing(values):
+    df = _builder(values).to_frame()
+    assert len(df) == len(values)
@@ -0,0 +1,84 @@
+# test_scoring.py
+# pytest: vectorized cluster scoring of ai_analytics.py (score_clusters,
+# _nearest_stations, _group_growth) against per-row references.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ai_analytics
+
+STATIONS = pd.DataFrame({
+    "stationOwnerId": ["a", "b", "c"],
+    "waterType": ["Alkaline", "Alkaline", "Mineral"],
+    "district": ["Jaro", "Jaro", "Molo"],
+    "station_lat": [10.70, 10.72, 10.71],
+    "station_lng": [122.55, 122.57, 122.56],
+})
+
+
+@pytest.fixture
+def clusters():
+    rng = np.random.default_rng(0)
+    n = 40
+    return pd.DataFrame({
+        "lat": rng.uniform(10.69, 10.73, n),
+        "lng": rng.uniform(122.54, 122.58, n),
+        "cluster_orders": rng.integers(0, 30, n),
+        "cluster_sales": rng.uniform(0, 3000, n),
+        "weight": rng.uniform(1.0, 2.0, n),
+        "growth": 0.15,
+    })
+
+
+def _row_score(row, months, dist_m, cfg):
+    """The per-row scoring loop recommend_new_locations used before vectorizing."""
+    est_orders = int(row.cluster_orders // months)
+    est_sales = float(row.cluster_sales / months)
+    score = (cfg.w_orders * est_orders * row.weight
+             + cfg.w_sales * (est_sales * row.weight) / cfg.sales_scale
+             + cfg.w_distance * (dist_m / cfg.distance_scale_m)
+             + cfg.w_growth * row.growth)
+    if row.cluster_orders < cfg.min_orders:
+        score -= cfg.penalty_low_orders
+    if row.cluster_sales < cfg.min_sales:
+        score -= cfg.penalty_low_sales
+    if dist_m < cfg.min_near_dist_m:
+        score -= cfg.penalty_near_station
+    return score
+
+
+def test_nearest_stations_match_scalar_haversine(clusters):
+    ids, dist = ai_analytics._nearest_stations(clusters["lat"].to_numpy(), clusters["lng"].to_numpy(), STATIONS)
+    for (lat, lng), sid, d in zip(clusters[["lat", "lng"]].to_numpy(), ids, dist):
+        ref = [ai_analytics.haversine_m(lat, lng, s.station_lat, s.station_lng) for s in STATIONS.itertuples()]
+        assert sid == STATIONS["stationOwnerId"].iat[int(np.argmin(ref))]
+        assert d == pytest.approx(min(ref))
+    none_ids, inf = ai_analytics._nearest_stations(np.array([10.7]), np.array([122.5]), STATIONS.iloc[:0])
+    assert none_ids == [None] and np.isinf(inf).all()
+
+
+@pytest.mark.parametrize("cfg", [
+    ai_analytics.ScoringConfig(),
+    ai_analytics.ScoringConfig(w_orders=1.0, w_growth=0.0, min_orders=10, min_sales=500.0,
+                               min_near_dist_m=1500.0, penalty_near_station=5.0),
+])
+def test_vectorized_score_matches_row_loop(clusters, cfg):
+    months = 3
+    _, dist = ai_analytics._nearest_stations(clusters["lat"].to_numpy(), clusters["lng"].to_numpy(), STATIONS)
+    table = clusters.assign(est_orders=clusters["cluster_orders"] // months,
+                            est_sales=clusters["cluster_sales"] / months,
+                            nearest_station_distance_m=dist)
+    got = ai_analytics.score_clusters(table, cfg)
+    expected = [_row_score(row, months, d, cfg) for row, d in zip(clusters.itertuples(), dist)]
+    np.testing.assert_allclose(got, expected)
+
+
+def test_group_growth_per_group():
+    forecast = pd.DataFrame({"stationOwnerId": ["a", "a", "b", "c", "c"],
+                             "yhat": [100.0, 110.0, 130.0, 50.0, 40.0]})
+    growth = ai_analytics._group_growth(forecast, STATIONS, ["waterType"])
+    # First and last yhat of the group's forecast rows, in forecast order
+    assert growth[("Alkaline",)] == pytest.approx((130.0 - 100.0) / 100.0)
+    assert growth[("Mineral",)] == pytest.approx((40.0 - 50.0) / 50.0)
+    assert ai_analytics._group_growth(None, STATIONS, ["waterType"]) == {}
@@ -0,0 +1,96 @@
+# test_site_selection.py
+# pytest: max-coverage site selection of ai_analytics.py: rasterized upper
+# bounds, lazy greedy vs plain greedy, and recommend_coverage_sites end to end.
+
+import numpy as np
+import pytest
+from shapely.geometry import Polygon
+from sklearn.neighbors import BallTree
+
+import ai_analytics
+import fake_firestore
+from conftest import populate
+
+RADIUS_M = 400.0
+
+
+@pytest.fixture(scope="module")
+def customers():
+    rng = np.random.default_rng(0)
+    n = 600
+    lat = np.concatenate([rng.normal(10.71, 0.004, n // 2), rng.uniform(10.69, 10.74, n // 2)])
+    lng = np.concatenate([rng.normal(122.56, 0.004, n // 2), rng.uniform(122.53, 122.59, n // 2)])
+    return lat, lng, rng.integers(1, 6, n).astype(float)
+
+
+def _exact_coverage(site_lat, site_lng, lat, lng, radius_m):
+    tree = BallTree(np.radians(np.column_stack([lat, lng])), metric="haversine")
+    return tree.query_radius(np.radians(np.column_stack([site_lat, site_lng])), r=radius_m / ai_analytics.EARTH_RADIUS_M)
+
+
+def test_upper_bounds_dominate_exact_coverage(customers):
+    lat, lng, w = customers
+    site_lat, site_lng = ai_analytics.candidate_site_grid(lat, lng, spacing_m=150)
+    bounds = ai_analytics.demand_upper_bounds(site_lat, site_lng, lat, lng, w, RADIUS_M)
+    exact = np.array([w[c].sum() for c in _exact_coverage(site_lat, site_lng, lat, lng, RADIUS_M)])
+    assert (bounds >= exact).all()
+    # Loose enough to be valid, tight enough to prune
+    assert np.median(bounds[exact > 0] / exact[exact > 0]) < 1.5
+
+
+def _plain_greedy(cover, weights, k):
+    covered = np.zeros(len(weights), dtype=bool)
+    picks = []
+    for _ in range(k):
+        gains = [weights[c[~covered[c]]].sum() for c in cover]
+        best = int(np.argmax(gains))
+        if gains[best] <= 0:
+            break
+        picks.append((best, gains[best]))
+        covered[cover[best]] = True
+    return picks
+
+
+@pytest.mark.parametrize("batch", [1, 16, 512])
+def test_lazy_greedy_matches_plain_greedy(customers, batch):
+    lat, lng, w = customers
+    site_lat, site_lng = ai_analytics.candidate_site_grid(lat, lng, spacing_m=200)
+    cover = list(_exact_coverage(site_lat, site_lng, lat, lng, RADIUS_M))
+    bounds = ai_analytics.demand_upper_bounds(site_lat, site_lng, lat, lng, w, RADIUS_M)
+    evaluated = []
+
+    def covered_by(ids):
+        evaluated.extend(ids.tolist())
+        return [cover[i] for i in ids]
+
+    chosen = ai_analytics.greedy_max_coverage(bounds, covered_by, w, k=6, batch=batch)
+    expected = _plain_greedy(cover, w, 6)
+    # Gains match exactly; ties may pick a different but equally good site
+    assert [g for _, _, g in chosen] == pytest.approx([g for _, g in expected])
+    newly = np.concatenate([new for _, new, _ in chosen])
+    assert len(newly) == len(set(newly.tolist()))
+    if batch == 1:
+        assert len(set(evaluated)) < len(site_lat)
+
+
+def test_candidate_grid_respects_polygon():
+    square = Polygon([(122.55, 10.70), (122.56, 10.70), (122.56, 10.71), (122.55, 10.71)])
+    site_lat, site_lng = ai_analytics.candidate_site_grid(np.array([0.0]), np.array([0.0]), 100, polygon=square)
+    assert len(site_lat) > 50
+    assert ((site_lat >= 10.70) & (site_lat <= 10.71) & (site_lng >= 122.55) & (site_lng <= 122.56)).all()
+
+
+def test_recommend_coverage_sites_keeps_distance_from_stations():
+    db = populate(fake_firestore.FakeFirestore(), n_stations=4, n_orders=800)
+    stations_df, sales_df = ai_analytics.fetch_data(db)
+    joined = ai_analytics.build_station_joined_sales(sales_df, stations_df)
+    recs = ai_analytics.recommend_coverage_sites(joined, stations_df, top_k=3, service_radius_m=300)
+    assert recs
+    for r in recs:
+        assert r.nearest_station_distance_m >= ai_analytics.MIN_DISTANCE_TO_EXISTING_M
+        assert r.cluster_orders >= 1 and r.est_orders_per_month >= 1
+    per_group = {}
+    for r in recs:
+        per_group.setdefault((r.waterType, r.district), []).append(r.cluster_orders)
+    # Greedy gains never increase within a group
+    assert all(v == sorted(v, reverse=True) for v in per_group.values())
@@ -0,0 +1,101 @@
+# test_stage_cache.py
+# pytest: fingerprints, hit/miss invalidation, file stages and LRU eviction of stage_cache.py.
+
+import os
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import stage_cache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return stage_cache.StageCache(root=str(tmp_path / "cache"))
+
+
+def test_fingerprint_is_content_based():
+    df = pd.DataFrame({"a": [1, 2, 3], "b": ["x", "y", "z"]})
+    assert stage_cache.fingerprint(df) == stage_cache.fingerprint(df.copy())
+    assert stage_cache.fingerprint(df) != stage_cache.fingerprint(df.assign(a=[1, 2, 4]))
+    assert stage_cache.fingerprint(df) != stage_cache.fingerprint(df.astype({"a": float}))
+    assert stage_cache.fingerprint({"k": 1, "j": 2}) == stage_cache.fingerprint({"j": 2, "k": 1})
+    assert stage_cache.fingerprint(1) != stage_cache.fingerprint("1")
+    assert stage_cache.fingerprint([1, 2]) != stage_cache.fingerprint((1, 2))
+    assert stage_cache.fingerprint(np.arange(3)) != stage_cache.fingerprint(np.arange(3).astype(np.int32))
+    assert stage_cache.fingerprint(date(2025, 1, 1)) != stage_cache.fingerprint(date(2025, 1, 2))
+
+
+def test_unhashable_cells_still_fingerprint():
+    df = pd.DataFrame({"ids": [["s1", "s2"], ["s3"]]})
+    assert stage_cache.fingerprint(df) == stage_cache.fingerprint(pd.DataFrame({"ids": [["s1", "s2"], ["s3"]]}))
+    assert stage_cache.fingerprint(df) != stage_cache.fingerprint(pd.DataFrame({"ids": [["s1"], ["s3"]]}))
+
+
+def test_run_hits_on_same_inputs_and_recomputes_on_change(cache):
+    calls = []
+
+    def compute(x):
+        calls.append(x)
+        return x * 2
+
+    df = pd.DataFrame({"v": [1, 2]})
+    assert cache.run("double", df, lambda: compute(1)) == 2
+    assert cache.run("double", df.copy(), lambda: compute(99)) == 2      # hit: compute not called
+    assert cache.run("double", df.assign(v=[1, 3]), lambda: compute(3)) == 6
+    assert cache.run("double", df, lambda: compute(5), version="2") == 10  # version bump invalidates
+    assert calls == [1, 3, 5]
+    assert cache.hits == ["double"] and len(cache.misses) == 3
+
+
+def test_disabled_cache_always_computes(tmp_path):
+    cache = stage_cache.StageCache(root=str(tmp_path / "cache"), enabled=False)
+    n = []
+    for _ in range(2):
+        cache.run("s", 1, lambda: n.append(1))
+    assert len(n) == 2 and not os.path.exists(tmp_path / "cache")
+
+
+def test_file_stage_rebuilds_when_file_changes_or_vanishes(cache, tmp_path):
+    path = str(tmp_path / "out.csv")
+    builds = []
+
+    def build():
+        builds.append(1)
+        with open(path, "w") as f:
+            f.write("a,b\n1,2\n")
+
+    assert cache.file("export", {"k": 1}, path, build) is True
+    assert cache.file("export", {"k": 1}, path, build) is False
+    with open(path, "a") as f:
+        f.write("tampered\n")
+    assert cache.file("export", {"k": 1}, path, build) is True
+    os.remove(path)
+    assert cache.file("export", {"k": 1}, path, build) is True
+    assert len(builds) == 3
+
+
+def test_unreadable_entry_is_dropped(cache):
+    key = stage_cache.fingerprint("s", "1", 7)
+    path = cache._path("s", key)
+    os.makedirs(os.path.dirname(path))
+    with open(path, "wb") as f:
+        f.write(b"not a pickle")
+    assert cache.run("s", 7, lambda: "fresh") == "fresh"
+    assert cache.get("s", key) == (True, "fresh")
+
+
+def test_eviction_keeps_cache_under_cap(tmp_path):
+    cache = stage_cache.StageCache(root=str(tmp_path / "cache"), max_bytes=30_000)
+    blob = b"x" * 10_000
+    for i in range(6):
+        cache.run("blob", i, lambda: blob)
+        os.utime(cache._path("blob", stage_cache.fingerprint("blob", "1", i)), (i, i))
+    cache.evict()
+    sizes = [os.path.getsize(os.path.join(d, f)) for d, _, fs in os.walk(cache.root) for f in fs]
+    assert sum(sizes) <= 30_000
+    # The most recently used entries survive
+    assert cache.get("blob", stage_cache.fingerprint("blob", "1", 5))[0]
+    assert not cache.get("blob", stage_cache.fingerprint("blob", "1", 0))[0]
@@ -0,0 +1,85 @@
+# test_station_matrix.py
+# pytest: zero-filled station × day matrices of station_matrix.py, their slicing
+# views and the memory-mapped save / load_or_build round trip.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import station_matrix
+
+DAILY = pd.DataFrame({
+    "stationOwnerId": ["s2", "s1", "s1", "s2", "s3", "s1"],
+    "waterType": ["Mineral", "Alkaline", "Alkaline", "Alkaline", "Mineral", "Mineral"],
+    "date": pd.to_datetime(["2025-01-03", "2025-01-01", "2025-01-05", "2025-01-02", "2025-01-05", "2025-01-04"]),
+    "orders": [2, 1, 3, 4, 1, 2],
+    "totalSales": [200.0, 110.0, 330.0, 440.0, 90.0, 220.0],
+})
+
+
+@pytest.fixture
+def matrix():
+    return station_matrix.StationDayMatrix.from_daily(DAILY)
+
+
+def test_dense_matrix_matches_long_table_and_zero_fills(matrix):
+    assert matrix.shape == (5, 5)
+    assert list(zip(matrix.water_types, matrix.station_ids)) == [
+        ("Alkaline", "s1"), ("Alkaline", "s2"), ("Mineral", "s1"), ("Mineral", "s2"), ("Mineral", "s3")]
+    assert matrix.dates[0] == np.datetime64("2025-01-01") and matrix.dates[-1] == np.datetime64("2025-01-05")
+    assert matrix.sales.sum() == DAILY["totalSales"].sum()
+    assert matrix.orders.dtype == np.int32 and matrix.orders.sum() == DAILY["orders"].sum()
+    assert matrix.sales[0].tolist() == [110.0, 0.0, 0.0, 0.0, 330.0]
+    assert (matrix.sales > 0).sum() == len(DAILY)
+
+
+def test_explicit_window_drops_and_pads_days():
+    m = station_matrix.StationDayMatrix.from_daily(DAILY, start="2024-12-30", end="2025-01-04")
+    assert len(m.dates) == 6
+    assert m.sales[:, :2].sum() == 0
+    assert m.sales.sum() == DAILY.loc[DAILY["date"] <= "2025-01-04", "totalSales"].sum()
+
+
+def test_selections_are_views(matrix):
+    mineral = matrix.water_type("Mineral")
+    assert list(mineral.station_ids) == ["s1", "s2", "s3"]
+    assert np.shares_memory(mineral.sales, matrix.sales)
+
+    row = matrix.station("s2", water_type="Alkaline")
+    assert row.sales.tolist() == [[0.0, 440.0, 0.0, 0.0, 0.0]]
+    assert np.shares_memory(row.orders, matrix.orders)
+
+    window = matrix.window("2025-01-02", "2025-01-04")
+    assert list(window.dates.astype(str)) == ["2025-01-02", "2025-01-03", "2025-01-04"]
+    assert np.shares_memory(window.sales, matrix.sales)
+    assert matrix.water_type("Sparkling").shape == (0, 5)
+
+
+def test_station_lookup_errors(matrix):
+    with pytest.raises(KeyError, match="several waterTypes"):
+        matrix.station("s1")
+    with pytest.raises(KeyError, match="Unknown station"):
+        matrix.station("s9")
+    assert matrix.station("s3").sales.sum() == 90.0
+
+
+def test_empty_table():
+    m = station_matrix.StationDayMatrix.from_daily(DAILY.iloc[:0])
+    assert m.shape == (0, 0) and list(m.rows()) == []
+
+
+def test_load_or_build_reuses_saved_matrix(tmp_path, matrix):
+    root = str(tmp_path / "station_day")
+    first = station_matrix.load_or_build(DAILY, root=root)
+    assert isinstance(first.sales, np.memmap)
+    np.testing.assert_array_equal(first.sales, matrix.sales)
+    np.testing.assert_array_equal(first.dates, matrix.dates)
+
+    mtime = (tmp_path / "station_day" / "sales.npy").stat().st_mtime_ns
+    again = station_matrix.load_or_build(DAILY.copy(), root=root)
+    assert (tmp_path / "station_day" / "sales.npy").stat().st_mtime_ns == mtime
+    assert list(again.station_ids) == list(matrix.station_ids)
+
+    changed = DAILY.assign(totalSales=DAILY["totalSales"] * 2)
+    rebuilt = station_matrix.load_or_build(changed, root=root)
+    assert rebuilt.sales.sum() == 2 * matrix.sales.sum()
@@ -0,0 +1,86 @@
+# test_timestamps.py
+# pytest: one-pass createdAt parsing (service.to_local_days) and the vectorized
+# liters fold (service.accumulate_liters) against per-order references.
+
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import service
+
+
+class ProtoTimestamp:
+    """Stand-in for timestamps that only expose to_datetime()."""
+
+    def __init__(self, dt):
+        self._dt = dt
+
+    def to_datetime(self):
+        return self._dt
+
+
+RAW = [
+    datetime(2025, 3, 31, 16, 30, tzinfo=timezone.utc),     # 00:30 Apr 1 in Manila
+    datetime(2025, 3, 31, 15, 59, tzinfo=timezone.utc),
+    datetime(2025, 3, 31, 23, 0),                            # naive: UTC
+    "2025-03-31T16:00:00Z",
+    "2025-04-01T00:10:00+08:00",
+    "2025-03-31T12:00:00",
+    "2025-03-31",
+    ProtoTimestamp(datetime(2025, 12, 31, 17, 0, tzinfo=timezone.utc)),
+    None,
+    "garbage",
+]
+EXPECTED = ["2025-04-01", "2025-03-31", "2025-04-01", "2025-04-01", "2025-04-01",
+            "2025-03-31", "2025-03-31", "2026-01-01", None, None]
+
+
+def test_local_days_match_reference():
+    days = service.to_local_days(RAW)
+    assert days.dtype == np.dtype("datetime64[D]")
+    for raw, got, want in zip(RAW, days, EXPECTED):
+        if want is None:
+            assert np.isnat(got), raw
+        else:
+            assert got == np.datetime64(want), raw
+
+
+def test_accumulate_matches_per_order_loop():
+    rng = np.random.default_rng(0)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    created, liters, stations = [], [], []
+    for i in range(500):
+        ts = start + timedelta(minutes=int(rng.integers(0, 90 * 24 * 60)))
+        created.append(ts.isoformat() if i % 3 == 0 else ts)
+        liters.append(float(rng.integers(1, 5) * 25))
+        stations.append([f"s{rng.integers(0, 4)}"] if i % 7 else ["s0", "s1"])
+    created[5] = None
+
+    monthly, overall = defaultdict(lambda: defaultdict(float)), defaultdict(float)
+    daily = defaultdict(lambda: defaultdict(float))
+    service.accumulate_liters(created, liters, stations, monthly, overall, daily)
+
+    ref_daily = defaultdict(float)
+    for raw, value, sids in zip(created, liters, stations):
+        if raw is None:
+            continue
+        day = pd.Timestamp(raw).tz_convert(service.LOCAL_TZ).date()
+        for sid in sids:
+            ref_daily[sid, day] += value
+    assert {(sid, d): v for sid, s in daily.items() for d, v in s.items()} == pytest.approx(dict(ref_daily))
+    for sid, series in monthly.items():
+        for month, value in series.items():
+            assert value == pytest.approx(sum(v for (s, d), v in ref_daily.items()
+                                              if s == sid and (d.year, d.month) == (month.year, month.month)))
+    assert sum(overall.values()) == pytest.approx(sum(ref_daily.values()))
+    assert set(overall) <= {date(2025, 1, 1), date(2025, 2, 1), date(2025, 3, 1), date(2025, 4, 1)}
+
+
+def test_empty_and_unparseable_batches_are_noops():
+    monthly, overall = defaultdict(lambda: defaultdict(float)), defaultdict(float)
+    service.accumulate_liters([], [], [], monthly, overall)
+    service.accumulate_liters(["garbage"], [25.0], [["s0"]], monthly, overall)
+    assert not monthly and not overall
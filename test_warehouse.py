@@ -0,0 +1,82 @@
+# test_warehouse.py
+# pytest: warehouse.py incremental sync legs, and parity of service.py's Firestore
+# and warehouse modes (check_modes.compare_modes).
+
+from datetime import datetime, timezone
+
+import pytest
+
+import check_modes
+import fake_firestore
+import warehouse
+from conftest import order_doc, populate
+
+T0 = datetime(2025, 1, 10, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def synced(tmp_path):
+    db = populate(fake_firestore.FakeFirestore(), n_orders=200, days=60)
+    conn = warehouse.connect(str(tmp_path / "w.sqlite"))
+    warehouse.sync_from_firestore(conn, db)
+    warehouse.clear_dirty_months(conn, warehouse.dirty_months(conn))
+    yield db, conn
+    conn.close()
+
+
+def _status(conn, order_id):
+    row = conn.execute("SELECT status FROM orders WHERE order_id = ?", (order_id,)).fetchone()
+    return row[0] if row else None
+
+
+@pytest.mark.parametrize("n_orders", [0, 300])
+def test_firestore_and_warehouse_modes_match(tmp_path, monkeypatch, n_orders):
+    monkeypatch.chdir(tmp_path)  # the streamed scan checkpoints under out/
+    path = str(tmp_path / "fixture.ndjson")
+    populate(fake_firestore.FakeFirestore(), n_orders=n_orders).dump_ndjson(path)
+    assert check_modes.compare_modes(path) == []
+
+
+def test_full_sync_stores_every_order(synced):
+    db, conn = synced
+    assert conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0] == 200
+    assert warehouse.order_months(conn) == [202501, 202502, 202503]
+
+
+def test_new_order_without_updated_at_is_picked_up_by_created_leg(synced):
+    db, conn = synced
+    db.collection("orders").document("late").set(order_doc(datetime(2025, 3, 15, tzinfo=timezone.utc), "s1"))
+    db.collection("orders").document("late_iso").set(order_doc("2025-03-15T08:00:00+00:00", "s2"))
+    assert warehouse.sync_orders(conn, db) >= 2
+    assert _status(conn, "late") == _status(conn, "late_iso") == "Completed"
+    assert 202503 in warehouse.dirty_months(conn)
+
+
+def test_status_change_without_updated_at_is_picked_up_by_reread(synced):
+    db, conn = synced
+    old = db.collection("orders").document("old_open")
+    old.set(order_doc(T0, "s0", status="Pending"))
+    warehouse.sync_orders(conn, db, incremental=False)
+    assert _status(conn, "old_open") == "Pending"
+    warehouse.clear_dirty_months(conn, warehouse.dirty_months(conn))
+
+    # Far older than the createdAt margin and no updatedAt: only the open-order re-read sees it
+    old.update({"status": "Completed"})
+    warehouse.sync_orders(conn, db)
+    assert _status(conn, "old_open") == "Completed"
+    # The createdAt leg's margin re-reads (and re-dirties) the newest months too
+    assert 202501 in warehouse.dirty_months(conn)
+
+
+def test_updated_at_watermark_moves_order_across_months(synced):
+    db, conn = synced
+    doc = db.collection("orders").document("moved")
+    doc.set(order_doc(T0, "s0", updated=datetime(2025, 6, 1, tzinfo=timezone.utc)))
+    warehouse.sync_orders(conn, db, incremental=False)
+    warehouse.clear_dirty_months(conn, warehouse.dirty_months(conn))
+
+    doc.set(order_doc(datetime(2025, 2, 10, tzinfo=timezone.utc), "s0",
+                      updated=datetime(2025, 6, 2, tzinfo=timezone.utc)))
+    warehouse.sync_orders(conn, db)
+    # Both the month the order left and the one it joined need re-binning
+    assert {202501, 202502} <= set(warehouse.dirty_months(conn))
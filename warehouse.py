@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+# warehouse.py
+# Local single-file order warehouse (SQLite) synced from Firestore.
+# - Normalized tables: orders, order_stations, order_items, stations
+# - Indexed on station, month, status and waterType
+# - Aggregates (monthly liters, daily sales, RFM) come from SQL instead of
+#   re-streaming raw Firestore documents into pandas on every run.
+# Used by service.py, ai_analytics.py and test_model.py.
+
+import os
+import sqlite3
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+WAREHOUSE_PATH = os.path.join(os.getcwd(), "out", "orders_warehouse.sqlite")
+LOCAL_TZ = "Asia/Manila"
+LITERS_PER_REFILL = 25
+SALES_STATUSES = ("Completed", "Delivered")
+SETTLED_STATUSES = SALES_STATUSES + ("Failed", "Cancelled", "Canceled")  # orders in any other status are re-read
+SYNC_BATCH_SIZE = 500
+STATION_OWNER_COLUMNS = [("owner_district_name", "TEXT"), ("owner_lat", "REAL"),
+                         ("owner_lng", "REAL"), ("owner_water_type", "TEXT")]
+SYNC_CREATED_MARGIN_MS = 24 * 3600 * 1000  # createdAt leg re-reads this far behind the newest stored order
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    order_id      TEXT PRIMARY KEY,
+    status        TEXT,
+    created_ms    INTEGER,          -- UTC epoch milliseconds
+    local_date    TEXT,             -- Asia/Manila YYYY-MM-DD
+    yyyymm        INTEGER,          -- Asia/Manila year*100+month
+    updated_ms    INTEGER,
+    customer_id   TEXT,
+    customer_lat  REAL,
+    customer_lng  REAL,
+    total_price   REAL
+);
+CREATE TABLE IF NOT EXISTS order_stations (
+    order_id            TEXT NOT NULL,
+    station_id          TEXT NOT NULL,
+    delivery_distance_m REAL,
+    PRIMARY KEY (order_id, station_id)
+);
+CREATE TABLE IF NOT EXISTS order_items (
+    order_id    TEXT NOT NULL,
+    item_idx    INTEGER NOT NULL,
+    name        TEXT,
+    quantity    REAL,
+    price       REAL,
+    is_refill   INTEGER,
+    PRIMARY KEY (order_id, item_idx)
+);
+CREATE TABLE IF NOT EXISTS stations (
+    station_id    TEXT PRIMARY KEY,
+    district_id   TEXT,
+    district_name TEXT,
+    lat           REAL,
+    lng           REAL,
+    water_type    TEXT,             -- products subcollection first (ai_analytics view)
+    owner_district_name TEXT,       -- station_owners fields exactly as service.read_station_rows reads them
+    owner_lat     REAL,
+    owner_lng     REAL,
+    owner_water_type TEXT
+);
+CREATE TABLE IF NOT EXISTS sync_meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS dirty_months (
+    yyyymm        INTEGER PRIMARY KEY  -- months with upserted orders, until the demand grid re-bins them
+);
+CREATE INDEX IF NOT EXISTS idx_orders_status_month ON orders (status, yyyymm);
+CREATE INDEX IF NOT EXISTS idx_orders_month ON orders (yyyymm);
+CREATE INDEX IF NOT EXISTS idx_orders_customer ON orders (customer_id);
+CREATE INDEX IF NOT EXISTS idx_order_stations_station ON order_stations (station_id, order_id);
+CREATE INDEX IF NOT EXISTS idx_order_items_refill ON order_items (is_refill, order_id);
+CREATE INDEX IF NOT EXISTS idx_stations_water_type ON stations (water_type);
+CREATE INDEX IF NOT EXISTS idx_stations_district ON stations (district_name);
+"""
+
+# ----------------------------
+# Connection
+# ----------------------------
+def connect(path: str = WAREHOUSE_PATH) -> sqlite3.Connection:
+    """Open (and create if needed) the warehouse file."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    _migrate(conn)
+    return conn
+
+def _migrate(conn):
+    """Add columns introduced after a warehouse file was created (values fill in on the next sync)."""
+    have = {row[1] for row in conn.execute("PRAGMA table_info(stations)")}
+    with conn:
+        for col, typ in STATION_OWNER_COLUMNS:
+            if col not in have:
+                conn.execute(f"ALTER TABLE stations ADD COLUMN {col} {typ}")
+
+def _get_meta(conn, key: str) -> Optional[str]:
+    row = conn.execute("SELECT value FROM sync_meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+def _set_meta(conn, key: str, value: str):
+    conn.execute("INSERT OR REPLACE INTO sync_meta (key, value) VALUES (?, ?)", (key, value))
+
+# ----------------------------
+# Parsing helpers
+# ----------------------------
+def _to_utc(values: Iterable[Any]) -> pd.Series:
+    raw = pd.Series(list(values), dtype=object)
+    ts = pd.to_datetime(raw, utc=True, errors="coerce", format="ISO8601")
+    leftover = ts.isna() & raw.notna()
+    if leftover.any():
+        fixed = raw[leftover].map(lambda v: v.to_datetime() if hasattr(v, "to_datetime") else None)
+        ts[leftover] = pd.to_datetime(fixed, utc=True, errors="coerce")
+    return ts
+
+def _epoch_ms(ts: pd.Series) -> List[Optional[int]]:
+    ms = ts.dt.as_unit("ms").astype("int64") if len(ts) else pd.Series([], dtype="int64")
+    return [None if pd.isna(t) else int(m) for t, m in zip(ts, ms)]
+
+def _float(x) -> Optional[float]:
+    try:
+        return None if x is None else float(x)
+    except (TypeError, ValueError):
+        return None
+
+def _station_ids(o: Dict[str, Any]) -> List[str]:
+    ids = o.get("stationOwnerIds") or o.get("stationOwnerId") or []
+    if isinstance(ids, str):
+        ids = [ids]
+    return [sid for sid in ids if isinstance(sid, str)]
+
+# ----------------------------
+# Sync from Firestore
+# ----------------------------
+def _write_order_batch(conn, batch: List[Tuple[str, Dict[str, Any]]]) -> Optional[int]:
+    """Upsert one batch of (doc_id, order dict); returns the max updated_ms seen."""
+    created = _to_utc(o.get("createdAt") or o.get("created_at") or o.get("timestamp") for _, o in batch)
+    updated = _to_utc(o.get("updatedAt") for _, o in batch)
+    local = created.dt.tz_convert(LOCAL_TZ)
+    local_date = local.dt.strftime("%Y-%m-%d")
+    yyyymm = local.dt.year * 100 + local.dt.month
+    created_ms, updated_ms = _epoch_ms(created), _epoch_ms(updated)
+
+    order_rows, station_rows, item_rows = [], [], []
+    for i, (oid, o) in enumerate(batch):
+        cust = o.get("customer_coords") or {}
+        clat, clng = cust.get("lat"), cust.get("lng")
+        if clat is None or clng is None:
+            ship = o.get("shippingAddress") or {}
+            clat, clng = ship.get("latitude"), ship.get("longitude")
+        order_rows.append((
+            oid, o.get("status"), created_ms[i],
+            None if pd.isna(local_date.iat[i]) else local_date.iat[i],
+            None if pd.isna(yyyymm.iat[i]) else int(yyyymm.iat[i]),
+            updated_ms[i], o.get("customerId"), _float(clat), _float(clng),
+            _float(o.get("totalPrice", o.get("total_amount"))),
+        ))
+        per_meta = o.get("perStationMeta") or {}
+        for sid in _station_ids(o):
+            meta = per_meta.get(sid) if isinstance(per_meta.get(sid), dict) else {}
+            station_rows.append((oid, sid, _float(meta.get("delivery_distance_m"))))
+        for idx, item in enumerate(o.get("items") or []):
+            name = str(item.get("name", ""))
+            item_rows.append((oid, idx, name, _float(item.get("quantity")) or 0.0,
+                              _float(item.get("price")), int("refill" in name.lower())))
+
+    ids = [(oid,) for oid, _ in batch]
+    months = {(row[4],) for row in order_rows if row[4] is not None}
+    with conn:
+        # Both the stored month (before the upsert) and the new one change
+        conn.executemany("INSERT OR IGNORE INTO dirty_months "
+                         "SELECT yyyymm FROM orders WHERE order_id = ? AND yyyymm IS NOT NULL", ids)
+        conn.executemany("INSERT OR IGNORE INTO dirty_months VALUES (?)", months)
+        conn.executemany("DELETE FROM order_stations WHERE order_id = ?", ids)
+        conn.executemany("DELETE FROM order_items WHERE order_id = ?", ids)
+        conn.executemany("INSERT OR REPLACE INTO orders VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", order_rows)
+        conn.executemany("INSERT OR REPLACE INTO order_stations VALUES (?, ?, ?)", station_rows)
+        conn.executemany("INSERT OR REPLACE INTO order_items VALUES (?, ?, ?, ?, ?, ?)", item_rows)
+    seen = [m for m in updated_ms if m is not None]
+    return max(seen) if seen else None
+
+def _filtered(db, name: str, filters: Iterable[Tuple[str, str, Any]] = ()):
+    query = db.collection(name)
+    for field_path, op, value in filters:
+        query = query.where(field_path, op, value)
+    return query
+
+def _upsert_snapshots(conn, snapshots, seen: set, batch_size: int) -> Tuple[int, Optional[int], int]:
+    """
+    Upsert order snapshots not already in `seen` (doc ids synced this run);
+    returns (orders upserted, max updated_ms, orders without updatedAt).
+    """
+    count, max_updated, no_updated = 0, None, 0
+    batch: List[Tuple[str, Dict[str, Any]]] = []
+
+    def flush():
+        nonlocal count, max_updated, batch
+        m = _write_order_batch(conn, batch)
+        max_updated = max(filter(None, [max_updated, m]), default=None)
+        count += len(batch)
+        batch = []
+
+    for doc in snapshots:
+        if doc.id in seen or not doc.exists:
+            continue
+        seen.add(doc.id)
+        o = doc.to_dict() or {}
+        no_updated += o.get("updatedAt") is None
+        batch.append((doc.id, o))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return count, max_updated, no_updated
+
+def sync_orders(conn, db, incremental: bool = True, batch_size: int = SYNC_BATCH_SIZE,
+                filters: Iterable[Tuple[str, str, Any]] = ()) -> int:
+    """
+    Upsert Firestore orders into the warehouse. With incremental=True and a
+    previous sync, only the union of these is read:
+      - orders with updatedAt >= the stored updatedAt watermark
+      - orders with createdAt >= the newest stored createdAt minus
+        SYNC_CREATED_MARGIN_MS (Timestamp and ISO-string createdAt; new orders
+        that carry no updatedAt)
+      - orders stored with a status outside SETTLED_STATUSES, re-read by id
+        (status changes on orders that carry no updatedAt)
+    `filters` ((field, op, value) triples) restrict the scans, e.g. to one region.
+    """
+    base = _filtered(db, "orders", filters)
+    watermark = _get_meta(conn, "orders_updated_ms") if incremental else None
+    newest_created = conn.execute("SELECT MAX(created_ms) FROM orders").fetchone()[0] if incremental else None
+    seen: set = set()
+
+    if watermark is None and newest_created is None:
+        count, max_updated, no_updated = _upsert_snapshots(conn, base.stream(), seen, batch_size)
+        legs = f"{count} (full scan)"
+    else:
+        max_updated = int(watermark) if watermark else None
+        by_updated, by_created, reread = [], [], []
+        if watermark is not None:
+            since = pd.Timestamp(int(watermark), unit="ms", tz="UTC").to_pydatetime()
+            by_updated.append(_upsert_snapshots(conn, base.where("updatedAt", ">=", since).stream(),
+                                                seen, batch_size))
+        if newest_created is not None:
+            created_since = pd.Timestamp(int(newest_created) - SYNC_CREATED_MARGIN_MS, unit="ms", tz="UTC")
+            # Range filters only match one value type: one query per createdAt representation.
+            # Any ISO string on or after that date sorts at or after its "YYYY-MM-DD" prefix.
+            for bound in (created_since.to_pydatetime(), created_since.strftime("%Y-%m-%d")):
+                by_created.append(_upsert_snapshots(conn, base.where("createdAt", ">=", bound).stream(),
+                                                    seen, batch_size))
+        ph, params = _in_clause(SETTLED_STATUSES)
+        open_ids = [r[0] for r in conn.execute(
+            f"SELECT order_id FROM orders WHERE status IS NULL OR status NOT IN ({ph})", params)]
+        orders_col = db.collection("orders")
+        reread.append(_upsert_snapshots(conn, (orders_col.document(oid).get() for oid in open_ids),
+                                        seen, batch_size))
+        results = by_updated + by_created + reread
+        count = sum(c for c, _, _ in results)
+        no_updated = sum(n for _, _, n in results)
+        max_updated = max(filter(None, [max_updated] + [m for _, m, _ in results]), default=None)
+        legs = (f"{sum(c for c, _, _ in by_updated)} by updatedAt, {sum(c for c, _, _ in by_created)} by createdAt, "
+                f"{reread[0][0]} of {len(open_ids)} open orders re-read")
+    if no_updated:
+        print(f"Warehouse sync: {no_updated} of the synced orders carry no updatedAt; an updatedAt "
+              f"watermark alone would have skipped them.")
+    print(f"Warehouse sync: orders upserted: {legs}.")
+
+    with conn:
+        if max_updated is not None:
+            _set_meta(conn, "orders_updated_ms", str(max_updated))
+        _set_meta(conn, "orders_synced_at", datetime.utcnow().isoformat())
+    return count
+
+def sync_stations(conn, db, filters: Iterable[Tuple[str, str, Any]] = ()) -> int:
+    """
+    Replace the stations table. water_type comes from one collection_group('products')
+    scan (falling back to station_owners.waterType); the owner_* columns keep the
+    station_owners doc's own fields for load_station_rows.
+    """
+    product_types: Dict[str, str] = {}
+    for pdoc in db.collection_group("products").stream():
+        parent = pdoc.reference.parent.parent
+        wtype = (pdoc.to_dict() or {}).get("waterType")
+        if parent is not None and wtype and parent.id not in product_types:
+            product_types[parent.id] = wtype
+
+    rows = []
+    for sdoc in _filtered(db, "station_owners", filters).stream():
+        s = sdoc.to_dict() or {}
+        loc = s.get("location") or {}
+        lat = loc.get("latitude") or loc.get("lat") or (loc.get("map", {}) or {}).get("lat")
+        lng = loc.get("longitude") or loc.get("lng") or (loc.get("map", {}) or {}).get("lng")
+        district = s.get("districtName") or s.get("district") \
+                   or (s.get("address") or {}).get("district") \
+                   or loc.get("districtName")
+        rows.append((sdoc.id, s.get("districtID"), district, _float(lat), _float(lng),
+                     product_types.get(sdoc.id) or s.get("waterType"),
+                     s.get("districtName"), _float(loc.get("latitude")), _float(loc.get("longitude")),
+                     s.get("waterType")))
+    with conn:
+        conn.execute("DELETE FROM stations")
+        conn.executemany(
+            "INSERT INTO stations (station_id, district_id, district_name, lat, lng, water_type, "
+            "owner_district_name, owner_lat, owner_lng, owner_water_type) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    return len(rows)
+
+def sync_from_firestore(conn, db, incremental: bool = True,
+                        filters: Iterable[Tuple[str, str, Any]] = ()) -> Tuple[int, int]:
+    """Sync stations (full) and orders (incremental, see sync_orders)."""
+    n_stations = sync_stations(conn, db, filters)
+    n_orders = sync_orders(conn, db, incremental=incremental, filters=filters)
+    print(f"Warehouse sync: {n_stations} stations, {n_orders} orders upserted.")
+    return n_stations, n_orders
+
+# ----------------------------
+# Aggregate queries
+# ----------------------------
+def _in_clause(values) -> Tuple[str, List[Any]]:
+    values = list(values)
+    return ",".join("?" * len(values)), values
+
+def monthly_liters_per_station(conn, status: str = "Completed") -> pd.DataFrame:
+    """Refill liters per (station_id, yyyymm); every station on an order gets the order's liters."""
+    return pd.read_sql_query(
+        """
+        SELECT os.station_id, o.yyyymm, SUM(r.units) * ? AS liters
+        FROM orders o
+        JOIN (SELECT order_id, SUM(quantity) AS units
+              FROM order_items WHERE is_refill = 1 GROUP BY order_id) r ON r.order_id = o.order_id
+        JOIN order_stations os ON os.order_id = o.order_id
+        WHERE o.status = ? AND o.yyyymm IS NOT NULL AND r.units > 0
+        GROUP BY os.station_id, o.yyyymm
+        """,
+        conn, params=(LITERS_PER_REFILL, status),
+    )
+
+def daily_liters_per_station(conn, status: str = "Completed") -> pd.DataFrame:
+    """Refill liters per (station_id, local_date), same rules as monthly_liters_per_station."""
+    return pd.read_sql_query(
+        """
+        SELECT os.station_id, o.local_date, SUM(r.units) * ? AS liters
+        FROM orders o
+        JOIN (SELECT order_id, SUM(quantity) AS units
+              FROM order_items WHERE is_refill = 1 GROUP BY order_id) r ON r.order_id = o.order_id
+        JOIN order_stations os ON os.order_id = o.order_id
+        WHERE o.status = ? AND o.local_date IS NOT NULL AND r.units > 0
+        GROUP BY os.station_id, o.local_date
+        """,
+        conn, params=(LITERS_PER_REFILL, status),
+    )
+
+def daily_sales_per_station(conn, statuses=SALES_STATUSES) -> pd.DataFrame:
+    """Same shape as ai_analytics.timeseries_by_station: stationOwnerId, waterType, date, orders, totalSales."""
+    ph, params = _in_clause(statuses)
+    return pd.read_sql_query(
+        f"""
+        SELECT os.station_id AS stationOwnerId, s.water_type AS waterType, o.local_date AS date,
+               COUNT(DISTINCT o.order_id) AS orders, SUM(o.total_price) AS totalSales
+        FROM orders o
+        JOIN order_stations os ON os.order_id = o.order_id
+        JOIN stations s ON s.station_id = os.station_id
+        WHERE o.status IN ({ph}) AND o.local_date IS NOT NULL AND s.water_type IS NOT NULL
+        GROUP BY os.station_id, s.water_type, o.local_date
+        ORDER BY os.station_id, s.water_type, o.local_date
+        """,
+        conn, params=params,
+    )
+
+def rfm_aggregates(conn, as_of: Optional[datetime] = None, statuses=SALES_STATUSES) -> pd.DataFrame:
+    """Same shape as ai_analytics.rfm_by_customer: customerId, last_order, frequency, avgSpend, recency_days."""
+    ph, params = _in_clause(statuses)
+    rfm = pd.read_sql_query(
+        f"""
+        SELECT o.customer_id AS customerId, MAX(o.created_ms) AS last_ms,
+               COUNT(DISTINCT o.order_id) AS frequency, AVG(o.total_price) AS avgSpend
+        FROM orders o
+        JOIN order_stations os ON os.order_id = o.order_id
+        WHERE o.status IN ({ph}) AND o.customer_id IS NOT NULL AND o.created_ms IS NOT NULL
+        GROUP BY o.customer_id
+        """,
+        conn, params=params,
+    )
+    rfm["last_order"] = pd.to_datetime(rfm.pop("last_ms"), unit="ms", utc=True).dt.tz_convert(LOCAL_TZ)
+    as_of = pd.Timestamp(as_of) if as_of is not None else pd.Timestamp.now(tz=LOCAL_TZ)
+    rfm["recency_days"] = (as_of - rfm["last_order"]).dt.days
+    return rfm[["customerId", "last_order", "frequency", "avgSpend", "recency_days"]]
+
+def load_sales(conn, statuses=SALES_STATUSES) -> pd.DataFrame:
+    """Exploded per-station sales rows, shaped like ai_analytics.fetch_sales."""
+    ph, params = _in_clause(statuses)
+    df = pd.read_sql_query(
+        f"""
+        SELECT o.order_id AS saleId, o.created_ms, o.status, os.station_id AS stationOwnerId,
+               o.customer_id AS customerId, o.customer_lat, o.customer_lng,
+               os.delivery_distance_m, COALESCE(o.total_price, 0) AS totalPrice, o.yyyymm
+        FROM orders o
+        LEFT JOIN order_stations os ON os.order_id = o.order_id
+        WHERE o.status IN ({ph}) AND o.created_ms IS NOT NULL
+        """,
+        conn, params=params,
+    )
+    df.insert(1, "createdAt", pd.to_datetime(df.pop("created_ms"), unit="ms", utc=True).dt.tz_convert(LOCAL_TZ))
+    for c in ["saleId", "status", "stationOwnerId", "customerId"]:
+        df[c] = df[c].astype("category")
+    df["yyyymm"] = df["yyyymm"].astype(np.int32)
+    return df
+
+def load_stations(conn) -> pd.DataFrame:
+    """Stations with coords & waterType, shaped like ai_analytics.fetch_stations."""
+    return pd.read_sql_query(
+        """
+        SELECT station_id AS stationOwnerId, water_type AS waterType,
+               lat AS station_lat, lng AS station_lng, district_name AS district
+        FROM stations
+        WHERE lat IS NOT NULL AND lng IS NOT NULL AND water_type IS NOT NULL
+        """,
+        conn,
+    )
+
+def load_station_rows(conn) -> pd.DataFrame:
+    """
+    All stations with coordinates, with the same fields service.read_station_rows
+    reads from station_owners (districtName, location.latitude/longitude, waterType).
+    """
+    return pd.read_sql_query(
+        "SELECT station_id, district_id, owner_district_name AS district_name, owner_lat AS lat, "
+        "owner_lng AS lng, owner_water_type AS water_type "
+        "FROM stations WHERE owner_lat IS NOT NULL AND owner_lng IS NOT NULL",
+        conn,
+    )
+
+def customer_demand_points(conn, months: Optional[Iterable[int]] = None, status: str = "Completed") -> pd.DataFrame:
+    """
+    One row per order with customer coordinates: customer_lat, customer_lng,
+    yyyymm and refill liters (0 for orders without refill items). Restricted
+    to the given yyyymm months when months is not None.
+    """
+    month_filter, params = "", [LITERS_PER_REFILL, status]
+    if months is not None:
+        months = sorted({int(m) for m in months})
+        if not months:
+            return pd.DataFrame(columns=["customer_lat", "customer_lng", "yyyymm", "liters"])
+        ph, month_params = _in_clause(months)
+        month_filter, params = f"AND o.yyyymm IN ({ph})", params + month_params
+    return pd.read_sql_query(
+        f"""
+        SELECT o.customer_lat, o.customer_lng, o.yyyymm, COALESCE(r.units, 0) * ? AS liters
+        FROM orders o
+        LEFT JOIN (SELECT order_id, SUM(quantity) AS units
+                   FROM order_items WHERE is_refill = 1 GROUP BY order_id) r ON r.order_id = o.order_id
+        WHERE o.status = ? AND o.yyyymm IS NOT NULL
+          AND o.customer_lat IS NOT NULL AND o.customer_lng IS NOT NULL {month_filter}
+        """,
+        conn, params=params,
+    )
+
+def order_months(conn) -> List[int]:
+    """Every yyyymm month holding orders."""
+    rows = conn.execute("SELECT DISTINCT yyyymm FROM orders WHERE yyyymm IS NOT NULL").fetchall()
+    return sorted(int(r[0]) for r in rows)
+
+def dirty_months(conn) -> List[int]:
+    """yyyymm months with orders upserted (by any sync leg) since clear_dirty_months."""
+    return sorted(int(r[0]) for r in conn.execute("SELECT yyyymm FROM dirty_months"))
+
+def clear_dirty_months(conn, months: Iterable[int]):
+    with conn:
+        conn.executemany("DELETE FROM dirty_months WHERE yyyymm = ?", [(int(m),) for m in months])